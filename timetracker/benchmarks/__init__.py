@@ -0,0 +1,22 @@
+"""
+Standalone benchmarks. Run them from the timetracker directory, e.g.
+
+    python -m benchmarks.client_backfill
+
+Each one works on a scratch SQLite database of its own, never on db.sqlite3
+"""
+import os
+import tempfile
+
+
+def setup_django(db_name=None, settings_module='timetracker.settings'):
+    """
+    Configure Django against a scratch SQLite database and return its path
+    """
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.conf import settings
+    path = db_name or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    settings.DATABASES['default']['NAME'] = path
+    import django
+    django.setup()
+    return path
@@ -0,0 +1,89 @@
+"""
+Time the client backfill of migration 0003 at growing table sizes, with the
+original row by row data migration as a baseline:
+
+    python -m benchmarks.client_backfill --rows 1000 10000 100000
+
+For every size the scratch database is migrated to 0002, filled with
+projects whose client names repeat every `--projects-per-client` rows, and
+then migrated to 0003 with the row by row functions and with the batched
+ones in turn
+"""
+import argparse
+import importlib
+import time
+
+from benchmarks import setup_django
+
+
+BEFORE = [('entries', '0002_auto_20150723_0819')]
+AFTER = [('entries', '0003_create_fk_to_client')]
+
+
+def legacy_move_client_name_to_temporary_field(apps, schema_editor):
+    Project = apps.get_model("entries", "Project")
+
+    for p in Project.objects.all():
+        p.client_name = p.client
+        p.save()
+
+
+def legacy_create_clients(apps, schema_editor):
+    Client = apps.get_model("entries", "Client")
+    Project = apps.get_model("entries", "Project")
+
+    for p in Project.objects.all():
+        if p.client_name:
+            c, _ = Client.objects.get_or_create(name=p.client_name)
+            p.client = c
+            p.save()
+
+
+def fill_projects(connection, rows, projects_per_client):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM entries_entry')
+        cursor.execute('DELETE FROM entries_project')
+        cursor.executemany(
+            'INSERT INTO entries_project (name, client) VALUES (%s, %s)',
+            [('project {}'.format(i), 'client {}'.format(i // projects_per_client))
+             for i in range(rows)])
+
+
+def time_migration(connection, MigrationExecutor, rows, projects_per_client):
+    executor = MigrationExecutor(connection)
+    executor.migrate(BEFORE)
+    fill_projects(connection, rows, projects_per_client)
+    executor = MigrationExecutor(connection)
+    started = time.time()
+    executor.migrate(AFTER)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--projects-per-client', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    migration = importlib.import_module('entries.migrations.0003_create_fk_to_client').Migration
+    run_python = [op for op in migration.operations if hasattr(op, 'code')]
+    batched = [op.code for op in run_python]
+    legacy = [legacy_move_client_name_to_temporary_field, legacy_create_clients]
+
+    print('{:>10} {:>12} {:>12} {:>9}'.format('projects', 'row by row', 'batched', 'speedup'))
+    for rows in args.rows:
+        timings = []
+        for code in (legacy, batched):
+            for op, function in zip(run_python, code):
+                op.code = function
+            timings.append(time_migration(connection, MigrationExecutor, rows, args.projects_per_client))
+        print('{:>10} {:>11.2f}s {:>11.2f}s {:>8.1f}x'.format(
+            rows, timings[0], timings[1], timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    main()
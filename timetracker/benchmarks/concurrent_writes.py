@@ -0,0 +1,102 @@
+"""
+Throughput of concurrent entry POSTs with the default settings and with the
+production profile of settings_production.py:
+
+    python -m benchmarks.concurrent_writes --workers 8 --requests 200
+
+Every worker process posts `--requests` entries to /entries/ through the
+whole middleware and view stack, as fast as it can, while the others do the
+same against the same database file. Failed requests, mostly "database is
+locked", are counted rather than retried
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import setup_django
+
+
+PROFILES = (
+    ('default', 'timetracker.settings'),
+    ('production', 'timetracker.settings_production'),
+)
+
+
+def prepare(path, settings_module):
+    """
+    Migrate a fresh database and return the id of a project to post entries to
+    """
+    setup_django(path, settings_module)
+    from django.core.management import call_command
+    from entries.models import Project
+
+    call_command('migrate', verbosity=0, interactive=False)
+    return Project.objects.create(name='Benchmark').pk
+
+
+def post_entries(path, settings_module, worker, count, project_id):
+    setup_django(path, settings_module)
+    from django.conf import settings
+    from django.db import DatabaseError
+    from django.test import Client
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    client = Client()
+    # Entries must not overlap, so every request gets its own minute
+    base = datetime(2015, 1, 1) + timedelta(minutes=worker * count * 2)
+    succeeded = failed = 0
+    started = time.time()
+    for i in range(count):
+        start = base + timedelta(minutes=i * 2)
+        data = {
+            'start': start.strftime('%Y-%m-%d %H:%M'),
+            'stop': (start + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M'),
+            'project': project_id,
+            'description': 'worker {} entry {}'.format(worker, i),
+        }
+        try:
+            response = client.post('/entries/', data)
+        except DatabaseError:
+            failed += 1
+            continue
+        if response.status_code == 302:
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed, time.time() - started
+
+
+def run(settings_module, workers, requests):
+    path = os.path.join(tempfile.mkdtemp(), 'concurrent.sqlite3')
+    # Spawned processes so no worker inherits a connection or Django setup
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        project_id = pool.apply(prepare, (path, settings_module))
+    with context.Pool(workers) as pool:
+        started = time.time()
+        results = pool.starmap(post_entries, [
+            (path, settings_module, worker, requests, project_id) for worker in range(workers)])
+        elapsed = time.time() - started
+    succeeded = sum(result[0] for result in results)
+    failed = sum(result[1] for result in results)
+    return succeeded, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Entries posted per worker')
+    args = parser.parse_args()
+
+    print('{:<12} {:>10} {:>8} {:>9} {:>12}'.format('profile', 'succeeded', 'failed', 'seconds', 'requests/s'))
+    for name, settings_module in PROFILES:
+        succeeded, failed, elapsed = run(settings_module, args.workers, args.requests)
+        print('{:<12} {:>10} {:>8} {:>9.2f} {:>12.1f}'.format(
+            name, succeeded, failed, elapsed, succeeded / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Time every page in entries/urls.py and count its queries at growing dataset
+sizes:
+
+    python -m benchmarks.views --entries 1000 10000 100000 --output today.json
+
+The scratch database is migrated and filled with generate_dataset's
+generator, then topped up to each size in turn. Every page is requested
+`--repeat` times with an empty cache, which is what a visitor gets after a
+change, and once more with the cache filled by the previous request. Pass a
+file written by --output as --baseline to flag the pages that got slower or
+run more queries
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks import setup_django
+
+
+# Query string parameters for pages that need some to do real work
+PARAMS = {
+    'entry-search': {'q': 'fix'},
+}
+
+# Pages that only answer POST, or stream for minutes
+SKIP = ('entry-export-job', 'timer-batch', 'running-events')
+
+
+def page_urls(urlpatterns, client_id, project_id):
+    """
+    Yield (name, path) for every named pattern, filling in the first client
+    or project for their detail pages and skipping other detail pages
+    """
+    from django.core.urlresolvers import reverse
+
+    values = {'pk': None, 'format': 'csv'}
+    for pattern in urlpatterns:
+        if pattern.name in SKIP:
+            continue
+        kwargs = {}
+        for group in pattern.regex.groupindex:
+            if group not in values:
+                raise ValueError('No benchmark value for the {} argument of {}'.format(group, pattern.name))
+            kwargs[group] = values[group]
+        if 'pk' in kwargs:
+            if 'client' in pattern.name:
+                kwargs['pk'] = client_id
+            elif 'project' in pattern.name:
+                kwargs['pk'] = project_id
+            else:
+                continue
+        yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+
+def request(client, path, params, connection, CaptureQueriesContext):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.time()
+        response = client.get(path, params)
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+        elapsed = time.time() - started
+    if response.status_code >= 400:
+        raise RuntimeError('{} answered {}'.format(path, response.status_code))
+    return elapsed, len(queries)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with the results of an earlier --output')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help='Flag pages more than this fraction slower than the baseline')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    from entries.dataset import DatasetGenerator
+    from entries.models import Entry
+    from entries.urls import urlpatterns
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    call_command('migrate', verbosity=0, interactive=False)
+    generator = DatasetGenerator(seed=args.seed, batch_size=5000)
+    client_ids = generator.create_clients(args.clients)
+    project_ids = generator.create_projects(args.projects, client_ids)
+    client = Client()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for size in sorted(args.entries):
+        generator.create_entries(project_ids, size - Entry.objects.filter(stop__isnull=False).count(),
+                                 days=args.days, running=0 if results else 5)
+        generator.finish()
+        results[str(size)] = pages = {}
+        print('\n{} entries'.format(size))
+        print('{:<18} {:<28} {:>9} {:>8} {:>9} {:>8}'.format(
+            'page', 'path', 'cold ms', 'queries', 'warm ms', 'queries'))
+        for name, path in page_urls(urlpatterns, client_ids[0], project_ids[0]):
+            params = PARAMS.get(name, {})
+            cold = []
+            for i in range(args.repeat):
+                cache.clear()
+                cold.append(request(client, path, params, connection, CaptureQueriesContext))
+            warm = request(client, path, params, connection, CaptureQueriesContext)
+            pages[name] = result = {
+                'path': path,
+                'cold_ms': median([elapsed for elapsed, count in cold]) * 1000,
+                'cold_queries': cold[-1][1],
+                'warm_ms': warm[0] * 1000,
+                'warm_queries': warm[1],
+            }
+            flag = ''
+            before = baseline.get(str(size), {}).get(name)
+            if before and (result['cold_ms'] > before['cold_ms'] * (1 + args.tolerance) or
+                           result['cold_queries'] > before['cold_queries']):
+                flag = '  <- was {:.1f} ms, {} queries'.format(before['cold_ms'], before['cold_queries'])
+                regressions.append((size, name))
+            print('{:<18} {:<28} {:>9.1f} {:>8} {:>9.1f} {:>8}{}'.format(
+                name, path, result['cold_ms'], result['cold_queries'],
+                result['warm_ms'], result['warm_queries'], flag))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if regressions:
+        print('\n{} regressions against {}'.format(len(regressions), args.baseline))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
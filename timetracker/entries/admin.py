@@ -1,14 +1,100 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.utils import timezone
 
 # Register your models here.
-from . import models
+from . import models, search
+from .pagination import EstimatedCountPaginator
+
+
+class RecentlyActiveFilter(admin.SimpleListFilter):
+    """
+    Filter by project or client offering only those active in the last
+    `active_days` days as choices. A RelatedFieldListFilter would load every
+    project (and, through Project.__str__, its client) into memory on every
+    changelist load. The choices come from the daily rollups, so they are
+    cheap to find; any other id still works as a query string parameter
+    """
+    active_days = 30
+    related_field = None
+
+    def lookups(self, request, model_admin):
+        since = timezone.localtime(timezone.now()).date() - timedelta(days=self.active_days)
+        return models.DailyRollup.objects.filter(
+            day__gte=since,
+            **{self.related_field + '__isnull': False}
+        ).values_list(
+            self.related_field, self.related_field + '__name',
+        ).order_by(self.related_field + '__name').distinct()
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(**{self.related_field: value})
+        return queryset
+
+
+class ProjectFilter(RecentlyActiveFilter):
+    title = 'project'
+    parameter_name = 'project'
+    related_field = 'project'
+
+
+class ClientFilter(RecentlyActiveFilter):
+    title = 'client'
+    parameter_name = 'client'
+    related_field = 'project__client'
+
 
 class EntryAdmin(admin.ModelAdmin):
-    list_display = ('project', 'description', 'start', 'stop')
-    list_filter = ('project',)
-    search_fields = ('project', 'description',)
+    list_display = ('description', 'project_name', 'client_name', 'start', 'stop')
+    list_select_related = ('project__client',)
+    # The date filter's choices (today, past 7 days, ...) are fixed and
+    # filter a start range on the (start, id) index. A date_hierarchy would
+    # run a DISTINCT over the dates of the whole table on every page load
+    list_filter = ('start', ClientFilter, ProjectFilter)
+    search_fields = ('description', 'project__name', 'project__client__name')
+    ordering = ('-start', '-id')
+    paginator = EstimatedCountPaginator
+    # Don't count the whole table on top of the filtered result
+    show_full_result_count = False
+    # Don't render every project into the change form's select box
+    raw_id_fields = ('project',)
+
+    def get_search_fields(self, request):
+        # With the full text index descriptions are searched in
+        # get_search_results instead of with a LIKE '%term%' scan
+        if search.is_available():
+            return ('project__name', 'project__client__name')
+        return self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        results, use_distinct = super(EntryAdmin, self).get_search_results(
+            request, queryset, search_term)
+        if search_term and search.is_available():
+            results = results | search.filter_matching(queryset, search_term)
+        return results, use_distinct
+
+    def project_name(self, entry):
+        return entry.project.name
+    project_name.short_description = 'project'
+    project_name.admin_order_field = 'project__name'
+
+    def client_name(self, entry):
+        return entry.project.client and entry.project.client.name
+    client_name.short_description = 'client'
+    client_name.admin_order_field = 'project__client__name'
+
+
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'project', 'hours', 'entry_count')
+    list_select_related = ('project__client',)
+    date_hierarchy = 'day'
+    readonly_fields = ('project', 'day', 'seconds', 'entry_count')
 
 
 admin.site.register(models.Client)
+admin.site.register(models.DailyRollup, DailyRollupAdmin)
 admin.site.register(models.Entry, EntryAdmin)
 admin.site.register(models.Project)
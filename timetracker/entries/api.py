@@ -0,0 +1,282 @@
+"""
+JSON API for clients, projects and entries, for integrations:
+
+    GET    /api/<resource>/?fields=id,name&after=<cursor>&limit=100
+    POST   /api/<resource>/
+    GET    /api/<resource>/<id>/?fields=id,name
+    PUT    /api/<resource>/<id>/   all fields
+    PATCH  /api/<resource>/<id>/   only the fields to change
+    DELETE /api/<resource>/<id>/
+
+Lists are walked by keyset on the id, `limit` rows per page, with the
+cursor of the next page in "next". ?fields= picks the fields returned, the
+id is always included. Writes take a JSON object and are validated by the
+same forms as the HTML pages; date and times are ISO 8601.
+
+Integrations authenticate their writes with an API key, see auth.py.
+
+ETag and Last-Modified are computed from the ids and updated_at times of
+the rows, which a narrow indexed query fetches without loading or
+serializing the rows, so a 304 costs that query only. If-Match makes a
+write fail with 412 when the row changed since it was read
+"""
+import base64
+import hashlib
+import json
+
+from django import forms
+from django.core.urlresolvers import reverse
+from django.db.models import Max
+from django.forms.models import model_to_dict
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.views.decorators.http import condition
+from django.views.generic import View
+
+from .auth import api_view
+from .forms import ClientForm, EntryForm, ProjectForm
+from .models import Client, Entry, Project, Tombstone
+from .timers import parse_time
+
+
+PAGE_SIZE = 100
+
+MAX_PAGE_SIZE = 1000
+
+
+class Resource(object):
+    """
+    How a model is exposed: the fields it returns, the form validating
+    writes and the query string filters its list accepts
+    """
+    def __init__(self, name, model, form_class, fields, filters=(), datetime_fields=()):
+        self.name = name
+        self.model = model
+        self.form_class = form_class
+        self.fields = fields
+        self.filters = filters
+        self.datetime_fields = datetime_fields
+
+    def url(self, pk=None):
+        if pk is None:
+            return reverse('api-{}-list'.format(self.name))
+        return reverse('api-{}-detail'.format(self.name), kwargs={'pk': pk})
+
+
+CLIENTS = Resource('client', Client, ClientForm, ('id', 'name', 'updated_at'))
+
+PROJECTS = Resource(
+    'project', Project, ProjectForm, ('id', 'name', 'client', 'updated_at'), filters=('client',))
+
+ENTRIES = Resource(
+    'entry', Entry, EntryForm,
+    ('id', 'project', 'start', 'stop', 'description', 'duration', 'updated_at'),
+    filters=('project',), datetime_fields=('start', 'stop'))
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+class BadRequest(Exception):
+    """
+    Turned into a 400 response with the given errors by ResourceView
+    """
+    def __init__(self, errors):
+        super(BadRequest, self).__init__(errors)
+        self.errors = errors
+
+
+class ResourceView(View):
+    """
+    Common parts of the list and detail views. dispatch() runs the view
+    through Django's condition decorator with the etag() and
+    last_modified() of the subclass
+    """
+    resource = None
+
+    @method_decorator(api_view)
+    def dispatch(self, request, *args, **kwargs):
+        view = condition(etag_func=self.etag, last_modified_func=self.last_modified)(
+            super(ResourceView, self).dispatch)
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({'errors': e.errors}, status=400)
+
+    def get_fields(self):
+        """
+        The fields of ?fields=, in the resource's order
+        """
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return self.resource.fields
+        requested = set(requested.split(','))
+        unknown = requested - set(self.resource.fields)
+        if unknown:
+            raise BadRequest({'fields': ['Unknown fields: {}'.format(', '.join(sorted(unknown)))]})
+        return tuple(name for name in self.resource.fields if name == 'id' or name in requested)
+
+    def rows(self, queryset):
+        return list(queryset.order_by('id').values(*self.get_fields()))
+
+    def form_data(self, initial=None):
+        """
+        The JSON object of the request body as form data, on top of `initial`
+        """
+        try:
+            body = json.loads(self.request.body.decode('utf-8'))
+        except ValueError:
+            raise BadRequest({'__all__': ['The body must be JSON']})
+        if not isinstance(body, dict):
+            raise BadRequest({'__all__': ['The body must be a JSON object']})
+        data = dict(initial or {})
+        data.update(body)
+        for name in self.resource.datetime_fields:
+            if isinstance(data.get(name), str):
+                try:
+                    data[name] = parse_time(data[name], None)
+                except forms.ValidationError as e:
+                    raise BadRequest({name: e.messages})
+        return data
+
+    def saved_response(self, form, status=200):
+        if not form.is_valid():
+            errors = dict(
+                (name, [' '.join(error.messages) for error in field_errors])
+                for name, field_errors in form.errors.as_data().items())
+            return JsonResponse({'errors': errors}, status=400)
+        obj = form.save()
+        row = self.rows(self.resource.model.objects.filter(pk=obj.pk))[0]
+        response = JsonResponse(row, status=status)
+        response['ETag'] = '"{}"'.format(make_etag(obj.pk, row['updated_at'], self.get_fields()))
+        return response
+
+
+class ResourceListView(ResourceView):
+
+    def get_queryset(self):
+        queryset = self.resource.model.objects.all()
+        for name in self.resource.filters:
+            value = self.request.GET.get(name)
+            if value is not None:
+                if not value.isdigit():
+                    raise BadRequest({name: ['Must be an id']})
+                queryset = queryset.filter(**{name: value})
+        return queryset
+
+    def page(self):
+        """
+        The (id, updated_at) of the rows on the requested page and the page
+        size, fetched once per request
+        """
+        if hasattr(self, '_page'):
+            return self._page
+        queryset = self.get_queryset()
+        try:
+            limit = min(int(self.request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            raise BadRequest({'limit': ['Must be a positive number']})
+        after = self.request.GET.get('after')
+        if after:
+            try:
+                queryset = queryset.filter(pk__gt=decode_cursor(after))
+            except ValueError as e:
+                raise BadRequest({'after': [str(e)]})
+        keys = list(queryset.order_by('id').values_list('id', 'updated_at')[:limit])
+        self._page = keys, limit
+        return self._page
+
+    def etag(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # Any change, addition or deletion of a row on the page changes it
+        return make_etag(self.page()[0], self.get_fields())
+
+    def last_modified(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        times = [updated_at for pk, updated_at in self.page()[0]]
+        deleted = Tombstone.objects.filter(model=self.resource.model._meta.model_name).aggregate(
+            last=Max('deleted_at'))['last']
+        if deleted:
+            times.append(deleted)
+        return max(times) if times else None
+
+    def get(self, request, *args, **kwargs):
+        keys, limit = self.page()
+        rows = self.rows(self.resource.model.objects.filter(pk__in=[pk for pk, updated_at in keys]))
+        next_url = None
+        if len(keys) == limit:
+            params = request.GET.copy()
+            params['after'] = encode_cursor(keys[-1][0])
+            next_url = '{}?{}'.format(request.path, urlencode(sorted(params.items())))
+        return JsonResponse({'results': rows, 'next': next_url})
+
+    def post(self, request, *args, **kwargs):
+        response = self.saved_response(self.resource.form_class(self.form_data()), status=201)
+        if response.status_code == 201:
+            response['Location'] = self.resource.url(json.loads(response.content.decode('utf-8'))['id'])
+        return response
+
+
+class ResourceDetailView(ResourceView):
+    http_method_names = ['get', 'head', 'put', 'patch', 'delete', 'options']
+
+    def updated_at(self, pk):
+        """
+        The updated_at of the row, fetched once per request
+        """
+        if not hasattr(self, '_updated_at'):
+            self._updated_at = self.resource.model.objects.filter(pk=pk).values_list(
+                'updated_at', flat=True).first()
+        return self._updated_at
+
+    def etag(self, request, pk):
+        updated_at = self.updated_at(pk)
+        if updated_at is None:
+            return None
+        return make_etag(int(pk), updated_at, self.get_fields())
+
+    def last_modified(self, request, pk):
+        return self.updated_at(pk)
+
+    def get_object(self, pk):
+        try:
+            return self.resource.model.objects.get(pk=pk)
+        except self.resource.model.DoesNotExist:
+            raise Http404('No {} with id {}'.format(self.resource.name, pk))
+
+    def get(self, request, pk):
+        rows = self.rows(self.resource.model.objects.filter(pk=pk))
+        if not rows:
+            raise Http404('No {} with id {}'.format(self.resource.name, pk))
+        return JsonResponse(rows[0])
+
+    def put(self, request, pk):
+        obj = self.get_object(pk)
+        return self.saved_response(self.resource.form_class(self.form_data(), instance=obj))
+
+    def patch(self, request, pk):
+        obj = self.get_object(pk)
+        form_class = self.resource.form_class
+        initial = model_to_dict(obj, fields=form_class._meta.fields)
+        return self.saved_response(form_class(self.form_data(initial), instance=obj))
+
+    def delete(self, request, pk):
+        self.get_object(pk).delete()
+        return HttpResponse(status=204)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class EntriesConfig(AppConfig):
+    name = 'entries'
+
+    def ready(self):
+        # Connect the signal handlers
+        from . import signals  # NOQA
+        # Register the background job tasks
+        from . import tasks  # NOQA
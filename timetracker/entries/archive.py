@@ -0,0 +1,55 @@
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+
+from . import search
+from .caching import bump_generation
+from .models import ArchivedEntry, Entry
+
+
+ARCHIVED_FIELDS = ('id', 'start', 'stop', 'project_id', 'description', 'duration')
+
+
+def archive_batch(ids):
+    """
+    Move the given entries into the archive table with one INSERT ... SELECT
+    and one DELETE, in a transaction. The rows never pass through Python and
+    no signals are sent, so the daily rollups, which count archived entries
+    too, stay as they are
+    """
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(column) for column in ARCHIVED_FIELDS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {archive} ({columns}) SELECT {columns} FROM {table} WHERE {id} IN ({ids})'.format(
+                archive=quote_name(ArchivedEntry._meta.db_table), table=quote_name(Entry._meta.db_table),
+                columns=columns, id=quote_name('id'), ids=placeholders), ids)
+        cursor.execute('DELETE FROM {table} WHERE {id} IN ({ids})'.format(
+            table=quote_name(Entry._meta.db_table), id=quote_name('id'), ids=placeholders), ids)
+        search.unindex_entries(ids)
+
+
+def archive_entries(cutoff, batch_size=1000, stdout=None):
+    """
+    Move every entry that finished before `cutoff` into the archive, at
+    most `batch_size` entries per transaction, oldest first. Returns the
+    number of entries archived
+    """
+    # Entries that stopped before the cutoff started before it as well, so
+    # every batch is a range scan at the start of the (start, id) index
+    # Read from the primary: a lagging replica would hand out moved ids again
+    candidates = Entry.objects.using(DEFAULT_DB_ALIAS).filter(start__lt=cutoff, stop__lt=cutoff).order_by('start', 'id')
+    # Every id of a batch is a query parameter, keep within what the
+    # backend takes, such as SQLite's 999
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(['id'], range(batch_size)))
+    count = 0
+    while True:
+        ids = list(candidates.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        archive_batch(ids)
+        count += len(ids)
+        if stdout:
+            stdout.write('Archived {} entries'.format(count))
+    if count:
+        bump_generation(Entry)
+    return count
@@ -0,0 +1,62 @@
+"""
+Authentication of the JSON endpoints written to by integrations and
+devices, such as kiosks starting and stopping timers. They send
+
+    Authorization: Token <key>
+
+with one of the keys in settings.API_KEYS. Such a request carries no
+cookies, so it can't be forged by another site and skips the CSRF check.
+
+A request without the header is treated like a form post from the site's
+own pages: reads are open like the HTML pages, writes need the CSRF token
+in the X-CSRFToken header
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+
+from .middleware import SAFE_METHODS
+
+
+def api_key(request):
+    """
+    The key of the Authorization header, None without one
+    """
+    header = request.META.get('HTTP_AUTHORIZATION')
+    if header is None:
+        return None
+    scheme, _, key = header.partition(' ')
+    return key.strip() if scheme.lower() == 'token' else ''
+
+
+def valid_api_key(key):
+    # Compare with every key so the time taken doesn't tell which one was close
+    return bool(key) and sum(constant_time_compare(key, valid) for valid in settings.API_KEYS) > 0
+
+
+def api_view(view):
+    """
+    Decorate a view with the authentication above, in place of the CSRF
+    middleware
+    """
+    @csrf_exempt
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        key = api_key(request)
+        if key is not None:
+            if not valid_api_key(key):
+                response = JsonResponse({'error': 'Invalid API key'}, status=401)
+                response['WWW-Authenticate'] = 'Token'
+                return response
+        elif request.method not in SAFE_METHODS:
+            rejected = CsrfViewMiddleware().process_view(request, None, (), {})
+            if rejected is not None:
+                return JsonResponse({
+                    'error': 'Send "Authorization: Token <key>", or the CSRF token in X-CSRFToken',
+                }, status=403)
+        return view(request, *args, **kwargs)
+    return wrapped
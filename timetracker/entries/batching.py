@@ -0,0 +1,36 @@
+"""
+Walk whole tables in bounded batches, for the exports, the search index
+and the rollups. Data migrations keep their own copies of such helpers,
+see migration 0003, so changes here don't alter what an old migration does
+"""
+
+
+def _row_pk(row):
+    if hasattr(row, 'pk'):
+        return row.pk
+    if isinstance(row, dict):
+        return row['pk'] if 'pk' in row else row['id']
+    if isinstance(row, (tuple, list)):
+        return row[0]
+    return row
+
+
+def chunked(queryset, batch_size=1000):
+    """
+    Yield the rows of the queryset as lists of at most `batch_size`, walking
+    the primary key index instead of using OFFSET, so every batch costs the
+    same and at most one batch is in memory.
+
+    Works with model instances and with values() and values_list() querysets
+    as long as their first field (or 'pk'/'id' key) is the primary key
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+        last_pk = _row_pk(batch[-1])
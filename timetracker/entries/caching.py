@@ -0,0 +1,71 @@
+import time
+
+from django.core.cache import cache
+
+
+# Cached list fragments expire after this many seconds even without a change.
+# Shared cache backends see every bump straight away, but a per-process cache
+# such as locmem only sees the bumps made by its own process
+LIST_CACHE_TIMEOUT = 600
+
+
+def generation_key(model):
+    return 'entries:generation:{}.{}'.format(model._meta.app_label, model._meta.model_name)
+
+
+def new_generation():
+    # Start from the clock rather than 1 so that a counter that was evicted
+    # from the cache can't come back with a number that was used before
+    return int(time.time() * 1000)
+
+
+def get_generation(model):
+    """
+    Return the model's generation counter, which changes whenever one of its
+    objects is saved or deleted
+    """
+    key = generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(model):
+    """
+    Invalidate everything cached under the model's current generation
+    """
+    # Not cache.incr(): the base implementation behind the locmem and file
+    # based backends re-sets the key with the default timeout. Two processes
+    # bumping at once may both write the same number, but it's a new one
+    key = generation_key(model)
+    generation = cache.get(key) or 0
+    cache.set(key, max(generation + 1, new_generation()), None)
+
+
+def get_version(models):
+    """
+    A version string for data that depends on all of the given models
+    """
+    return '-'.join(str(get_generation(model)) for model in models)
+
+
+class CachedListMixin(object):
+    """
+    Let the template cache the rendered object list of a view.
+
+    The context gets a `list_cache_version` made from the generation counters
+    of `list_cache_models`, bumped by the post_save and post_delete handlers
+    in signals.py. Templates use it as a {% cache %} vary-on argument, so a
+    cached fragment is served until one of the models changes; the list's
+    queryset, being lazy, isn't even evaluated
+    """
+    list_cache_models = ()
+    list_cache_timeout = LIST_CACHE_TIMEOUT
+
+    def get_context_data(self, **kwargs):
+        context = super(CachedListMixin, self).get_context_data(**kwargs)
+        context['list_cache_version'] = get_version(self.list_cache_models)
+        context['list_cache_timeout'] = self.list_cache_timeout
+        return context
@@ -0,0 +1,66 @@
+from django import forms
+from django.core.cache import cache
+
+
+# Cache keys of the choice lists, deleted by the signal handlers in signals.py
+PROJECT_CHOICES_KEY = 'entries:choices:project'
+CLIENT_CHOICES_KEY = 'entries:choices:client'
+
+# Signals only invalidate the cache of the process that saved the object, so
+# with a per-process cache such as locmem other workers can serve stale labels
+# until the choices expire. Shared backends are invalidated immediately
+CHOICES_CACHE_TIMEOUT = 300
+
+
+def invalidate_choices(*keys):
+    cache.delete_many(keys)
+
+
+class CachedModelChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    Yield the (pk, label) choices stored in the cache, building them from the
+    queryset only when the cache is cold
+    """
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for choice in self.field.cached_choices():
+            yield choice
+
+    def __len__(self):
+        return (len(self.field.cached_choices()) +
+            (1 if self.field.empty_label is not None else 0))
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField whose rendered choices are shared between requests
+    through Django's cache.
+
+    Rendering a plain ModelChoiceField runs its queryset on every request,
+    and any related object its labels use costs one more query per choice.
+    Here the labels are built once, stored under `cache_key` and served from
+    the cache until a signal handler invalidates the key. Validation still
+    looks the submitted value up in the queryset so a stale cache can never
+    let an invalid choice through
+    """
+    def __init__(self, queryset, cache_key, *args, **kwargs):
+        self.cache_key = cache_key
+        super(CachedModelChoiceField, self).__init__(queryset, *args, **kwargs)
+
+    def cached_choices(self):
+        choices = cache.get(self.cache_key)
+        if choices is None:
+            choices = [
+                (self.prepare_value(obj), self.label_from_instance(obj))
+                for obj in self.queryset.iterator()
+            ]
+            cache.set(self.cache_key, choices, CHOICES_CACHE_TIMEOUT)
+        return choices
+
+    def _get_choices(self):
+        if hasattr(self, '_choices'):
+            return self._choices
+        return CachedModelChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
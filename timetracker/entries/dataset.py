@@ -0,0 +1,181 @@
+"""
+Build large, realistic datasets for load testing and benchmarks, see the
+generate_dataset management command and benchmarks/views.py
+"""
+import bisect
+import math
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import rollups, search
+from .caching import bump_generation
+from .choices import CLIENT_CHOICES_KEY, PROJECT_CHOICES_KEY, invalidate_choices
+from .forms import start_of_day
+from .models import Client, Entry, Project
+
+
+VERBS = ('Fix', 'Review', 'Refactor', 'Test', 'Deploy', 'Design', 'Document', 'Plan', 'Debug', 'Discuss')
+NOUNS = (
+    'login form', 'invoice export', 'search page', 'API client', 'database migration',
+    'release notes', 'payment flow', 'admin dashboard', 'email templates', 'build pipeline',
+    'onboarding', 'caching layer', 'report layout', 'mobile menu', 'sprint backlog')
+
+# Entries per person and working day are roughly 8 hours over the median
+# entry length, see entry_seconds()
+MEDIAN_ENTRY_SECONDS = 45 * 60
+ENTRIES_PER_DAY = 8
+
+
+class DatasetGenerator(object):
+    """
+    Insert clients, projects and entries with bulk_create, `batch_size`
+    entries per transaction.
+
+    Entries follow working days: each simulated person starts around 9:00,
+    logs entries of log-normally distributed length with short breaks in
+    between until the evening and mostly takes weekends off. Some projects
+    are much busier than others. Entries of one person never overlap, those
+    of different people do, like a team sharing the tracker. Pass a `seed`
+    to get the same dataset every time
+    """
+
+    def __init__(self, seed=None, batch_size=1000):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+
+    def bulk_create(self, model, objs):
+        """
+        Insert the objects and return their new ids. bulk_create doesn't set
+        primary keys on every backend, but the new rows are the ones after
+        the current last id
+        """
+        with transaction.atomic():
+            last_pk = model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+            model.objects.bulk_create(objs)
+        return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+    def create_clients(self, count):
+        return self.bulk_create(Client, [Client(name='Client {}'.format(i + 1)) for i in range(count)])
+
+    def create_projects(self, count, client_ids):
+        """
+        Spread `count` projects over the clients; about one in ten has none
+        """
+        projects = []
+        for i in range(count):
+            client_id = None
+            if client_ids and self.random.random() >= 0.1:
+                client_id = self.random.choice(client_ids)
+            projects.append(Project(name='Project {}'.format(i + 1), client_id=client_id))
+        return self.bulk_create(Project, projects)
+
+    def project_picker(self, project_ids):
+        """
+        Return a function picking a project id, the k-th busiest project
+        k times less often than the busiest one
+        """
+        project_ids = list(project_ids)
+        self.random.shuffle(project_ids)
+        cumulative = []
+        total = 0.0
+        for rank in range(len(project_ids)):
+            total += 1.0 / (rank + 1)
+            cumulative.append(total)
+
+        def pick():
+            return project_ids[bisect.bisect(cumulative, self.random.random() * total)]
+        return pick
+
+    def entry_seconds(self):
+        seconds = self.random.lognormvariate(math.log(MEDIAN_ENTRY_SECONDS), 0.8)
+        return min(max(seconds, 5 * 60), 4 * 3600)
+
+    def working_day(self, day_start, pick_project):
+        """
+        Yield the (start, stop, project id) of one person's entries on a day
+        """
+        start = day_start + timedelta(hours=self.random.normalvariate(9, 0.75))
+        end_of_day = day_start + timedelta(hours=self.random.normalvariate(17.5, 1))
+        while start < end_of_day:
+            stop = start + timedelta(seconds=self.entry_seconds())
+            yield start, stop, pick_project()
+            start = stop + timedelta(seconds=self.random.expovariate(1.0 / (10 * 60)))
+
+    def entries(self, project_ids, count, days):
+        """
+        Yield `count` unsaved finished entries over the `days` days before
+        today, oldest first
+        """
+        if not project_ids or count <= 0:
+            return
+        today = timezone.localtime(timezone.now()).date()
+        day_list = [today - timedelta(days=days - i) for i in range(days)]
+        pick_project = self.project_picker(project_ids)
+        people = max(1, int(math.ceil(float(count) / (days * ENTRIES_PER_DAY))))
+        remaining = count
+        # Usually a single pass, more if the people happened to work too little
+        while remaining > 0:
+            for day in day_list:
+                day_start = start_of_day(day)
+                for person in range(people):
+                    if day.weekday() >= 5 and self.random.random() >= 0.05:
+                        continue
+                    for start, stop, project_id in self.working_day(day_start, pick_project):
+                        yield Entry(
+                            project_id=project_id, start=start, stop=stop,
+                            description='{} {}'.format(self.random.choice(VERBS), self.random.choice(NOUNS)),
+                            duration=(stop - start).total_seconds())
+                        remaining -= 1
+                        if remaining == 0:
+                            return
+
+    def running_entries(self, project_ids, count):
+        """
+        `count` unsaved entries whose timers were started earlier today
+        """
+        now = timezone.now()
+        pick_project = self.project_picker(project_ids)
+        return [
+            Entry(project_id=pick_project(), start=now - timedelta(minutes=self.random.randint(1, 240)),
+                  description='{} {}'.format(self.random.choice(VERBS), self.random.choice(NOUNS)))
+            for i in range(count if project_ids else 0)
+        ]
+
+    def create_entries(self, project_ids, count, days=365, running=0, stdout=None):
+        """
+        Insert `count` finished and `running` running entries. Returns the
+        number of entries created
+        """
+        created = 0
+        batch = []
+        for entry in self.entries(project_ids, count, days):
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                created += self.save_entries(batch)
+                batch = []
+                if stdout:
+                    stdout.write('Created {} entries'.format(created))
+        batch.extend(self.running_entries(project_ids, running))
+        created += self.save_entries(batch)
+        return created
+
+    def save_entries(self, batch):
+        with transaction.atomic():
+            # Without a batch_size Django splits the INSERT to fit the backend
+            Entry.objects.bulk_create(batch)
+        return len(batch)
+
+    def finish(self):
+        """
+        Bring the daily rollups, the search index and the caches up to date
+        with the rows bulk_create inserted without sending signals
+        """
+        rollups.rebuild(batch_size=self.batch_size)
+        search.rebuild(batch_size=self.batch_size)
+        invalidate_choices(CLIENT_CHOICES_KEY, PROJECT_CHOICES_KEY)
+        for model in (Client, Project, Entry):
+            bump_generation(model)
@@ -0,0 +1,78 @@
+import csv
+import json
+
+from django.utils import timezone
+
+from .batching import chunked
+from .importer import COLUMNS
+
+
+# Number of entries fetched per query while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FIELDS = ('pk', 'project__client__name', 'project__name', 'start', 'stop', 'description')
+
+
+def iter_rows(queryset, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the export fields of every entry in the queryset as tuples.
+
+    QuerySet.iterator() doesn't bound memory here: the SQLite backend can't
+    do chunked reads and Django 1.8's PostgreSQL backend has no server side
+    cursors, so both fetch the whole result into memory. Instead walk the
+    table in primary key order, `batch_size` rows per query, which keeps
+    memory flat and every query an index range scan
+    """
+    for batch in chunked(queryset.values_list(*EXPORT_FIELDS), batch_size):
+        for row in batch:
+            yield row
+
+
+def format_datetime(value):
+    # Same format EntryForm and the importer parse, so exports re-import
+    if value is None:
+        return ''
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Echo(object):
+    """
+    File-like object for csv.writer that hands back what is written to it
+    instead of buffering it
+    """
+    def write(self, value):
+        return value
+
+
+def iter_all_rows(querysets):
+    for queryset in querysets:
+        for row in iter_rows(queryset):
+            yield row
+
+
+def csv_lines(*querysets):
+    """
+    Yield the entries of the querysets, one after the other, as CSV lines
+    with the columns the importer expects
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for pk, client, project, start, stop, description in iter_all_rows(querysets):
+        yield writer.writerow(
+            (client or '', project, format_datetime(start), format_datetime(stop), description))
+
+
+def json_lines(*querysets):
+    """
+    Yield the entries of the querysets, one after the other, as newline
+    delimited JSON objects
+    """
+    for pk, client, project, start, stop, description in iter_all_rows(querysets):
+        yield json.dumps({
+            'id': pk,
+            'client': client,
+            'project': project,
+            'start': start.isoformat(),
+            'stop': stop and stop.isoformat(),
+            'description': description,
+        }) + '\n'
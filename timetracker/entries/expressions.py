@@ -0,0 +1,35 @@
+from django.db.models import FloatField, Func
+
+
+class SecondsBetween(Func):
+    """
+    Number of seconds from the `start` to the `stop` datetime expression,
+    computed by the database so aggregates never need to load entry rows.
+    NULL if either side is NULL, which aggregates such as Sum skip over
+    """
+    templates = {
+        'sqlite': '((julianday({stop}) - julianday({start})) * 86400.0)',
+        'postgresql': 'EXTRACT(EPOCH FROM ({stop} - {start}))',
+        'mysql': '(TIMESTAMPDIFF(MICROSECOND, {start}, {stop}) / 1000000.0)',
+        'oracle': '(CAST({stop} AS DATE) - CAST({start} AS DATE)) * 86400',
+    }
+
+    def __init__(self, start, stop, **extra):
+        extra.setdefault('output_field', FloatField())
+        super(SecondsBetween, self).__init__(start, stop, **extra)
+
+    def as_sql(self, compiler, connection):
+        connection.ops.check_expression_support(self)
+        start_sql, start_params = compiler.compile(self.source_expressions[0])
+        stop_sql, stop_params = compiler.compile(self.source_expressions[1])
+        try:
+            template = self.templates[connection.vendor]
+        except KeyError:
+            raise NotImplementedError(
+                'SecondsBetween is not supported on {}'.format(connection.vendor))
+        # Both placeholders are positional in the SQL, so order params to match
+        if template.index('{start}') < template.index('{stop}'):
+            params = list(start_params) + list(stop_params)
+        else:
+            params = list(stop_params) + list(start_params)
+        return template.format(start=start_sql, stop=stop_sql), params
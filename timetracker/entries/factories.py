@@ -23,11 +23,10 @@ class ProjectFactory(factory.django.DjangoModelFactory):
 class EntryFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Entry
-        exclude = ('start_time', 'stop_time')
 
-    start_time = timezone.now()
-    stop_time = start_time + timedelta(hours=1)
-    start = timezone.now()
-    stop = start + timedelta(hours=1)
+    # Evaluated per entry, not once at import time, and the stop follows a
+    # start that is passed in. For large datasets use generate_dataset
+    start = factory.LazyAttribute(lambda entry: timezone.now())
+    stop = factory.LazyAttribute(lambda entry: entry.start + timedelta(hours=1))
     project = factory.SubFactory(ProjectFactory)
     description = "changed line endings"
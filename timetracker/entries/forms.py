@@ -1,7 +1,53 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
 from django.utils import timezone
 
-from .models import Project, Client, Entry
+from .choices import CachedModelChoiceField, CLIENT_CHOICES_KEY, PROJECT_CHOICES_KEY
+from .models import ArchivedEntry, Project, Client, Entry
+
+
+def validate_start(start):
+    """
+    Entries can't start in the future. Shared by EntryForm and the importer
+    """
+    if start >= timezone.now():
+        raise forms.ValidationError('Start time must be in the past')
+
+
+def validate_stop(start, stop):
+    """
+    An entry must not end before it started. Shared by EntryForm and the
+    importer
+    """
+    if stop and start and (stop < start):
+        raise forms.ValidationError('End time must come after start time')
+
+
+def start_of_day(day):
+    """
+    Midnight at the beginning of `day` in the current time zone
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def overlap_span(entry):
+    start = timezone.localtime(entry.start).strftime('%Y-%m-%d %H:%M')
+    if entry.stop is None:
+        return 'running since {}'.format(start)
+    return '{} to {}'.format(start, timezone.localtime(entry.stop).strftime('%Y-%m-%d %H:%M'))
+
+
+class IncludeArchivedMixin(object):
+    """
+    For filter forms with an `archived` checkbox: the entry querysets to
+    read, the archive first, as it holds the older entries
+    """
+    def entry_querysets(self):
+        models = [Entry]
+        if self.is_valid() and self.cleaned_data['archived']:
+            models.insert(0, ArchivedEntry)
+        return [self.filter(model.objects.all()) for model in models]
 
 
 class ClientForm(forms.ModelForm):
@@ -11,12 +57,20 @@ class ClientForm(forms.ModelForm):
 
 
 class ProjectForm(forms.ModelForm):
+    client = CachedModelChoiceField(
+        Client.objects.order_by('name'), CLIENT_CHOICES_KEY, required=False)
+
     class Meta:
         model = Project
         fields = ('name', 'client')
 
 
 class EntryForm(forms.ModelForm):
+    # Project labels include the client name, so fetch both in one query
+    project = CachedModelChoiceField(
+        Project.objects.select_related('client').order_by('client__name', 'name'),
+        PROJECT_CHOICES_KEY)
+
     class Meta:
         model = Entry
         fields = ('start', 'stop', 'project', 'description')
@@ -39,8 +93,7 @@ class EntryForm(forms.ModelForm):
         Validation for start field
         """
         start = self.cleaned_data['start']
-        if start >= timezone.now():
-            raise forms.ValidationError('Start time must be in the past')
+        validate_start(start)
 
         # Must return the value, regardless of whether we changed it or not
         return start
@@ -68,6 +121,137 @@ class EntryForm(forms.ModelForm):
         start = cleaned_data.get('start', None)
         stop = cleaned_data.get('stop', None)
 
-        if stop and start and (stop < start):
-            raise forms.ValidationError('End time must come after start time')
+        project = cleaned_data.get('project', None)
+
+        validate_stop(start, stop)
+        if start and project:
+            self.check_overlap(project, start, stop)
         # No need to return anything (Django 1.7 and above)
+
+    def check_overlap(self, project, start, stop):
+        """
+        Reject an entry that overlaps another one of the same project, running
+        entries included. Entries of different projects may overlap, the
+        tracker is shared by a team working on several projects at once
+        """
+        entries = Entry.objects.filter(project=project)
+        if self.instance.pk:
+            entries = entries.exclude(pk=self.instance.pk)
+        overlap = entries.first_overlap(start, stop)
+        if overlap is not None:
+            raise forms.ValidationError(
+                'Overlaps "{}" on {} ({})'.format(
+                    overlap.description, overlap.project.name, overlap_span(overlap)))
+
+
+class EntryWindowForm(forms.Form):
+    """
+    Optional date window (?from=&to=) for the entry list. Both ends are
+    inclusive dates, so ?from=2015-07-01&to=2015-07-31 covers all of July
+    """
+    def __init__(self, *args, **kwargs):
+        super(EntryWindowForm, self).__init__(*args, **kwargs)
+        # "from" is a reserved word so the fields can't be declared on the class
+        self.fields['from'] = forms.DateField(required=False, label='From')
+        self.fields['to'] = forms.DateField(required=False, label='To')
+
+    def clean(self):
+        cleaned_data = super(EntryWindowForm, self).clean()
+        date_from = cleaned_data.get('from', None)
+        date_to = cleaned_data.get('to', None)
+        if date_from and date_to and (date_to < date_from):
+            raise forms.ValidationError('"To" date must not be before "From" date')
+
+    @property
+    def params(self):
+        """
+        The window as query string parameters to carry over into page links,
+        with the dates in ISO format whatever format they came in
+        """
+        if not self.is_valid():
+            return {}
+        return dict(
+            (name, self.cleaned_data[name].isoformat()) for name in ('from', 'to')
+            if self.cleaned_data.get(name))
+
+    def filter(self, queryset):
+        """
+        Restrict an entry queryset to the window. An invalid window is ignored
+        """
+        if not self.is_valid():
+            return queryset
+        date_from = self.cleaned_data.get('from')
+        date_to = self.cleaned_data.get('to')
+        if date_from:
+            queryset = queryset.filter(start__gte=start_of_day(date_from))
+        if date_to:
+            queryset = queryset.filter(start__lt=start_of_day(date_to + timedelta(days=1)))
+        return queryset
+
+    def filter_days(self, queryset, field='day'):
+        """
+        Restrict a queryset to the window by a date field, such as the day of
+        the daily rollups
+        """
+        if not self.is_valid():
+            return queryset
+        date_from = self.cleaned_data.get('from')
+        date_to = self.cleaned_data.get('to')
+        if date_from:
+            queryset = queryset.filter(**{field + '__gte': date_from})
+        if date_to:
+            queryset = queryset.filter(**{field + '__lte': date_to})
+        return queryset
+
+
+class EntryExportForm(IncludeArchivedMixin, EntryWindowForm):
+    """
+    Filters of the entry export: the date window plus a client or project,
+    and whether to include archived entries
+    """
+    client = forms.ModelChoiceField(Client.objects.all(), required=False)
+    project = forms.ModelChoiceField(Project.objects.all(), required=False)
+    archived = forms.BooleanField(required=False, label='Include archived')
+
+    def filter(self, queryset):
+        queryset = super(EntryExportForm, self).filter(queryset)
+        if not self.is_valid():
+            return queryset
+        if self.cleaned_data['client']:
+            queryset = queryset.filter(project__client=self.cleaned_data['client'])
+        if self.cleaned_data['project']:
+            queryset = queryset.filter(project=self.cleaned_data['project'])
+        return queryset
+
+
+class TimesheetForm(IncludeArchivedMixin, forms.Form):
+    """
+    Week (any day in it, this week by default), optional client of the
+    timesheet and whether to include archived entries
+    """
+    week = forms.DateField(required=False, label='Week of')
+    client = CachedModelChoiceField(
+        Client.objects.order_by('name'), CLIENT_CHOICES_KEY, required=False)
+    archived = forms.BooleanField(required=False, label='Include archived')
+
+    def week_start(self):
+        """
+        The Monday the requested week starts on
+        """
+        day = None
+        if self.is_valid():
+            day = self.cleaned_data['week']
+        if day is None:
+            day = timezone.localtime(timezone.now()).date()
+        return day - timedelta(days=day.weekday())
+
+    def filter(self, queryset):
+        if self.is_valid() and self.cleaned_data['client']:
+            queryset = queryset.filter(project__client=self.cleaned_data['client'])
+        return queryset
+
+
+class EntryImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with the columns: client, project, start, stop, description')
+    create_missing = forms.BooleanField(
+        required=False, label='Create missing', help_text='Create unknown clients and projects')
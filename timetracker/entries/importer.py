@@ -0,0 +1,159 @@
+import csv
+
+from django import forms
+from django.db import transaction
+from django.db.models import Max
+
+from . import rollups, search
+from .caching import bump_generation
+from .forms import validate_start, validate_stop
+from .models import Client, Entry, Project
+
+
+# Columns expected in the header row of an import file
+COLUMNS = ('client', 'project', 'start', 'stop', 'description')
+
+# Only this many row errors are kept for the report, the rest are counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult(object):
+
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+        # Line the import stopped at because it couldn't be decoded, with
+        # everything before it imported
+        self.stopped_at = None
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+class EntryImporter(object):
+    """
+    Stream entries from a CSV file into the database.
+
+    Rows are parsed and validated with the same rules as EntryForm, but
+    client and project names are resolved through a lookup table built once
+    up front, and valid rows are inserted with bulk_create, `batch_size` at
+    a time, each batch in its own transaction. Invalid rows are reported
+    with their line number and skipped without aborting the import.
+
+    bulk_create doesn't send post_save, so the daily rollups and the search
+    index of each batch are updated in the batch's transaction as well, and
+    the cached entry lists are invalidated by hand.
+    """
+    start_field = forms.DateTimeField()
+    stop_field = forms.DateTimeField(required=False)
+    description_field = forms.CharField(max_length=Entry._meta.get_field('description').max_length)
+
+    def __init__(self, batch_size=1000, create_missing=False):
+        self.batch_size = batch_size
+        self.create_missing = create_missing
+        self.clients = None
+        self.projects = None
+
+    def load_lookups(self):
+        self.clients = dict(
+            (name, pk) for pk, name in Client.objects.values_list('pk', 'name'))
+        self.projects = dict(
+            ((client_name or '', name), pk)
+            for pk, name, client_name
+            in Project.objects.values_list('pk', 'name', 'client__name'))
+
+    def resolve_project(self, client_name, project_name):
+        """
+        Return the id of the named project, creating it and its client when
+        create_missing is set
+        """
+        key = (client_name, project_name)
+        if key in self.projects:
+            return self.projects[key]
+        if not self.create_missing:
+            raise forms.ValidationError(
+                'Unknown project "{}" of client "{}"'.format(project_name, client_name))
+        client_id = None
+        if client_name:
+            client_id = self.clients.get(client_name)
+            if client_id is None:
+                client_id = self.clients[client_name] = Client.objects.create(name=client_name).pk
+        project = Project.objects.create(name=project_name, client_id=client_id)
+        self.projects[key] = project.pk
+        return project.pk
+
+    def parse_row(self, row):
+        """
+        Turn a CSV row into an unsaved Entry or raise ValidationError
+        """
+        if len(row) != len(COLUMNS):
+            raise forms.ValidationError(
+                'Expected {} columns, got {}'.format(len(COLUMNS), len(row)))
+        client_name, project_name, start, stop, description = [value.strip() for value in row]
+        if not project_name:
+            raise forms.ValidationError('Project is required')
+        start = self.start_field.clean(start)
+        stop = self.stop_field.clean(stop)
+        validate_start(start)
+        validate_stop(start, stop)
+        description = self.description_field.clean(description)
+        project_id = self.resolve_project(client_name, project_name)
+        entry = Entry(project_id=project_id, start=start, stop=stop, description=description)
+        # bulk_create bypasses save()
+        entry.update_duration()
+        return entry
+
+    def save_batch(self, batch, result):
+        with transaction.atomic():
+            # bulk_create doesn't set primary keys on SQLite, but the new
+            # entries are the ones after the current last id
+            last_pk = Entry.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+            Entry.objects.bulk_create(batch)
+            rollups.apply_totals(rollups.span_totals(
+                (entry.project_id, entry.start, entry.stop) for entry in batch))
+            search.index_entries(Entry.objects.filter(pk__gt=last_pk))
+        bump_generation(Entry)
+        result.created += len(batch)
+
+    def run(self, lines, progress=None):
+        """
+        Import from an iterable of text lines, such as an open file. Only the
+        current batch is held in memory. `progress` is called with the line
+        number reached and the result so far after every batch.
+
+        Lines that can't be decoded stop the import. As the batches read so
+        far are saved already, the rows before the bad line are all
+        imported and the result tells where it stopped
+        """
+        result = ImportResult()
+        self.load_lookups()
+        reader = csv.reader(lines)
+        batch = []
+        try:
+            header = next(reader, None)
+            if header is None or tuple(name.strip().lower() for name in header) != COLUMNS:
+                result.add_error(1, 'The header row must be: {}'.format(','.join(COLUMNS)))
+                return result
+
+            for row in reader:
+                if not any(value.strip() for value in row):
+                    continue
+                try:
+                    batch.append(self.parse_row(row))
+                except forms.ValidationError as e:
+                    result.add_error(reader.line_num, ' '.join(e.messages))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.save_batch(batch, result)
+                    batch = []
+                    if progress:
+                        progress(reader.line_num, result)
+        except UnicodeDecodeError:
+            result.stopped_at = reader.line_num + 1
+            result.add_error(result.stopped_at, "Can't be decoded, the import stopped here")
+        if batch:
+            self.save_batch(batch, result)
+        return result
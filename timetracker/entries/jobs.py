@@ -0,0 +1,153 @@
+"""
+A small job queue kept in the database: enqueue() stores a Job, the
+run_worker command claims due jobs and runs the task registered for their
+kind in a process pool, retrying failed attempts with a growing delay.
+
+Tasks are functions taking the Job and the keyword arguments it was
+enqueued with, registered with @task('name'). They can report progress
+with job.report() and return a JSON serializable dict, stored as the job's
+result. An `output` key in it names a file the task wrote to JOB_FILES_DIR,
+which the job page then offers for download. A task can also register a
+cleanup function, run when its job has failed for good. The entries app's
+tasks are in tasks.py
+"""
+import json
+import os
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+_tasks = {}
+
+_cleanups = {}
+
+
+class JobFailed(Exception):
+    """
+    Raised by a task to fail its job right away with the given message,
+    for errors that another attempt wouldn't fix
+    """
+
+
+def task(kind, cleanup=None):
+    """
+    Register the decorated function as the task run for jobs of `kind`.
+    `cleanup` is called like the task once a job is out of attempts or
+    failed with JobFailed, for instance to delete its input file
+    """
+    def register(function):
+        _tasks[kind] = function
+        if cleanup is not None:
+            _cleanups[kind] = cleanup
+        return function
+    return register
+
+
+def unregister(kind):
+    _tasks.pop(kind, None)
+    _cleanups.pop(kind, None)
+
+
+def clean_up(job):
+    cleanup = _cleanups.get(job.kind)
+    if cleanup is not None:
+        cleanup(job, **json.loads(job.params))
+
+
+def enqueue(kind, max_attempts=3, **params):
+    if kind not in _tasks:
+        raise ValueError('Unknown job kind: {}'.format(kind))
+    return Job.objects.create(kind=kind, params=json.dumps(params), max_attempts=max_attempts)
+
+
+def file_path(name):
+    """
+    Absolute path of a job input or output file, creating JOB_FILES_DIR
+    """
+    directory = settings.JOB_FILES_DIR
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return os.path.join(directory, name)
+
+
+def claim_next():
+    """
+    Mark the next due job as running and return its id, or None when no job
+    is due. The UPDATE only matches a job that is still queued, so when
+    several workers go for the same job only one of them gets it
+    """
+    # Always the primary: a replica could hand out jobs already taken
+    jobs = Job.objects.using(DEFAULT_DB_ALIAS)
+    while True:
+        now = timezone.now()
+        pk = jobs.filter(status=Job.QUEUED, run_after__lte=now).order_by(
+            'run_after', 'id').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        claimed = jobs.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=now, attempts=F('attempts') + 1)
+        if claimed:
+            return pk
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after the given number of failed attempts: JOB_RETRY_DELAY,
+    doubled after every further failure
+    """
+    return getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+
+
+def run_job(pk):
+    """
+    Run a claimed job and record the outcome. Returns whether it succeeded
+    """
+    jobs = Job.objects.using(DEFAULT_DB_ALIAS).filter(pk=pk)
+    job = jobs.get()
+    try:
+        result = _tasks[job.kind](job, **json.loads(job.params)) or {}
+    except JobFailed as e:
+        jobs.update(status=Job.FAILED, finished=timezone.now(), error=str(e), message=str(e)[:200])
+        clean_up(job)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            run_after = now + timedelta(seconds=retry_delay(job.attempts))
+            jobs.update(status=Job.QUEUED, run_after=run_after, error=error, message='Attempt {} of {} failed'.format(
+                job.attempts, job.max_attempts))
+        else:
+            jobs.update(status=Job.FAILED, finished=now, error=error, message='Failed')
+            clean_up(job)
+        return False
+    jobs.update(
+        status=Job.SUCCEEDED, finished=timezone.now(), result=json.dumps(result),
+        output=result.get('output', ''), message='Done')
+    return True
+
+
+def requeue_stale(timeout):
+    """
+    Give jobs that have been running for more than `timeout` seconds, most
+    likely because their worker died, back to the queue, or fail them if
+    they are out of attempts. Returns the number of jobs touched
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = Job.objects.using(DEFAULT_DB_ALIAS).filter(status=Job.RUNNING, started__lt=cutoff)
+    out_of_attempts = list(stale.filter(attempts__gte=F('max_attempts')))
+    failed = 0
+    for job in out_of_attempts:
+        # Unless a worker finished it in the meantime
+        if stale.filter(pk=job.pk).update(status=Job.FAILED, finished=timezone.now(), message='Worker lost'):
+            failed += 1
+            clean_up(job)
+    requeued = stale.update(status=Job.QUEUED, run_after=timezone.now(), message='Worker lost, retrying')
+    return failed + requeued
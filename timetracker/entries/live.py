@@ -0,0 +1,120 @@
+"""
+Push the running timers to the live dashboard, see the running_events and
+running_poll views.
+
+Saving or deleting an entry that is or was running tells the process wide
+`running_timers` notifier, which wakes up every waiting viewer. The first
+viewer to ask for the new list runs the query, the others get the same
+list, so a change costs one query however many viewers are connected.
+
+The notifier lives in the process: with several worker processes each one
+only hears about the saves it handled itself. To pick up the others, the
+list is queried again when it is older than REFRESH_SECONDS and a viewer
+asks for it, which bumps the version if it changed
+"""
+import threading
+import time
+import uuid
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import Entry
+
+
+# Seconds between two messages on an idle event stream. The browser drops
+# a stream that stays silent for too long
+KEEPALIVE_SECONDS = 15
+
+# An event stream ends after this many seconds and the browser reconnects,
+# so a worker thread isn't held by one viewer forever
+STREAM_SECONDS = 300
+
+# Seconds a long-poll request waits for a change
+POLL_SECONDS = 25
+
+# Age in seconds after which the list is queried again, for changes made by
+# other processes
+REFRESH_SECONDS = 15
+
+
+class RunningTimers(object):
+    """
+    A version number bumped on every change to the running timers, and the
+    list of running timers for the current version, queried at most once
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.query_lock = threading.Lock()
+        # Tells the versions of different processes, or of a restarted one,
+        # apart
+        self.token = uuid.uuid4().hex[:8]
+        self.counter = 0
+        # (version, timers, time of the query)
+        self.cached = (None, None, 0)
+
+    @property
+    def version(self):
+        return '{}-{}'.format(self.token, self.counter)
+
+    def changed(self):
+        with self.condition:
+            self.counter += 1
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """
+        Wait up to `timeout` seconds for the version to differ from the given
+        one and return the current version
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self):
+        """
+        Return (version, timers) with the running timers as dicts
+        """
+        with self.query_lock:
+            version, timers, queried = self.cached
+            if version != self.version or time.time() - queried > REFRESH_SECONDS:
+                fresh = self.query()
+                if version == self.version and fresh != timers:
+                    # Changed by another process
+                    self.changed()
+                self.cached = (self.version, fresh, time.time())
+            return self.cached[:2]
+
+    def query(self):
+        # From the primary, a replica could still be missing the change
+        entries = Entry.objects.using(DEFAULT_DB_ALIAS).running().select_related(
+            'project__client').order_by('start', 'id')
+        return [{
+            'id': entry.pk,
+            'description': entry.description,
+            'start': entry.start.isoformat(),
+            'project': entry.project.name,
+            'client': entry.project.client.name if entry.project.client else None,
+        } for entry in entries]
+
+
+running_timers = RunningTimers()
+
+_pending = threading.local()
+
+
+def entry_changed(using):
+    """
+    Called by the signal handlers for a change to a running timer. Inside a
+    transaction other threads can't see the change yet, so the viewers are
+    only woken up once the request is done, see notify_pending()
+    """
+    if transaction.get_connection(using).in_atomic_block:
+        _pending.changed = True
+    else:
+        running_timers.changed()
+
+
+def notify_pending():
+    if getattr(_pending, 'changed', False):
+        _pending.changed = False
+        running_timers.changed()
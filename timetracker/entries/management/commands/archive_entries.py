@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from entries.archive import archive_entries
+
+
+class Command(BaseCommand):
+    help = 'Move entries that finished more than the given number of days ago into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, metavar='DAYS',
+            help='Archive entries that stopped more than this many days ago')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entries moved per transaction, at most as many as the database takes query parameters')
+
+    def handle(self, *args, **options):
+        # Checked here rather than by argparse: call_command can't pass
+        # required options in Django 1.8
+        if options['older_than'] is None:
+            raise CommandError('--older-than is required')
+        verbose = options['verbosity'] > 1
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        count = archive_entries(
+            cutoff, batch_size=options['batch_size'], stdout=self.stdout if verbose else None)
+        self.stdout.write('Archived {} entries that stopped before {}'.format(
+            count, timezone.localtime(cutoff).strftime('%Y-%m-%d %H:%M')))
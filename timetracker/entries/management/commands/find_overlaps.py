@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from entries.models import Entry
+from entries.overlaps import find_overlaps
+
+
+def format_row(row):
+    pk, start, stop = row
+    stop = timezone.localtime(stop).strftime('%Y-%m-%d %H:%M:%S') if stop else 'running'
+    return '#{} {} - {}'.format(pk, timezone.localtime(start).strftime('%Y-%m-%d %H:%M:%S'), stop)
+
+
+class Command(BaseCommand):
+    help = 'List every pair of entries of the same project whose times overlap'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entries read per query')
+
+    def handle(self, *args, **options):
+        count = 0
+        for earlier, later in find_overlaps(Entry.objects.all(), options['batch_size']):
+            self.stdout.write('{} overlaps {}'.format(format_row(later), format_row(earlier)))
+            count += 1
+        self.stdout.write('Found {} overlapping pairs'.format(count))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from entries.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with generated clients, projects and entries for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20)
+        parser.add_argument('--projects', type=int, default=200)
+        parser.add_argument('--entries', type=int, default=100000, help='Number of finished entries')
+        parser.add_argument(
+            '--running', type=int, default=5, help='Number of entries still running')
+        parser.add_argument(
+            '--days', type=int, default=730, help='Spread the entries over this many days before today')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for a repeatable dataset')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000, help='Number of entries inserted per transaction')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1
+        generator = DatasetGenerator(seed=options['seed'], batch_size=options['batch_size'])
+        client_ids = generator.create_clients(options['clients'])
+        project_ids = generator.create_projects(options['projects'], client_ids)
+        count = generator.create_entries(
+            project_ids, options['entries'], days=options['days'], running=options['running'],
+            stdout=self.stdout if verbose else None)
+        generator.finish()
+        self.stdout.write('Created {} clients, {} projects and {} entries'.format(
+            len(client_ids), len(project_ids), count))
@@ -0,0 +1,38 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand
+
+from entries.importer import COLUMNS, EntryImporter
+
+
+class Command(BaseCommand):
+    help = 'Import entries from a CSV file with the columns: {}'.format(', '.join(COLUMNS))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import, "-" for stdin')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entries inserted per query and transaction')
+        parser.add_argument(
+            '--create-missing', action='store_true', default=False,
+            help='Create unknown clients and projects instead of rejecting their rows')
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        importer = EntryImporter(
+            batch_size=options['batch_size'], create_missing=options['create_missing'])
+        if options['path'] == '-':
+            stdin = io.TextIOWrapper(sys.stdin.buffer, encoding=options['encoding'], newline='')
+            result = importer.run(stdin)
+        else:
+            with io.open(options['path'], encoding=options['encoding'], newline='') as lines:
+                result = importer.run(lines)
+
+        for line, message in result.errors:
+            self.stderr.write('Line {}: {}'.format(line, message))
+        if result.error_count > len(result.errors):
+            self.stderr.write('... and {} more errors'.format(
+                result.error_count - len(result.errors)))
+        self.stdout.write('Imported {} entries, skipped {} rows'.format(
+            result.created, result.error_count))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from entries import jobs, rollups
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the daily rollup table from all finished entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entries read per query')
+        parser.add_argument(
+            '--background', action='store_true', default=False,
+            help='Queue a job for run_worker instead of rebuilding now')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue('rebuild_rollups', batch_size=options['batch_size'])
+            self.stdout.write('Queued job {}'.format(job.pk))
+            return
+        verbose = options['verbosity'] > 1
+        count = rollups.rebuild(
+            batch_size=options['batch_size'], stdout=self.stdout if verbose else None)
+        self.stdout.write('Wrote {} rollup rows'.format(count))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from entries import jobs, search
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the full text search index of entry descriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entries read and indexed per query')
+        parser.add_argument(
+            '--background', action='store_true', default=False,
+            help='Queue a job for run_worker instead of rebuilding now')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue('rebuild_search_index', batch_size=options['batch_size'])
+            self.stdout.write('Queued job {}'.format(job.pk))
+            return
+        if not search.is_available():
+            self.stdout.write('The database has no full text index, search scans entries instead')
+            return
+        count = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write('Indexed {} entries'.format(count))
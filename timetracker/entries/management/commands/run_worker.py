@@ -0,0 +1,100 @@
+import multiprocessing
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from entries import jobs
+
+
+# Seconds between two looks for jobs left running by a worker that died
+REQUEUE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, such as imports and exports, in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='Number of jobs run at the same time, 0 runs them one by one in this process')
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait before looking for new jobs when the queue is empty')
+        parser.add_argument(
+            '--stale-after', type=int, default=3600,
+            help='Requeue jobs that have been running for this many seconds, their worker is gone')
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Exit when no job is due instead of waiting for more')
+
+    def handle(self, *args, **options):
+        self.requeued_at = None
+        self.requeue_stale(options)
+        if options['processes'] > 0:
+            self.run_pool(options)
+        else:
+            self.run_inline(options)
+
+    def requeue_stale(self, options):
+        """
+        Requeue the jobs of workers that died, every REQUEUE_INTERVAL seconds
+        """
+        if self.requeued_at is not None and time.time() - self.requeued_at < REQUEUE_INTERVAL:
+            return
+        self.requeued_at = time.time()
+        requeued = jobs.requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write('Requeued {} stale jobs'.format(requeued))
+
+    def log(self, pk, succeeded):
+        self.stdout.write('Job {} {}'.format(pk, 'succeeded' if succeeded else 'failed'))
+
+    def run_inline(self, options):
+        while True:
+            self.requeue_stale(options)
+            pk = jobs.claim_next()
+            if pk is not None:
+                self.log(pk, jobs.run_job(pk))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
+
+    def run_pool(self, options):
+        """
+        Claim jobs here and hand them to the pool while it has an idle
+        process. The processes are spawned rather than forked, so none of
+        them shares a database connection with this one.
+
+        The pool replaces a process that dies, but the result of the job it
+        was running never comes. After --stale-after seconds the job's slot
+        is given up, and requeue_stale() hands the job to another worker
+        """
+        processes = options['processes']
+        connections.close_all()
+        pool = multiprocessing.get_context('spawn').Pool(processes, initializer=django.setup)
+        # {job id: (AsyncResult, time handed to the pool)}
+        running = {}
+        try:
+            while True:
+                for pk, (result, submitted) in list(running.items()):
+                    if result.ready():
+                        del running[pk]
+                        self.log(pk, result.get())
+                    elif time.time() - submitted > options['stale_after']:
+                        del running[pk]
+                        self.stdout.write('Job {} lost, its process died or hangs'.format(pk))
+                self.requeue_stale(options)
+                if len(running) < processes:
+                    pk = jobs.claim_next()
+                    if pk is not None:
+                        running[pk] = (pool.apply_async(jobs.run_job, (pk,)), time.time())
+                        continue
+                if not running and options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Report the import time of each module and the time to first response of each page of a fresh worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--warm-up', action='store_true', default=False,
+            help='Run the warm-up of WARM_UP_ON_START before the first requests')
+        parser.add_argument(
+            '--limit', type=int, default=25,
+            help='Number of slowest imports shown')
+
+    def handle(self, *args, **options):
+        # This process has imported everything already, measure a new one
+        command = [sys.executable, '-m', 'entries.startup']
+        if options['warm_up']:
+            command.append('--warm-up')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'timetracker.settings'))
+        try:
+            output = subprocess.check_output(command, cwd=settings.BASE_DIR, env=env)
+        except subprocess.CalledProcessError as e:
+            raise CommandError('Profiling failed with exit status {}'.format(e.returncode))
+        report = json.loads(output.decode('utf-8'))
+
+        self.stdout.write('django.setup() {:.0f} ms, {} modules imported'.format(
+            report['setup'] * 1000, len(report['imports'])))
+        self.stdout.write('')
+        self.stdout.write('{:>10} {:>10}  {}'.format('total ms', 'self ms', 'module'))
+        for name, cumulative, own in report['imports'][:options['limit']]:
+            self.stdout.write('{:10.1f} {:10.1f}  {}'.format(cumulative * 1000, own * 1000, name))
+
+        if report['warm_up']:
+            self.stdout.write('')
+            for step, seconds in report['warm_up']:
+                self.stdout.write('warm-up {:<10} {:8.1f} ms'.format(step, seconds * 1000))
+
+        self.stdout.write('')
+        self.stdout.write('{:>10} {:>10} {:>6}  {:<30} {}'.format(
+            'first ms', 'repeat ms', 'status', 'page', 'module'))
+        for name, path, module, status, first, repeat in report['requests']:
+            self.stdout.write('{:10.1f} {:10.1f} {:>6}  {:<30} {}'.format(
+                first * 1000, repeat * 1000, status, path, module))
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from entries.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database into the SQLite files standing in for read replicas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*', help='Replica database aliases, all of DATABASE_REPLICAS by default')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be synced this way')
+        for alias in options['aliases'] or get_replicas():
+            replica = connections[alias]
+            if replica.vendor != 'sqlite':
+                raise CommandError('{} is not a SQLite database'.format(alias))
+            path = replica.settings_dict['NAME']
+            partial = path + '.partial'
+            if os.path.exists(partial):
+                os.remove(partial)
+            # A consistent snapshot even while the primary is being written
+            # to, swapped in with a rename so readers never see half a file
+            with primary.cursor() as cursor:
+                cursor.execute('VACUUM INTO %s', [partial])
+            replica.close()
+            os.replace(partial, path)
+            self.stdout.write('Copied the primary to {} ({})'.format(alias, path))
@@ -0,0 +1,187 @@
+"""
+In-process request metrics per URL name, collected by
+middleware.RequestMetricsMiddleware and shown by the stats views.
+
+Every process keeps its own numbers, so with several workers each one
+reports what it served itself
+"""
+import math
+import threading
+import time
+
+
+PERCENTILES = (50, 95, 99)
+
+METRIC_NAMES = ('wall', 'queries', 'db', 'template')
+
+
+class Histogram(object):
+    """
+    Count values in logarithmic buckets, each `growth` times wider than the
+    one before, so memory stays fixed however many values are added and a
+    percentile is off by less than the bucket width, 10% by default
+    """
+    def __init__(self, smallest, growth=1.1, buckets=250):
+        self.smallest = smallest
+        self.growth = growth
+        self.log_growth = math.log(growth)
+        self.counts = [0] * buckets
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = 0
+        if value > self.smallest:
+            index = int(math.ceil(math.log(value / self.smallest) / self.log_growth))
+        self.counts[min(index, len(self.counts) - 1)] += 1
+
+    def percentile(self, percent):
+        """
+        The upper bound of the bucket holding the given percentile, but never
+        more than the largest value seen
+        """
+        if not self.count:
+            return None
+        rank = int(math.ceil(self.count * percent / 100.0))
+        seen = self.zeros
+        if seen >= rank:
+            return 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.smallest * self.growth ** index, self.max)
+        return self.max
+
+    def summary(self):
+        summary = dict(('p{}'.format(percent), self.percentile(percent)) for percent in PERCENTILES)
+        summary['mean'] = self.total / self.count if self.count else None
+        summary['max'] = self.max
+        return summary
+
+
+class ViewMetrics(object):
+    """
+    Histograms of the wall time, query count, database time and template
+    render time of one URL name. Times are in seconds
+    """
+    def __init__(self):
+        self.count = 0
+        self.histograms = {
+            'wall': Histogram(0.0001),
+            'queries': Histogram(1),
+            'db': Histogram(0.0001),
+            'template': Histogram(0.0001),
+        }
+
+    def add(self, **values):
+        self.count += 1
+        for name, value in values.items():
+            self.histograms[name].add(value)
+
+    def summary(self):
+        summary = dict((name, self.histograms[name].summary()) for name in METRIC_NAMES)
+        summary['count'] = self.count
+        return summary
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.started = time.time()
+
+    def record(self, name, **values):
+        with self.lock:
+            if name not in self.views:
+                self.views[name] = ViewMetrics()
+            self.views[name].add(**values)
+
+    def snapshot(self):
+        """
+        Percentiles of every URL name seen so far, {name: summary}
+        """
+        with self.lock:
+            return dict((name, metrics.summary()) for name, metrics in self.views.items())
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.started = time.time()
+
+
+registry = Registry()
+
+
+class QueryTimer(object):
+    """
+    Query count and time of the request being served, fed by TimedCursor
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+class TimedCursor(object):
+    """
+    Wrap a database cursor to add the count and duration of its queries to a
+    QueryTimer. Much cheaper than the debug cursor, which also formats and
+    keeps the SQL of every query
+    """
+    def __init__(self, cursor, timer):
+        self.cursor = cursor
+        self.timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.timer.count += 1
+            self.timer.seconds += time.time() - started
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.timer.count += 1
+            self.timer.seconds += time.time() - started
+
+
+def time_queries(connection, timer):
+    """
+    Make the connection hand out TimedCursors feeding `timer` until
+    stop_timing_queries() is called. Connections are per thread, so this
+    only sees the queries of the current request
+    """
+    stop_timing_queries(connection)
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursor(make_cursor(cursor), timer)
+    connection.make_debug_cursor = lambda cursor: TimedCursor(make_debug_cursor(cursor), timer)
+
+
+def stop_timing_queries(connection):
+    for name in ('make_cursor', 'make_debug_cursor'):
+        connection.__dict__.pop(name, None)
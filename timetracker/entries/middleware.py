@@ -0,0 +1,156 @@
+import mimetypes
+import os
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .metrics import QueryTimer, registry, stop_timing_queries, time_queries
+from .routers import pin_to_primary, unpin, wrote
+
+
+# Set on responses to requests that wrote to the primary, see routers.py
+PIN_COOKIE = 'primary_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class RequestMetrics(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.queries = QueryTimer()
+        self.template_seconds = 0.0
+
+
+class RequestMetricsMiddleware(object):
+    """
+    Record the wall time, query count, database time and template render
+    time of requests per URL name in metrics.registry, without DEBUG.
+
+    Put it first in MIDDLEWARE_CLASSES so the wall time covers the other
+    middleware. Set METRICS_SAMPLE_RATE below 1 to only measure that
+    fraction of the requests. Template time is measured for TemplateResponses,
+    which covers the class based views, minus the queries the template runs.
+    Queries run while a streaming response is consumed aren't counted
+    """
+    def __init__(self):
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+
+    def process_request(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        request.metrics = RequestMetrics()
+        for connection in connections.all():
+            time_queries(connection, request.metrics.queries)
+
+    def process_template_response(self, request, response):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return response
+        # Called just before the response is rendered
+        started = time.time()
+        db_seconds = metrics.queries.seconds
+
+        def rendered(response):
+            elapsed = time.time() - started
+            metrics.template_seconds += elapsed - (metrics.queries.seconds - db_seconds)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return response
+        for connection in connections.all():
+            stop_timing_queries(connection)
+        resolver_match = getattr(request, 'resolver_match', None)
+        registry.record(
+            resolver_match.view_name if resolver_match else '(unresolved)',
+            wall=time.time() - metrics.started,
+            queries=metrics.queries.count,
+            db=metrics.queries.seconds,
+            template=metrics.template_seconds)
+        return response
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Read from the primary for the whole of a request that isn't a plain
+    read, and for the REPLICA_PIN_SECONDS after a request that wrote, so a
+    redirect after a POST shows what was just saved even if the replicas
+    are behind. Everything else reads from the replicas, see routers.py
+    """
+    def process_request(self, request):
+        unpin()
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            pin_to_primary()
+
+    def process_response(self, request, response):
+        if wrote():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 15), httponly=True)
+        unpin()
+        return response
+
+
+# Names from ManifestStaticFilesStorage carry 12 hex digits of their hash
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.')
+
+# A hashed name always has the same content, browsers can keep it for a year
+HASHED_MAX_AGE = 365 * 24 * 3600
+
+# Other static files, such as the admin's images referenced by unhashed name
+STATIC_MAX_AGE = 60
+
+
+class StaticFilesMiddleware(object):
+    """
+    Serve the files collectstatic put in STATIC_ROOT, for a deployment with
+    no web server in front to do it. Put it first in MIDDLEWARE_CLASSES so
+    static requests skip the other middleware.
+
+    Hashed names get far-future cache headers, and the .gz copy written by
+    GzipManifestStaticFilesStorage is sent to clients accepting gzip
+    """
+    def __init__(self):
+        if not settings.STATIC_ROOT or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.root = settings.STATIC_ROOT
+        self.prefix = settings.STATIC_URL
+
+    def process_request(self, request):
+        if not request.path.startswith(self.prefix) or request.method not in ('GET', 'HEAD'):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            raise Http404(name)
+        if not os.path.isfile(path):
+            raise Http404(name)
+
+        content_type, encoding = mimetypes.guess_type(path)
+        compressed = os.path.isfile(path + '.gz')
+        if compressed and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            path += '.gz'
+            encoding = 'gzip'
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = os.path.getsize(path)
+        response['Last-Modified'] = http_date(os.path.getmtime(path))
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if compressed:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        max_age = HASHED_MAX_AGE if HASHED_NAME.search(name) else STATIC_MAX_AGE
+        patch_cache_control(response, public=True, max_age=max_age)
+        response['Expires'] = http_date(time.time() + max_age)
+        return response
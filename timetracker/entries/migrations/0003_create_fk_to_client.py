@@ -1,25 +1,100 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models, migrations
+from django.db import connections, models, migrations
+from django.db.models import Case, F, Value, When
+
+
+# Copies of the helpers in entries.batching as of this migration, which
+# must not change with the live code, taking the database to work on
+
+def chunked(queryset, batch_size=1000):
+    """
+    Yield the rows of the queryset in primary key order as lists of at most
+    `batch_size`, walking the primary key index instead of using OFFSET
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1].pk
+
+
+def bulk_update(model, objs, fields, using, batch_size=500):
+    """
+    Save `fields` of the model instances with one UPDATE and a CASE on the
+    primary key per batch
+    """
+    ops = connections[using].ops
+    batch_size = min(batch_size, ops.bulk_batch_size(['pk'] + list(fields) * 2, objs) or batch_size)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+        for name in fields:
+            field = model._meta.get_field(name)
+            updates[field.attname] = Case(*[
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname)))
+                for obj in batch
+            ], output_field=field)
+        model._default_manager.using(using).filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+def get_or_create_names(model, names, using, batch_size=500):
+    """
+    Return a {name: id} map for `names`, bulk creating the rows missing
+    """
+    manager = model._default_manager.db_manager(using)
+    ids = dict((name, pk) for pk, name in manager.values_list('pk', 'name').order_by('-pk'))
+    missing = sorted(set(name for name in names if name not in ids))
+    manager.bulk_create([model(name=name) for name in missing], batch_size=batch_size)
+    # bulk_create doesn't return ids on every backend, so look them up
+    for start in range(0, len(missing), batch_size):
+        ids.update(manager.filter(
+            name__in=missing[start:start + batch_size]).values_list('name', 'pk'))
+    return ids
 
 
 def move_client_name_to_temporary_field(apps, schema_editor):
     Project = apps.get_model("entries", "Project")
+    db = schema_editor.connection.alias
 
-    for p in Project.objects.all():
-        p.client_name = p.client
-        p.save()
+    # One set based UPDATE instead of a SELECT and an UPDATE per project
+    Project.objects.using(db).update(client_name=F('client'))
+
+def move_client_name_back(apps, schema_editor):
+    Project = apps.get_model("entries", "Project")
+    db = schema_editor.connection.alias
+
+    Project.objects.using(db).update(client=F('client_name'))
 
 def create_clients(apps, schema_editor):
     Client = apps.get_model("entries", "Client")
     Project = apps.get_model("entries", "Project")
+    db = schema_editor.connection.alias
+
+    names = Project.objects.using(db).exclude(client_name='').values_list('client_name', flat=True).distinct()
+    client_ids = get_or_create_names(Client, names, db)
+
+    for batch in chunked(Project.objects.using(db).only('pk', 'client_name')):
+        for p in batch:
+            # Projects without a client name used to keep whatever the column
+            # conversion left in client_id, which isn't a valid client
+            p.client_id = client_ids.get(p.client_name)
+        bulk_update(Project, batch, ['client'], db)
+
+def copy_client_names(apps, schema_editor):
+    Project = apps.get_model("entries", "Project")
+    db = schema_editor.connection.alias
 
-    for p in Project.objects.all():
-        if p.client_name:
-            c, _ = Client.objects.get_or_create(name=p.client_name)
-            p.client = c
-            p.save()
+    for batch in chunked(Project.objects.using(db).select_related('client').only('pk', 'client__name')):
+        for p in batch:
+            p.client_name = p.client.name if p.client else ''
+        bulk_update(Project, batch, ['client_name'], db)
 
 
 class Migration(migrations.Migration):
@@ -45,13 +120,13 @@ class Migration(migrations.Migration):
             name='client_name',
             field=models.CharField(max_length=200, default=''),
         ),
-        migrations.RunPython(move_client_name_to_temporary_field),
+        migrations.RunPython(move_client_name_to_temporary_field, move_client_name_back),
         migrations.AlterField(
             model_name='project',
             name='client',
             field=models.ForeignKey(to='entries.Client', blank=True, null=True),
         ),
-        migrations.RunPython(create_clients),
+        migrations.RunPython(create_clients, copy_client_names),
         migrations.RemoveField(
             model_name='project',
             name='client_name',
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+RUNNING_INDEX = 'entries_entry_running'
+
+
+def create_running_index(apps, schema_editor):
+    """
+    Index the entries whose timer is still running. Where the backend supports
+    partial indexes the index only contains those rows, so it stays tiny no
+    matter how many finished entries pile up. Elsewhere fall back to a plain
+    (stop, start) index, which still lets the database seek to the NULLs
+    """
+    quote_name = schema_editor.quote_name
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        sql = 'CREATE INDEX {index} ON {table} ({start}) WHERE {stop} IS NULL'
+    else:
+        sql = 'CREATE INDEX {index} ON {table} ({stop}, {start})'
+    schema_editor.execute(sql.format(
+        index=quote_name(RUNNING_INDEX), table=quote_name('entries_entry'),
+        start=quote_name('start'), stop=quote_name('stop')))
+
+
+def drop_running_index(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'mysql':
+        sql = 'DROP INDEX {} ON {}'.format(quote_name(RUNNING_INDEX), quote_name('entries_entry'))
+    else:
+        sql = 'DROP INDEX {}'.format(quote_name(RUNNING_INDEX))
+    schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0004_entry_start_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='entry',
+            index_together=set([('start', 'id'), ('project', 'start')]),
+        ),
+        migrations.RunPython(create_running_index, drop_running_index),
+    ]
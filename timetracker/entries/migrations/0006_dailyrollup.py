@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import models, migrations
+from django.utils import timezone
+
+
+def split_by_day(start, stop):
+    """
+    Yield (day, seconds) for each local calendar day the span from start to
+    stop touches. A copy of entries.rollups.split_by_day(), migrations must
+    not change with the live code
+    """
+    if stop is None or stop <= start:
+        return
+    start = timezone.localtime(start)
+    stop = timezone.localtime(stop)
+    day = start.date()
+    while True:
+        next_day = day + timedelta(days=1)
+        midnight = timezone.make_aware(datetime.combine(next_day, time.min))
+        segment_stop = min(stop, midnight)
+        yield day, (segment_stop - start).total_seconds()
+        if segment_stop >= stop:
+            return
+        start, day = segment_stop, next_day
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    Roll up the existing entries. Same as `manage.py rebuild_rollups` but
+    against the historical models
+    """
+    Entry = apps.get_model('entries', 'Entry')
+    DailyRollup = apps.get_model('entries', 'DailyRollup')
+    db = schema_editor.connection.alias
+
+    totals = defaultdict(lambda: [0.0, 0])
+    entries = Entry.objects.using(db).filter(stop__isnull=False).values_list('project_id', 'start', 'stop')
+    for project_id, start, stop in entries.iterator():
+        for day, seconds in split_by_day(start, stop):
+            totals[project_id, day][0] += seconds
+            # Counted on every day the entry spans, see DailyRollup
+            totals[project_id, day][1] += 1
+    DailyRollup.objects.using(db).bulk_create([
+        DailyRollup(project_id=project_id, day=day, seconds=seconds, entry_count=count)
+        for (project_id, day), (seconds, count) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0005_entry_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('day', models.DateField()),
+                ('seconds', models.FloatField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(to='entries.Project')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyrollup',
+            unique_together=set([('project', 'day')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dailyrollup',
+            index_together=set([('day', 'project')]),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+
+FTS_TABLE = 'entries_entry_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    """
+    Create the SQLite FTS5 index over entry descriptions and fill it. Other
+    backends, and SQLite builds without FTS5, use the substring search
+    fallback in search.py instead
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE {} USING fts5(description)'.format(FTS_TABLE))
+    except OperationalError:
+        return
+    schema_editor.execute(
+        'INSERT INTO {} (rowid, description) SELECT id, description FROM entries_entry'.format(FTS_TABLE))
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS {}'.format(FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0006_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
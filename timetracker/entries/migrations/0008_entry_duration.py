@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import FloatField, Func, Max
+
+
+class SecondsBetween(Func):
+    """
+    Number of seconds from the `start` to the `stop` datetime expression. A
+    copy of entries.expressions.SecondsBetween, migrations must not change
+    with the live code
+    """
+    templates = {
+        'sqlite': '((julianday({stop}) - julianday({start})) * 86400.0)',
+        'postgresql': 'EXTRACT(EPOCH FROM ({stop} - {start}))',
+        'mysql': '(TIMESTAMPDIFF(MICROSECOND, {start}, {stop}) / 1000000.0)',
+        'oracle': '(CAST({stop} AS DATE) - CAST({start} AS DATE)) * 86400',
+    }
+
+    def __init__(self, start, stop, **extra):
+        extra.setdefault('output_field', FloatField())
+        super(SecondsBetween, self).__init__(start, stop, **extra)
+
+    def as_sql(self, compiler, connection):
+        connection.ops.check_expression_support(self)
+        start_sql, start_params = compiler.compile(self.source_expressions[0])
+        stop_sql, stop_params = compiler.compile(self.source_expressions[1])
+        try:
+            template = self.templates[connection.vendor]
+        except KeyError:
+            raise NotImplementedError(
+                'SecondsBetween is not supported on {}'.format(connection.vendor))
+        # Both placeholders are positional in the SQL, so order params to match
+        if template.index('{start}') < template.index('{stop}'):
+            params = list(start_params) + list(stop_params)
+        else:
+            params = list(stop_params) + list(start_params)
+        return template.format(start=start_sql, stop=stop_sql), params
+
+
+BATCH_SIZE = 10000
+
+RUNNING_INDEX = 'entries_entry_running'
+
+
+def drop_running_index(apps, schema_editor):
+    """
+    SQLite adds and removes columns by copying the table, which loses the
+    partial index that migration 0005 created by hand. Drop it before the
+    copy and create it again afterwards
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(RUNNING_INDEX)))
+
+
+def create_running_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        quote_name = schema_editor.quote_name
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {index} ON {table} ({start}) WHERE {stop} IS NULL'.format(
+                index=quote_name(RUNNING_INDEX), table=quote_name('entries_entry'),
+                start=quote_name('start'), stop=quote_name('stop')))
+
+
+def backfill_durations(apps, schema_editor):
+    """
+    Fill in the duration of the finished entries, computed by the database
+    with one UPDATE per range of `BATCH_SIZE` ids so no entry is loaded and
+    no statement has to touch the whole table at once
+    """
+    Entry = apps.get_model('entries', 'Entry')
+    db = schema_editor.connection.alias
+    last_pk = Entry.objects.using(db).aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    for first in range(0, last_pk + 1, BATCH_SIZE):
+        Entry.objects.using(db).filter(
+            pk__gte=first, pk__lt=first + BATCH_SIZE, stop__isnull=False,
+        ).update(duration=SecondsBetween('start', 'stop'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0007_entry_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_running_index, create_running_index),
+        migrations.AddField(
+            model_name='entry',
+            name='duration',
+            field=models.FloatField(blank=True, null=True, editable=False),
+        ),
+        migrations.RunPython(create_running_index, drop_running_index),
+        migrations.RunPython(backfill_durations, migrations.RunPython.noop),
+    ]
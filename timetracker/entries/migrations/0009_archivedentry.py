@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0008_entry_duration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEntry',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('start', models.DateTimeField()),
+                ('stop', models.DateTimeField()),
+                ('description', models.CharField(max_length=200)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('project', models.ForeignKey(to='entries.Project')),
+            ],
+            options={
+                'verbose_name_plural': 'archived entries',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedentry',
+            index_together=set([('start', 'id'), ('project', 'start')]),
+        ),
+    ]
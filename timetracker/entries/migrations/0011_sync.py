@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+RUNNING_INDEX = 'entries_entry_running'
+
+
+def drop_running_index(apps, schema_editor):
+    """
+    SQLite loses the hand made partial index when AddField and
+    AlterIndexTogether copy the entry table, see migration 0008
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(RUNNING_INDEX)))
+
+
+def create_running_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        quote_name = schema_editor.quote_name
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {index} ON {table} ({start}) WHERE {stop} IS NULL'.format(
+                index=quote_name(RUNNING_INDEX), table=quote_name('entries_entry'),
+                start=quote_name('start'), stop=quote_name('stop')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entries', '0010_job'),
+    ]
+
+    operations = [
+        # Existing rows count as changed now, so clients pick them all up
+        # on their first sync
+        migrations.AddField(
+            model_name='client',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(drop_running_index, create_running_index),
+        migrations.AddField(
+            model_name='entry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='entry',
+            index_together=set([('start', 'id'), ('project', 'start'), ('updated_at', 'id')]),
+        ),
+        migrations.RunPython(create_running_index, drop_running_index),
+        migrations.AlterIndexTogether(
+            name='client',
+            index_together=set([('updated_at', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('updated_at', 'id')]),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='tombstone',
+            index_together=set([('deleted_at', 'id')]),
+        ),
+    ]
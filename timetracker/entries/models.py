@@ -1,34 +1,353 @@
+import time
+
 from django.db import models
 from django.utils import timezone
 
 
 class Client(models.Model):
     name = models.CharField(max_length=200)
+    # Set on every save, the sync endpoint hands out changes in this order
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [
+            ('updated_at', 'id'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class ProjectQuerySet(models.QuerySet):
+
+    def with_totals(self):
+        """
+        Annotate each project with its entry count, total tracked hours of
+        finished entries and the start of its latest entry, all computed in
+        a single grouped query
+        """
+        return self.annotate(
+            entry_count=models.Count('entry'),
+            total_hours=models.Sum(
+                models.F('entry__duration') / 3600.0, output_field=models.FloatField()),
+            last_entry=models.Max('entry__start'),
+        )
+
+
 class Project(models.Model):
     client = models.ForeignKey('Client', blank=True, null=True)
     name = models.CharField(max_length=200)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProjectQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ('updated_at', 'id'),
+        ]
 
     def __str__(self):
         return '<{}> {}'.format(self.client, self.name)
 
 
+# SQLite allows no more terms in a compound SELECT, see latest_per_project()
+MAX_UNION_TERMS = 500
+
+
+class EntryQuerySet(models.QuerySet):
+
+    def running(self):
+        """
+        Entries whose timer hasn't been stopped yet. Served by the partial
+        entries_entry_running index from migration 0005 so the cost depends on
+        the number of running entries, not on the size of the table
+        """
+        return self.filter(stop__isnull=True)
+
+    def first_overlap(self, start, stop=None):
+        """
+        Return the earliest entry whose time overlaps start..stop, or None.
+        A missing stop means the new entry is still running and overlaps
+        anything that hasn't ended by `start`.
+
+        Stored entries may overlap each other (imports, generated datasets
+        and batch timer starts don't check), so this asks for
+        `start < new stop AND (stop IS NULL OR stop > new start)` directly.
+        Filter by project first so the range on start uses the
+        (project, start) index
+        """
+        if stop is not None and stop <= start:
+            return None
+        entries = self.filter(models.Q(stop__isnull=True) | models.Q(stop__gt=start))
+        if stop is not None:
+            entries = entries.filter(start__lt=stop)
+        return entries.order_by('start', 'id').first()
+
+    def hours_per_period(self, bounds):
+        """
+        One row per project with the hours of the finished entries that
+        started in each period between consecutive datetimes of `bounds`,
+        as `hours_0`, `hours_1`, ..., and their `total_hours`.
+
+        A single grouped query over a start range: every period is a
+        conditional Sum of the stored duration, so no entry is loaded and the
+        periods follow local midnights whatever the database's time zone
+        """
+        periods = dict(
+            ('hours_{}'.format(i), models.Sum(
+                models.Case(
+                    models.When(start__gte=begin, start__lt=end, then=models.F('duration') / 3600.0),
+                    output_field=models.FloatField()),
+                output_field=models.FloatField()))
+            for i, (begin, end) in enumerate(zip(bounds, bounds[1:])))
+        return self.filter(
+            start__gte=bounds[0], start__lt=bounds[-1], duration__isnull=False,
+        ).values(
+            'project', 'project__name', 'project__client', 'project__client__name',
+        ).annotate(
+            total_hours=models.Sum(models.F('duration') / 3600.0, output_field=models.FloatField()),
+            **periods
+        ).order_by('project__client__name', 'project__name', 'project')
+
+    def latest_per_project(self, project_ids, limit):
+        """
+        Only the `limit` most recent entries of each of the projects. Used
+        with prefetch_related_objects() this caps how many entries a project
+        page loads no matter how long the projects have been running.
+
+        One query, a UNION ALL of a `WHERE project_id = ... ORDER BY start
+        DESC, id DESC LIMIT n` per project, each of which walks the
+        (project, start) index backwards and stops after `limit` rows, so
+        the cost grows with the number of projects, not with their history
+        """
+        project_ids = [int(pk) for pk in project_ids]
+        if not project_ids:
+            return self.none()
+        table = self.model._meta.db_table
+        latest = [
+            'SELECT id FROM (SELECT id FROM {table} WHERE project_id = {project_id}'
+            ' ORDER BY start DESC, id DESC LIMIT {limit})'.format(
+                table=table, project_id=project_id, limit=int(limit))
+            for project_id in project_ids
+        ]
+        while len(latest) > MAX_UNION_TERMS:
+            latest = [
+                'SELECT id FROM ({})'.format(' UNION ALL '.join(latest[i:i + MAX_UNION_TERMS]))
+                for i in range(0, len(latest), MAX_UNION_TERMS)
+            ]
+        return self.extra(where=[
+            '{table}.id IN ({latest})'.format(table=table, latest=' UNION ALL '.join(latest))
+        ]).order_by('-start', '-id')
+
+
 # Create your models here.
 class Entry(models.Model):
     start = models.DateTimeField(default=timezone.now)
     stop = models.DateTimeField(blank=True, null=True)
     project = models.ForeignKey('Project')
     description = models.CharField(max_length=200)
+    # Seconds from start to stop, kept in sync by save() so reports can sum a
+    # column instead of computing it per row. NULL while the entry is running
+    duration = models.FloatField(blank=True, null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = EntryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'entries'
+        index_together = [
+            # Backs the keyset pagination of the entry list, see pagination.py,
+            # and any other filter or ordering on start alone
+            ('start', 'id'),
+            # Entries of a project within a time range
+            ('project', 'start'),
+            # Changes in the order the sync endpoint reads them
+            ('updated_at', 'id'),
+        ]
 
     def __str__(self):
         return '[{} - {}] ({}) {}'.format(self.start, self.stop, self.project.name, self.description)
 
     def is_finished(self):
         return self.stop is not None
+
+    def update_duration(self):
+        """
+        Recompute the stored duration. save() does this, code that saves
+        entries some other way, such as bulk_create, has to call it itself
+        """
+        if self.stop is None:
+            self.duration = None
+        else:
+            self.duration = (self.stop - self.start).total_seconds()
+
+    def save(self, *args, **kwargs):
+        self.update_duration()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'duration', 'updated_at'}
+        super(Entry, self).save(*args, **kwargs)
+
+
+class ArchivedEntry(models.Model):
+    """
+    A finished entry moved out of the Entry table by the archive_entries
+    command, under its original id, so that the hot table and its indexes
+    only hold recent work. Views read Entry alone; exports and the timesheet
+    include these rows when asked to, and the daily rollups always count
+    them
+    """
+    id = models.IntegerField(primary_key=True)
+    start = models.DateTimeField()
+    stop = models.DateTimeField()
+    project = models.ForeignKey('Project')
+    description = models.CharField(max_length=200)
+    duration = models.FloatField(blank=True, null=True)
+
+    objects = EntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'archived entries'
+        index_together = [
+            ('start', 'id'),
+            ('project', 'start'),
+        ]
+
+    def __str__(self):
+        return '[{} - {}] ({}) {}'.format(self.start, self.stop, self.project.name, self.description)
+
+
+class Tombstone(models.Model):
+    """
+    Left behind by a deleted client, project or entry, so the sync endpoint
+    can tell clients to drop their copy. Written by a post_delete handler,
+    which also sees the rows removed by a cascading delete
+    """
+    # The model_name of the deleted object's model
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [
+            ('deleted_at', 'id'),
+        ]
+
+    def __str__(self):
+        return '{} {} deleted at {}'.format(self.model, self.object_id, self.deleted_at)
+
+
+class DailyRollupQuerySet(models.QuerySet):
+
+    def per_client(self):
+        """
+        Roll the per project rows up further into one row per client and day
+        """
+        return self.values(
+            'day', 'project__client', 'project__client__name',
+        ).annotate(
+            hours=models.Sum(models.F('seconds') / 3600.0, output_field=models.FloatField()),
+            entry_count=models.Sum('entry_count'),
+        ).order_by('day', 'project__client__name')
+
+
+class DailyRollup(models.Model):
+    """
+    Time tracked per project and day, kept up to date from Entry saves and
+    deletes by the signal handlers in signals.py (see rollups.py) and
+    regenerated from scratch with the rebuild_rollups management command.
+
+    Reports read these pre-aggregated rows instead of scanning Entry. Entries
+    that cross midnight are split between the days they span, and entry_count
+    counts them on each of those days, so it's the number of entries that
+    tracked time on the day rather than of those started on it. Running
+    entries are only counted once they are stopped
+    """
+    project = models.ForeignKey('Project')
+    day = models.DateField()
+    seconds = models.FloatField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    objects = DailyRollupQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [('project', 'day')]
+        index_together = [('day', 'project')]
+
+    def __str__(self):
+        return '[{}] ({}) {:.2f}h'.format(self.day, self.project.name, self.hours)
+
+    @property
+    def hours(self):
+        return self.seconds / 3600.0
+
+
+class Job(models.Model):
+    """
+    A unit of background work, such as an import or an export, picked up by
+    the run_worker command. See jobs.py
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    REPORT_INTERVAL = 1.0
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    params = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Not before this time, pushed back after a failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    done = models.IntegerField(default=0)
+    total = models.IntegerField(blank=True, null=True)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    # Path of a file the job produced, relative to JOB_FILES_DIR
+    output = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = [
+            # The worker's "next job" query
+            ('status', 'run_after'),
+        ]
+
+    def __str__(self):
+        return '#{} {} ({})'.format(self.pk, self.kind, self.status)
+
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100, 100 * self.done // self.total)
+
+    def report(self, done, total=None, message=None, force=False):
+        """
+        Store how far the job got, at most once per REPORT_INTERVAL seconds
+        unless forced, so a task can call this for every row it handles
+        """
+        now = time.time()
+        if not force and now - getattr(self, '_reported', 0) < self.REPORT_INTERVAL:
+            return
+        self._reported = now
+        self.done = done
+        updates = {'done': done}
+        if total is not None:
+            self.total = updates['total'] = total
+        if message is not None:
+            self.message = updates['message'] = message[:200]
+        Job.objects.filter(pk=self.pk).update(**updates)
@@ -0,0 +1,55 @@
+import heapq
+
+from django.db.models import Q
+
+
+def by_project_and_start(queryset, batch_size=1000):
+    """
+    Yield (project_id, (id, start, stop)) of every entry by project, then in
+    start order, `batch_size` rows per query. Pages by the (project, start)
+    index instead of using OFFSET
+    """
+    rows = queryset.order_by('project', 'start', 'id').values_list('project_id', 'id', 'start', 'stop')
+    last = None
+    while True:
+        page = rows
+        if last is not None:
+            project_id, pk, start = last[:3]
+            page = rows.filter(
+                Q(project_id__gt=project_id) |
+                Q(project_id=project_id, start__gt=start) |
+                Q(project_id=project_id, start=start, id__gt=pk))
+        batch = list(page[:batch_size])
+        for row in batch:
+            yield row[0], row[1:]
+        if len(batch) < batch_size:
+            return
+        last = batch[-1]
+
+
+def find_overlaps(queryset, batch_size=1000):
+    """
+    Yield a (earlier, later) pair of (id, start, stop) tuples for every two
+    entries of the same project in the queryset whose times overlap, the
+    overlaps EntryForm rejects. Running entries overlap everything of their
+    project that starts after them.
+
+    One pass per project over its entries in start order, keeping a heap of
+    the entries that haven't ended yet by their end time: O(n log n) plus
+    the number of pairs found, instead of comparing every entry with every
+    other one
+    """
+    active = []
+    current_project = None
+    for project_id, row in by_project_and_start(queryset, batch_size):
+        if project_id != current_project:
+            active = []
+            current_project = project_id
+        pk, start, stop = row
+        while active and active[0][0][0] == 0 and active[0][0][1] <= start:
+            heapq.heappop(active)
+        for key, other in active:
+            yield other, row
+        # Running entries sort after every end time so they are never dropped
+        key = (0, stop, pk) if stop is not None else (1, pk)
+        heapq.heappush(active, (key, row))
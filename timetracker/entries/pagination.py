@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.http import Http404
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(entry):
+    """
+    Turn the (start, id) position of an entry into an opaque cursor string
+    """
+    return format_cursor(entry.start, entry.pk)
+
+
+def format_cursor(start, pk):
+    delta = start - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return '{}-{}'.format(micros, pk)
+
+
+def decode_cursor(cursor):
+    """
+    Turn a cursor string back into a (start, id) tuple. Malformed cursors are
+    treated like an out of range page number would be by Django's Paginator
+    """
+    try:
+        micros, pk = cursor.rsplit('-', 1)
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        raise Http404('Invalid cursor')
+
+
+class KeysetPage(object):
+    """
+    One page of a keyset paginated queryset, newest entries first.
+
+    Unlike Django's Paginator we never COUNT(*) the table or OFFSET into it:
+    every page is a range scan on the (start, id) index starting from the
+    cursor, so page 1000 costs the same as page 1.
+
+    Like a queryset the page is lazy: nothing is fetched until the entries
+    or the links are used, so a cached template fragment costs no query.
+    """
+    def __init__(self, queryset, per_page, before=None, after=None, params=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.before = before
+        self.after = after
+        self.params = params or {}
+
+    @cached_property
+    def _page(self):
+        """
+        Fetch the page, returning (object_list, has_newer, has_older)
+        """
+        per_page = self.per_page
+        queryset = self.queryset
+
+        if self.after:
+            start, pk = self.after
+            # The redundant start__gte bound gives the database a range to seek to
+            # on the (start, id) index instead of evaluating the OR for every row
+            queryset = queryset.filter(start__gte=start).filter(Q(start__gt=start) | Q(pk__gt=pk))
+            rows = list(queryset.order_by('start', 'pk')[:per_page + 1])
+            has_newer = len(rows) > per_page
+            rows = rows[:per_page]
+            rows.reverse()
+            return rows, has_newer and bool(rows), bool(rows)
+
+        if self.before:
+            start, pk = self.before
+            queryset = queryset.filter(start__lte=start).filter(Q(start__lt=start) | Q(pk__lt=pk))
+
+        rows = list(queryset.order_by('-start', '-pk')[:per_page + 1])
+        has_older = len(rows) > per_page
+        rows = rows[:per_page]
+        return rows, bool(self.before) and bool(rows), has_older
+
+    @property
+    def object_list(self):
+        return self._page[0]
+
+    @property
+    def has_newer(self):
+        return self._page[1]
+
+    @property
+    def has_older(self):
+        return self._page[2]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def querystring(self):
+        """
+        The page's extra parameters, such as the date window, without a cursor
+        """
+        return self._querystring() if self.params else ''
+
+    @property
+    def cache_key(self):
+        """
+        The cursor and the extra parameters in a canonical form, for keying a
+        cached copy of the page. Other query string parameters don't change
+        the page, so they don't get a copy of their own
+        """
+        params = sorted(self.params.items())
+        if self.after:
+            params.append(('after', format_cursor(*self.after)))
+        elif self.before:
+            params.append(('before', format_cursor(*self.before)))
+        return urlencode(params)
+
+    def _querystring(self, **cursor):
+        params = dict(self.params)
+        params.update(cursor)
+        return '?' + urlencode(params)
+
+    @property
+    def newer_querystring(self):
+        if self.has_newer:
+            return self._querystring(after=encode_cursor(self.object_list[0]))
+
+    @property
+    def older_querystring(self):
+        if self.has_older:
+            return self._querystring(before=encode_cursor(self.object_list[-1]))
+
+
+def paginate_entries(queryset, data, per_page, params=None):
+    """
+    Return a KeysetPage for the given entry queryset.
+
+    `data` is the request's GET QueryDict which may contain a `before` cursor
+    (show entries older than the cursor) or an `after` cursor (show entries
+    newer than the cursor). `params` are extra query string parameters, such
+    as the date window, that should be carried over into the page links.
+    """
+    before = data.get('before')
+    after = data.get('after')
+    return KeysetPage(
+        queryset, per_page, params=params,
+        # Decode straight away so a bad cursor 404s even if the page is cached
+        before=decode_cursor(before) if before and not after else None,
+        after=decode_cursor(after) if after else None)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that doesn't COUNT(*) a whole big table.
+
+    Counting walks every row, which on a table with millions of entries takes
+    longer than fetching the page itself. A filtered or searched queryset is
+    counted exactly, so every page of the result can be reached. An
+    unfiltered one is counted up to `exact_count_limit` rows, beyond that
+    the table size as estimated by the database is reported instead. The
+    estimate can be a little off either way, so pages past it are still
+    served, empty if there are no rows left
+    """
+    exact_count_limit = 10000
+    is_estimate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.has_filters():
+            return queryset.count()
+        count = queryset[:self.exact_count_limit + 1].count()
+        if count <= self.exact_count_limit:
+            return count
+        self.is_estimate = True
+        return max(count, estimate_table_size(queryset))
+
+    def validate_number(self, number):
+        try:
+            return super(EstimatedCountPaginator, self).validate_number(number)
+        except EmptyPage:
+            if self.is_estimate and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.is_estimate:
+            return super(EstimatedCountPaginator, self).page(number)
+        # Don't cut the last page off at the estimated count
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+def estimate_table_size(queryset):
+    """
+    Cheaply estimate the number of rows in the queryset's table
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    # Auto incremented ids are a good upper bound that the primary key index
+    # answers without a scan; deleted rows make it overestimate a little
+    return queryset.model._default_manager.using(queryset.db).aggregate(
+        last_id=Max('pk'))['last_id'] or 0
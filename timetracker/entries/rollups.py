@@ -0,0 +1,112 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .batching import chunked
+from .models import ArchivedEntry, DailyRollup, Entry
+
+
+def split_by_day(start, stop):
+    """
+    Yield (day, seconds) for each local calendar day the span from start to
+    stop touches. A running entry (no stop) hasn't tracked anything yet
+    """
+    if stop is None or stop <= start:
+        return
+    start = timezone.localtime(start)
+    stop = timezone.localtime(stop)
+    day = start.date()
+    while True:
+        next_day = day + timedelta(days=1)
+        midnight = timezone.make_aware(datetime.combine(next_day, time.min))
+        segment_stop = min(stop, midnight)
+        yield day, (segment_stop - start).total_seconds()
+        if segment_stop >= stop:
+            return
+        start, day = segment_stop, next_day
+
+
+def add_span(totals, project_id, start, stop):
+    """
+    Add one entry's time to a {(project_id, day): [seconds, count]} dict.
+    The count is of the entries that tracked time on the day, so an entry
+    crossing midnight counts on each day it spans
+    """
+    for day, seconds in split_by_day(start, stop):
+        total = totals[project_id, day]
+        total[0] += seconds
+        total[1] += 1
+
+
+def span_totals(spans):
+    """
+    Sum up (project_id, start, stop) spans into per (project, day) totals
+    """
+    totals = defaultdict(lambda: [0.0, 0])
+    for project_id, start, stop in spans:
+        add_span(totals, project_id, start, stop)
+    return totals
+
+
+def apply_totals(totals, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) span_totals() from the rollup rows
+    """
+    for (project_id, day), (seconds, count) in totals.items():
+        delta = dict(seconds=F('seconds') + sign * seconds,
+                     entry_count=F('entry_count') + sign * count)
+        rows = DailyRollup.objects.filter(project_id=project_id, day=day)
+        if rows.update(**delta):
+            if sign < 0:
+                rows.filter(entry_count__lte=0).delete()
+            continue
+        if sign < 0:
+            # Nothing to remove from, the rollups were out of date already
+            continue
+        try:
+            with transaction.atomic():
+                DailyRollup.objects.create(
+                    project_id=project_id, day=day, seconds=seconds, entry_count=count)
+        except IntegrityError:
+            # Another request created the row in the meantime
+            rows.update(**delta)
+
+
+def apply_span(project_id, start, stop, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) one entry's time from the rollup rows
+    """
+    apply_totals(span_totals([(project_id, start, stop)]), sign)
+
+
+def rebuild(batch_size=1000, stdout=None):
+    """
+    Regenerate all rollup rows from the entries, archived ones included.
+    Entries are read in primary key batches of `batch_size` so memory only
+    grows with the number of (project, day) totals, which are then bulk
+    inserted in batches as large as the backend allows
+    """
+    totals = span_totals([])
+    for model in (ArchivedEntry, Entry):
+        entries = model.objects.filter(stop__isnull=False).values_list(
+            'pk', 'project_id', 'start', 'stop')
+        for batch in chunked(entries, batch_size):
+            for pk, project_id, start, stop in batch:
+                add_span(totals, project_id, start, stop)
+            if stdout:
+                stdout.write('Read {} up to id {}'.format(
+                    model._meta.verbose_name_plural, batch[-1][0]))
+
+    rows = [
+        DailyRollup(project_id=project_id, day=day, seconds=seconds, entry_count=count)
+        for (project_id, day), (seconds, count) in totals.items()
+    ]
+    with transaction.atomic():
+        DailyRollup.objects.all().delete()
+        # No batch_size, a larger one than the backend allows per INSERT,
+        # like the 999 variables of older SQLite versions, would be used as is
+        DailyRollup.objects.bulk_create(rows)
+    return len(rows)
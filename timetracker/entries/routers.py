@@ -0,0 +1,114 @@
+"""
+Send reads to the read replicas listed in the DATABASE_REPLICAS setting and
+writes to the default database, the primary.
+
+Once a thread writes it is pinned to the primary, so everything it reads
+afterwards includes its own writes. The writes are recorded by the cursors
+of the primary, see WriteRecordingCursor, as Django also asks the router
+for the write database of plain reads, like those of get_or_create() or
+of the related managers. ReplicaPinningMiddleware unpins at the start of
+every request and carries the pin over to the requests of the
+next few seconds with a cookie, which covers the GET that follows a POST
+while the replicas catch up
+"""
+import random
+import re
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    _state.pinned = True
+
+
+def record_write():
+    pin_to_primary()
+    _state.wrote = True
+
+
+def unpin():
+    _state.pinned = False
+    _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def wrote():
+    """
+    Whether the current thread wrote since it was last unpinned
+    """
+    return getattr(_state, 'wrote', False)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        # Reads inside a transaction on the primary belong to the transaction
+        if not replicas or is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in get_replicas():
+            return False
+        return None
+
+
+WRITE_SQL = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+class WriteRecordingCursor(object):
+    """
+    Wrap a driver cursor of the primary to record_write() when it runs an
+    INSERT, UPDATE or DELETE
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, params=None):
+        if WRITE_SQL.match(sql):
+            record_write()
+        if params is None:
+            return self.cursor.execute(sql)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        if WRITE_SQL.match(sql):
+            record_write()
+        return self.cursor.executemany(sql, param_list)
+
+
+def record_writes(connection):
+    """
+    Make the connection wrap its driver cursors in WriteRecordingCursors.
+    Below the CursorWrappers of Django, so this keeps working while the
+    metrics time the queries, see metrics.time_queries()
+    """
+    create_cursor = type(connection).create_cursor
+    connection.create_cursor = lambda: WriteRecordingCursor(create_cursor(connection))
@@ -0,0 +1,171 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .batching import chunked
+from .models import Entry
+
+
+# SQLite FTS5 index over Entry.description, created by migration 0007 where
+# the SQLite build supports FTS5. Its rowid is the entry's id
+FTS_TABLE = 'entries_entry_fts'
+
+# Markers FTS5 puts around matched terms, swapped for <mark> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+_available = {}
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """
+    Whether the full text index exists on the given database
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available:
+        _available[key] = FTS_TABLE in connection.introspection.table_names()
+    return _available[key]
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query that matches entries containing all of
+    its words, the last one as a prefix so results show up while typing.
+    Every word is quoted so FTS5 syntax in user input is taken literally
+    """
+    words = re.findall(r'\w+', query, re.UNICODE)
+    if not words:
+        return None
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(text, words):
+    """
+    Escape text and <mark> the given words, for backends without FTS5
+    """
+    if not words:
+        return escape(text)
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE | re.UNICODE)
+    return mark_safe(pattern.sub(lambda match: '<mark>{}</mark>'.format(match.group(0)), escape(text)))
+
+
+def markup_snippet(snippet):
+    return mark_safe(escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def search_entries(query, limit=50, using=DEFAULT_DB_ALIAS):
+    """
+    Return up to `limit` entries matching `query`, best match first, each
+    with a `highlighted` attribute holding the description with the matches
+    marked up.
+
+    With FTS5 this is an index lookup ranked by bm25. Elsewhere it falls back
+    to a case insensitive substring match per word, newest first, which has
+    to scan the table
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+
+    if not is_available(using):
+        words = re.findall(r'\w+', query, re.UNICODE)
+        entries = Entry.objects.using(using).select_related('project__client')
+        for word in words:
+            entries = entries.filter(description__icontains=word)
+        entries = list(entries.order_by('-start', '-id')[:limit])
+        for entry in entries:
+            entry.highlighted = highlight(entry.description, words)
+        return entries
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid, highlight({table}, 0, %s, %s) FROM {table}'
+            ' WHERE {table} MATCH %s ORDER BY bm25({table}) LIMIT %s'.format(table=FTS_TABLE),
+            [MATCH_START, MATCH_END, expression, limit])
+        hits = cursor.fetchall()
+    entries = Entry.objects.using(using).select_related('project__client').in_bulk(
+        [pk for pk, snippet in hits])
+    results = []
+    for pk, snippet in hits:
+        if pk in entries:
+            entry = entries[pk]
+            entry.highlighted = markup_snippet(snippet)
+            results.append(entry)
+    return results
+
+
+def filter_matching(queryset, query):
+    """
+    Restrict an entry queryset to the entries whose description matches
+    `query` through the full text index. Only call when is_available()
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return queryset
+    return queryset.extra(where=[
+        '{}.id IN (SELECT rowid FROM {table} WHERE {table} MATCH %s)'.format(
+            Entry._meta.db_table, table=FTS_TABLE)
+    ], params=[expression])
+
+
+def index_entries(queryset, using=DEFAULT_DB_ALIAS):
+    """
+    (Re)index the descriptions of the entries in the queryset
+    """
+    if not is_available(using):
+        return
+    rows = list(queryset.values_list('pk', 'description'))
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            'DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [(pk,) for pk, description in rows])
+        cursor.executemany(
+            'INSERT INTO {} (rowid, description) VALUES (%s, %s)'.format(FTS_TABLE), rows)
+
+
+def index_entry(entry, using=DEFAULT_DB_ALIAS):
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [entry.pk])
+        cursor.execute(
+            'INSERT INTO {} (rowid, description) VALUES (%s, %s)'.format(FTS_TABLE),
+            [entry.pk, entry.description])
+
+
+def unindex_entry(entry, using=DEFAULT_DB_ALIAS):
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [entry.pk])
+
+
+def unindex_entries(ids, using=DEFAULT_DB_ALIAS):
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [(pk,) for pk in ids])
+
+
+def rebuild(batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Empty the index and fill it again from all entries, `batch_size` entries
+    at a time. Returns the number of entries indexed
+    """
+    if not is_available(using):
+        return 0
+    entries = Entry.objects.using(using).values_list('pk', 'description')
+    count = 0
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+        for rows in chunked(entries, batch_size):
+            cursor.executemany(
+                'INSERT INTO {} (rowid, description) VALUES (%s, %s)'.format(FTS_TABLE), rows)
+            count += len(rows)
+    return count
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import live, rollups, search
+from .routers import record_writes
+from .caching import bump_generation
+from .choices import invalidate_choices, CLIENT_CHOICES_KEY, PROJECT_CHOICES_KEY
+from .models import Client, Entry, Project, Tombstone
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client_choices(sender, **kwargs):
+    # Project choice labels include the client name
+    invalidate_choices(CLIENT_CHOICES_KEY, PROJECT_CHOICES_KEY)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_choices(sender, **kwargs):
+    invalidate_choices(PROJECT_CHOICES_KEY)
+
+
+@receiver(pre_save, sender=Entry)
+def remember_entry_span(sender, instance, raw=False, **kwargs):
+    # Remember what the entry contributed to the rollups before this save
+    instance._rollup_span = None
+    if instance.pk and not raw:
+        instance._rollup_span = Entry.objects.filter(pk=instance.pk).values_list(
+            'project_id', 'start', 'stop').first()
+
+
+@receiver(post_save, sender=Entry)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_span', None)
+    current = (instance.project_id, instance.start, instance.stop)
+    if previous == current:
+        return
+    if previous:
+        rollups.apply_span(*previous, sign=-1)
+    rollups.apply_span(*current)
+
+
+@receiver(post_delete, sender=Entry)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.apply_span(instance.project_id, instance.start, instance.stop, sign=-1)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def bump_list_generation(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Entry)
+def leave_tombstone(sender, instance, **kwargs):
+    # Tells sync clients to drop their copy, see sync.py
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Entry)
+def index_entry_description(sender, instance, raw=False, **kwargs):
+    search.index_entry(instance)
+
+
+@receiver(post_delete, sender=Entry)
+def unindex_entry_description(sender, instance, **kwargs):
+    search.unindex_entry(instance)
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def notify_running_timers(sender, instance, using, **kwargs):
+    # Only starts, stops and edits of running timers concern the dashboard
+    previous = getattr(instance, '_rollup_span', None)
+    if instance.stop is None or (previous and previous[2] is None):
+        live.entry_changed(using)
+
+
+@receiver(request_finished)
+def notify_running_timers_after_request(sender, **kwargs):
+    live.notify_pending()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Run the PRAGMAs of the SQLITE_PRAGMAS setting, a list of (name, value)
+    pairs, on every new SQLite connection. See settings_production.py
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', ()):
+        # Straight on the driver's connection, PRAGMAs can't take parameters
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
+
+
+@receiver(connection_created)
+def record_primary_writes(sender, connection, **kwargs):
+    # Pins the thread to the primary, see routers.py
+    if connection.alias == DEFAULT_DB_ALIAS:
+        record_writes(connection)
@@ -0,0 +1,132 @@
+"""
+Measure what a fresh worker spends before and on its first requests, see
+the startup_profile command, which runs this in a new process:
+
+    python -m entries.startup [--warm-up]
+
+prints as JSON the import time of every module imported by django.setup(),
+the time of each warm-up step and, for every page of entries.urls without
+arguments, the time of the first and of a second request.
+
+Python 3.6 has no -X importtime, so imports are timed by a finder put in
+front of sys.meta_path which wraps the exec_module() of each loader
+"""
+import json
+import sys
+import time
+
+
+class ImportTimer(object):
+    """
+    Meta path finder recording {module: (cumulative, self)} import times in
+    seconds, self excluding the modules imported while it ran
+    """
+    def __init__(self):
+        self.times = {}
+        # Time spent importing children, for each import in progress
+        self.stack = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # Built-in and frozen modules are loaded by a class shared by all of
+        # them, and cost next to nothing
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+            loader.exec_module = self.timed(fullname, loader.exec_module)
+        return spec
+
+    def timed(self, name, exec_module):
+        def wrapper(module):
+            self.stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                children = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.times[name] = (elapsed, elapsed - children)
+        return wrapper
+
+
+def page_urls():
+    """
+    Yield (name, path) of the entries pages taking no arguments
+    """
+    from django.core.urlresolvers import RegexURLPattern, reverse
+    from . import urls
+
+    for pattern in urls.urlpatterns:
+        if isinstance(pattern, RegexURLPattern) and pattern.name and not pattern.regex.groups:
+            yield pattern.name, reverse(pattern.name)
+
+
+def time_request(client, path):
+    """
+    Return (status, seconds) of a GET. A streaming response is closed
+    without reading it, it could go on for minutes
+    """
+    started = time.perf_counter()
+    try:
+        response = client.get(path)
+    except Exception as e:
+        return type(e).__name__, time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    response.close()
+    return response.status_code, elapsed
+
+
+def profile(warm_up=False):
+    timer = ImportTimer()
+    timer.install()
+    started = time.perf_counter()
+    import django
+    django.setup()
+    setup = time.perf_counter() - started
+    timer.uninstall()
+
+    from django.conf import settings
+    from django.core.urlresolvers import resolve
+    from django.test import Client
+
+    warm_up_steps = []
+    if warm_up:
+        from .warmup import warm_up as run_warm_up
+        warm_up_steps = run_warm_up()
+
+    # The test client asks for this host, which the production profile
+    # doesn't allow
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+    client = Client()
+    requests = []
+    for name, path in page_urls():
+        status, first = time_request(client, path)
+        status, repeat = time_request(client, path)
+        requests.append((name, path, resolve(path).func.__module__, status, first, repeat))
+
+    return {
+        'setup': setup,
+        'imports': sorted(
+            ((name,) + times for name, times in timer.times.items()),
+            key=lambda row: row[1], reverse=True),
+        'warm_up': warm_up_steps,
+        'requests': requests,
+    }
+
+
+if __name__ == '__main__':
+    json.dump(profile(warm_up='--warm-up' in sys.argv[1:]), sys.stdout)
@@ -0,0 +1,8 @@
+// Set active class on navigation item depending on page url
+$('#navbar ul.navbar-nav li').each(function() {
+  if ($(this).find('a').attr('href') === window.location.pathname) {
+    $(this).addClass('active');
+  } else {
+    $(this).removeClass('active');
+  }
+});
@@ -0,0 +1,49 @@
+"""
+Static files storage of the production profile, see settings_production.py
+"""
+import gzip
+import io
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+class GzipManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage, which collects every file under a name with
+    a hash of its content, that also writes a gzipped copy next to the
+    hashed text files, for StaticFilesMiddleware to send to clients which
+    accept it without compressing on every request
+    """
+    compress_extensions = ('.css', '.js', '.json', '.map', '.svg', '.eot', '.ttf', '.txt', '.html')
+
+    def post_process(self, paths, dry_run=False, **options):
+        for result in super(GzipManifestStaticFilesStorage, self).post_process(
+                paths, dry_run=dry_run, **options):
+            yield result
+        if dry_run:
+            return
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if os.path.splitext(hashed_name)[1].lower() in self.compress_extensions:
+                compressed_name = self.compress(hashed_name)
+                if compressed_name:
+                    yield hashed_name, compressed_name, True
+
+    def compress(self, name):
+        """
+        Write name.gz and return its name, or None when gzip doesn't make
+        the file smaller
+        """
+        with self.open(name) as original:
+            content = original.read()
+        buffer = io.BytesIO()
+        # A fixed mtime gives the same bytes for the same file on every run
+        with gzip.GzipFile(filename='', mode='wb', fileobj=buffer, mtime=0) as compressed:
+            compressed.write(content)
+        if len(buffer.getvalue()) >= len(content):
+            return None
+        compressed_name = name + '.gz'
+        if self.exists(compressed_name):
+            self.delete(compressed_name)
+        return self._save(compressed_name, ContentFile(buffer.getvalue()))
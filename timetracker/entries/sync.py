@@ -0,0 +1,113 @@
+"""
+Incremental sync for the desktop and mobile clients, see the sync view.
+
+Every client, project and entry row has an updated_at time set on save and
+every deleted one leaves a Tombstone. A client passes the cursor of its
+last sync and gets the rows changed and deleted since, oldest change
+first, in pages of bounded size. Each of the four streams is walked by
+keyset on its (time, id) index, so a sync costs time in proportion to the
+number of changes, not to the size of the tables.
+
+Entries moved to the archive are not reported as deleted: they still
+exist, and finished entries old enough to be archived don't change.
+"""
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Client, Entry, Project, Tombstone
+from .pagination import EPOCH
+
+
+PAGE_SIZE = 500
+
+MAX_PAGE_SIZE = 2000
+
+# (response key, model, time field, fields of a row)
+STREAMS = (
+    ('clients', Client, 'updated_at', ('id', 'name', 'updated_at')),
+    ('projects', Project, 'updated_at', ('id', 'name', 'client', 'updated_at')),
+    ('entries', Entry, 'updated_at', (
+        'id', 'project', 'start', 'stop', 'description', 'duration', 'updated_at')),
+    ('deleted', Tombstone, 'deleted_at', ('id', 'model', 'object_id', 'deleted_at')),
+)
+
+
+def to_micros(value):
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def encode_cursor(positions):
+    """
+    Turn the last (time, id) position of every stream into an opaque cursor
+    """
+    text = '.'.join('{}-{}'.format(to_micros(time), pk) for time, pk in positions)
+    return base64.urlsafe_b64encode(text.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Turn a cursor back into positions, raising ValueError if it's malformed.
+    No cursor starts from the beginning
+    """
+    if not cursor:
+        return [(EPOCH, 0)] * len(STREAMS)
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('.')
+        positions = []
+        for part in parts:
+            micros, pk = part.split('-')
+            positions.append((EPOCH + timedelta(microseconds=int(micros)), int(pk)))
+    except (TypeError, ValueError, UnicodeError, OverflowError):
+        raise ValueError('Invalid cursor')
+    if len(positions) != len(STREAMS):
+        raise ValueError('Invalid cursor')
+    return positions
+
+
+def changes(cursor=None, limit=PAGE_SIZE):
+    """
+    Return a page of at most `limit` rows changed after the cursor:
+    {"clients": [...], "projects": [...], "entries": [...], "deleted": [...],
+    "cursor": "...", "more": true/false}, where "deleted" holds
+    {"model": "entry", "id": 12, ...} items. Keep requesting with the returned
+    cursor while "more" is true.
+
+    Rows saved in the last SYNC_SETTLE_SECONDS are left for the next sync: a
+    transaction that is still open could commit a row with an earlier time
+    after this page was read, and the cursor would already be past it. For
+    the same reason this always reads the primary database, not a replica
+    """
+    positions = decode_cursor(cursor)
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5))
+    page = {}
+    remaining = limit
+    more = False
+    for index, (key, model, time_field, fields) in enumerate(STREAMS):
+        page[key] = []
+        if remaining == 0:
+            more = True
+            continue
+        time, pk = positions[index]
+        rows = list(model.objects.using(DEFAULT_DB_ALIAS).filter(
+            Q(**{time_field + '__gt': time}) | Q(**{time_field: time, 'id__gt': pk}),
+            **{time_field + '__lt': horizon}
+        ).order_by(time_field, 'id').values(*fields)[:remaining + 1])
+        if len(rows) > remaining:
+            rows = rows[:remaining]
+            more = True
+        if rows:
+            positions[index] = (rows[-1][time_field], rows[-1]['id'])
+        if model is Tombstone:
+            rows = [{'model': row['model'], 'id': row['object_id'], 'deleted_at': row['deleted_at']}
+                    for row in rows]
+        page[key] = rows
+        remaining -= len(rows)
+    page['cursor'] = encode_cursor(positions)
+    page['more'] = more
+    return page
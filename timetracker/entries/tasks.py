@@ -0,0 +1,82 @@
+"""
+The background jobs of the entries app, run by the run_worker command
+"""
+import io
+import os
+
+from . import rollups, search
+from .exporter import csv_lines, json_lines
+from .forms import EntryExportForm
+from .importer import EntryImporter
+from .jobs import JobFailed, file_path, task
+
+
+def remove_upload(job, path, **params):
+    path = file_path(path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@task('import_entries', cleanup=remove_upload)
+def import_entries(job, path, create_missing=False, batch_size=1000):
+    """
+    Import an uploaded CSV file saved as `path` in JOB_FILES_DIR, then
+    delete it. A failed job deletes it once it's out of attempts
+    """
+    with io.open(file_path(path), 'rb') as f:
+        total = sum(1 for line in f) - 1
+    job.report(0, total, force=True)
+    with io.open(file_path(path), encoding='utf-8', newline='') as lines:
+        importer = EntryImporter(batch_size=batch_size, create_missing=create_missing)
+        result = importer.run(lines, progress=lambda line, result: job.report(
+            line - 1, message='Imported {} entries'.format(result.created)))
+    if result.stopped_at:
+        raise JobFailed('Line {} is not UTF-8 encoded, the {} entries before it were imported'.format(
+            result.stopped_at, result.created))
+    # Only after a successful run, a retry needs the file again
+    remove_upload(job, path)
+    job.report(total, force=True)
+    return {
+        'created': result.created,
+        'error_count': result.error_count,
+        'errors': result.errors,
+    }
+
+
+EXPORT_LINES = {
+    'csv': csv_lines,
+    'json': json_lines,
+}
+
+
+@task('export_entries')
+def export_entries(job, format, filters):
+    """
+    Write the entries matching the export form `filters` to a file in
+    JOB_FILES_DIR
+    """
+    form = EntryExportForm(filters)
+    if not form.is_valid():
+        raise JobFailed(form.errors.as_text())
+    querysets = form.entry_querysets()
+    total = sum(queryset.count() for queryset in querysets)
+    job.report(0, total, force=True)
+    name = 'export-{}.{}'.format(job.pk, format)
+    with io.open(file_path(name), 'w', encoding='utf-8', newline='') as f:
+        for count, line in enumerate(EXPORT_LINES[format](*querysets)):
+            f.write(line)
+            job.report(count)
+    job.report(total, force=True)
+    return {'output': name, 'entries': total}
+
+
+@task('rebuild_rollups')
+def rebuild_rollups(job, batch_size=1000):
+    job.report(0, message='Rebuilding the daily rollups', force=True)
+    return {'rows': rollups.rebuild(batch_size=batch_size)}
+
+
+@task('rebuild_search_index')
+def rebuild_search_index(job, batch_size=1000):
+    job.report(0, message='Rebuilding the search index', force=True)
+    return {'entries': search.rebuild(batch_size=batch_size)}
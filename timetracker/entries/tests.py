@@ -1,10 +1,53 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time as time_module
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, reset_queries
+from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from io import StringIO
 
+from . import jobs, live, search, startup
+from .batching import chunked
+from .caching import get_generation
+from .choices import PROJECT_CHOICES_KEY
+from .dataset import DatasetGenerator
+from .exporter import iter_rows
 from .factories import (ClientFactory, ProjectFactory, EntryFactory)
-from .forms import (ClientForm, ProjectForm, EntryForm)
-from .models import (Client, Project, Entry)
+from .forms import (ClientForm, ProjectForm, EntryForm, start_of_day)
+from .importer import COLUMNS, EntryImporter
+from .management.commands import run_worker
+from .metrics import Histogram, QueryTimer, registry, stop_timing_queries, time_queries
+from .middleware import HASHED_MAX_AGE, PIN_COOKIE, ReplicaPinningMiddleware, StaticFilesMiddleware
+from .archive import archive_entries
+from .models import (Client, Project, Entry, ArchivedEntry, DailyRollup, Job)
+from .overlaps import find_overlaps
+from .pagination import EstimatedCountPaginator, encode_cursor, paginate_entries
+from .rollups import split_by_day
+from .routers import PrimaryReplicaRouter, record_write, unpin, wrote
+from .search import search_entries
+from .signals import configure_sqlite
+from .views import DailyReportView, EntryCreateView, EntryImportView
+from .warmup import warm_up
 
 
 class TestModels(TestCase):
@@ -35,6 +78,10 @@ class TestViews(TestCase):
     client_name = 'Blah Client'
     project_name = 'Blah Project'
 
+    def setUp(self):
+        # Cached list fragments outlive the test transactions
+        cache.clear()
+
     def test_rootRedirectsToClientView(self):
         response = self.client.get('/')
         self.assertRedirects(response, '/clients/', 302, 200)
@@ -118,6 +165,11 @@ class TestViews(TestCase):
         self.assertNotContains(response, self.project_name)
         self.assertContains(response, self.client_name)
 
+    def test_projectWithoutClient(self):
+        project = ProjectFactory(name=self.project_name, client=None)
+        self.assertContains(self.client.get('/projects/'), self.project_name)
+        self.assertContains(self.client.get('/projects/{}/'.format(project.id)), self.project_name)
+
 
 class TestForms(TestCase):
 
@@ -216,3 +268,1992 @@ class TestForms(TestCase):
         self.assertEqual(entry.project.name, project.name)
         self.assertEqual(entry.description, self.description)
 
+
+
+class TestEntryPagination(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        project = ProjectFactory()
+        now = timezone.now()
+        # Pairs of entries share a start time so the id tie-breaker is exercised
+        self.entries = [
+            EntryFactory(project=project, start=now - timedelta(hours=i // 2),
+                         description='entry {}'.format(i))
+            for i in range(7)
+        ]
+
+    def paginate(self, **params):
+        return paginate_entries(Entry.objects.all(), params, per_page=3)
+
+    def descriptions(self, entries):
+        return [entry.description for entry in entries]
+
+    def test_firstPageIsNewestFirst(self):
+        page = self.paginate()
+        self.assertFalse(page.has_newer)
+        self.assertTrue(page.has_older)
+        self.assertEqual(self.descriptions(page), ['entry 1', 'entry 0', 'entry 3'])
+
+    def test_walkOlderThenNewer(self):
+        first = self.paginate()
+        second = self.paginate(before=encode_cursor(first.object_list[-1]))
+        self.assertEqual(self.descriptions(second), ['entry 2', 'entry 5', 'entry 4'])
+        self.assertTrue(second.has_newer)
+        last = self.paginate(before=encode_cursor(second.object_list[-1]))
+        self.assertEqual(self.descriptions(last), ['entry 6'])
+        self.assertFalse(last.has_older)
+
+        back = self.paginate(after=encode_cursor(second.object_list[0]))
+        self.assertEqual(self.descriptions(back), self.descriptions(first))
+        self.assertFalse(back.has_newer)
+        self.assertTrue(back.has_older)
+
+    def test_pageLinksKeepWindow(self):
+        page = paginate_entries(Entry.objects.all(), {}, per_page=3, params={'from': '2015-07-01'})
+        self.assertIn('from=2015-07-01', page.older_querystring)
+        self.assertIn('before=', page.older_querystring)
+
+    def test_listViewIsPaginated(self):
+        response = self.client.get('/entries/')
+        self.assertEqual(self.descriptions(response.context['entry_list'])[0], 'entry 1')
+        self.assertFalse(response.context['entry_page'].has_older)
+
+    def test_listViewPageSize(self):
+        with mock.patch.object(EntryCreateView, 'entries_per_page', 3):
+            response = self.client.get('/entries/')
+        self.assertEqual(self.descriptions(response.context['entry_list']), ['entry 1', 'entry 0', 'entry 3'])
+        self.assertTrue(response.context['entry_page'].has_older)
+
+    def test_invalidCursorIs404(self):
+        response = self.client.get('/entries/', {'before': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_dateWindow(self):
+        old = EntryFactory(start=timezone.now() - timedelta(days=10), description='old entry')
+        day = timezone.localtime(old.start).date().isoformat()
+        response = self.client.get('/entries/', {'from': day, 'to': day})
+        self.assertEqual(self.descriptions(response.context['entry_list']), ['old entry'])
+
+    def test_invalidDateWindowIsIgnored(self):
+        response = self.client.get('/entries/', {'from': '2015-07-31', 'to': '2015-07-01'})
+        self.assertEqual(len(response.context['entry_list']), len(self.entries))
+        self.assertContains(response, 'date must not be before')
+
+
+class TestClientDetail(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client_obj = ClientFactory()
+        start = timezone.now() - timedelta(days=1)
+        self.projects = []
+        for i in range(3):
+            project = ProjectFactory(client=self.client_obj, name='project {}'.format(i))
+            for j in range(7):
+                EntryFactory(project=project, start=start + timedelta(hours=j),
+                             stop=start + timedelta(hours=j, minutes=30),
+                             description='{} entry {}'.format(project.name, j))
+            self.projects.append(project)
+        # A running entry counts as an entry but adds no tracked time yet
+        EntryFactory(project=self.projects[0], start=start + timedelta(hours=8), stop=None,
+                     description='running')
+
+    def test_projectTotalsComputedInDatabase(self):
+        project = Project.objects.with_totals().get(pk=self.projects[0].pk)
+        self.assertEqual(project.entry_count, 8)
+        self.assertAlmostEqual(project.total_hours, 3.5, places=3)
+        self.assertEqual(project.last_entry, Entry.objects.get(description='running').start)
+
+    def test_projectWithoutEntries(self):
+        project = ProjectFactory(client=self.client_obj)
+        project = Project.objects.with_totals().get(pk=project.pk)
+        self.assertEqual(project.entry_count, 0)
+        self.assertIsNone(project.total_hours)
+        self.assertIsNone(project.last_entry)
+
+    def test_recentEntriesAreCapped(self):
+        url = '/clients/{}/'.format(self.client_obj.pk)
+        response = self.client.get(url)
+        for project in response.context['project_list']:
+            self.assertEqual(len(project.recent_entries), 5)
+        self.assertContains(response, 'running')
+        self.assertContains(response, 'project 1 entry 6')
+        self.assertNotContains(response, 'project 1 entry 1<')
+
+    def test_latestPerProject(self):
+        # Ties on start are broken by id, like the ordering
+        tied = EntryFactory(project=self.projects[1], start=Entry.objects.filter(
+            project=self.projects[1]).latest('start').start, description='tied')
+        with self.assertNumQueries(1):
+            latest = list(Entry.objects.latest_per_project([project.pk for project in self.projects], 2))
+        self.assertEqual(len(latest), 6)
+        by_project = dict((project.pk, []) for project in self.projects)
+        for entry in latest:
+            by_project[entry.project_id].append(entry.description)
+        self.assertEqual(by_project[self.projects[0].pk], ['running', 'project 0 entry 6'])
+        self.assertEqual(by_project[self.projects[1].pk], [tied.description, 'project 1 entry 6'])
+        self.assertEqual(by_project[self.projects[2].pk], ['project 2 entry 6', 'project 2 entry 5'])
+
+    def test_latestPerProjectOfManyProjects(self):
+        with mock.patch('entries.models.MAX_UNION_TERMS', 2):
+            latest = Entry.objects.latest_per_project(
+                [project.pk for project in self.projects] + [0, -1], 1)
+            self.assertEqual(
+                sorted(latest.values_list('description', flat=True)),
+                ['project 1 entry 6', 'project 2 entry 6', 'running'])
+        self.assertFalse(Entry.objects.latest_per_project([], 1).exists())
+
+    def test_queryCountIndependentOfProjects(self):
+        url = '/clients/{}/'.format(self.client_obj.pk)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        for i in range(10):
+            project = ProjectFactory(client=self.client_obj)
+            EntryFactory(project=project)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+
+class TestCachedChoices(TestCase):
+
+    def setUp(self):
+        # The cache outlives the test transactions, start from a cold cache
+        cache.clear()
+        for i in range(5):
+            ProjectFactory(name='project {}'.format(i), client__name='client {}'.format(i))
+
+    def render_entry_form(self):
+        return str(EntryForm()['project'])
+
+    def test_projectChoicesAreCachedAcrossForms(self):
+        with self.assertNumQueries(1):
+            html = self.render_entry_form()
+        self.assertIn('&lt;client 3&gt; project 3', html)
+        with self.assertNumQueries(1):
+            str(ProjectForm()['client'])
+        with self.assertNumQueries(0):
+            self.render_entry_form()
+            str(ProjectForm()['client'])
+
+    def test_projectSaveInvalidatesChoices(self):
+        self.render_entry_form()
+        project = ProjectFactory(name='brand new')
+        self.assertIsNone(cache.get(PROJECT_CHOICES_KEY))
+        self.assertIn('brand new', self.render_entry_form())
+        project.delete()
+        self.assertNotIn('brand new', self.render_entry_form())
+
+    def test_clientRenameInvalidatesProjectChoices(self):
+        self.render_entry_form()
+        client = Client.objects.get(name='client 2')
+        client.name = 'renamed client'
+        client.save()
+        self.assertIn('&lt;renamed client&gt; project 2', self.render_entry_form())
+
+    def test_staleChoiceIsStillValidated(self):
+        project = Project.objects.get(name='project 1')
+        self.render_entry_form()
+        Project.objects.filter(pk=project.pk).delete()
+        form = EntryForm({
+            'start': (timezone.now() - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M"),
+            'project': str(project.pk),
+            'description': 'stale',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('project', form.errors)
+
+
+class TestRunningEntries(TestCase):
+
+    def setUp(self):
+        project = ProjectFactory()
+        start = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            EntryFactory(project=project, start=start + timedelta(hours=i),
+                         description='finished {}'.format(i))
+        self.running = [
+            EntryFactory(project=project, start=start + timedelta(hours=i), stop=None,
+                         description='running {}'.format(i))
+            for i in range(2)
+        ]
+
+    def test_runningManagerMethod(self):
+        self.assertEqual(
+            set(Entry.objects.running()), set(self.running))
+
+    def test_runningQueryUsesIndex(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan check is SQLite specific')
+        sql, params = Entry.objects.running().order_by('start').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('entries_entry_running', plan)
+
+    def test_runningView(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/running/')
+        self.assertContains(response, 'running 0')
+        self.assertContains(response, 'running 1')
+        self.assertNotContains(response, 'finished')
+
+
+class TestDailyRollups(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory(name='Rollup project', client__name='Rollup client')
+        self.day = timezone.localtime(timezone.now()).date() - timedelta(days=3)
+        self.morning = timezone.make_aware(datetime.combine(self.day, time(9)))
+
+    def rollups(self):
+        return dict(
+            (rollup.day, (round(rollup.hours, 3), rollup.entry_count))
+            for rollup in DailyRollup.objects.filter(project=self.project))
+
+    def test_splitByDay(self):
+        start = timezone.make_aware(datetime.combine(self.day, time(22)))
+        stop = start + timedelta(hours=28)
+        self.assertEqual(list(split_by_day(start, stop)), [
+            (self.day, 2 * 3600.0),
+            (self.day + timedelta(days=1), 24 * 3600.0),
+            (self.day + timedelta(days=2), 2 * 3600.0),
+        ])
+        self.assertEqual(list(split_by_day(start, None)), [])
+
+    def test_entrySaveAndDeleteUpdateRollups(self):
+        entry = EntryFactory(project=self.project, start=self.morning,
+                             stop=self.morning + timedelta(hours=2))
+        EntryFactory(project=self.project, start=self.morning + timedelta(hours=3),
+                     stop=self.morning + timedelta(hours=4))
+        self.assertEqual(self.rollups(), {self.day: (3.0, 2)})
+
+        # Moving the entry across midnight splits it over two days
+        entry.start = self.morning + timedelta(hours=14)
+        entry.stop = entry.start + timedelta(hours=2)
+        entry.save()
+        self.assertEqual(self.rollups(), {
+            self.day: (2.0, 2),
+            self.day + timedelta(days=1): (1.0, 1),
+        })
+
+        entry.delete()
+        self.assertEqual(self.rollups(), {self.day: (1.0, 1)})
+
+    def test_runningEntryCountsOnceStopped(self):
+        entry = EntryFactory(project=self.project, start=self.morning, stop=None)
+        self.assertEqual(self.rollups(), {})
+        entry.stop = self.morning + timedelta(minutes=90)
+        entry.save()
+        self.assertEqual(self.rollups(), {self.day: (1.5, 1)})
+
+    def test_rebuildMatchesIncrementalRollups(self):
+        for i in range(5):
+            start = self.morning + timedelta(hours=7 * i)
+            EntryFactory(project=self.project, start=start, stop=start + timedelta(hours=5))
+        incremental = self.rollups()
+        DailyRollup.objects.all().delete()
+        call_command('rebuild_rollups', batch_size=2, stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuildInsertsWithinTheBackendLimit(self):
+        Entry.objects.bulk_create(
+            Entry(project=self.project, start=self.morning - timedelta(days=i),
+                  stop=self.morning - timedelta(days=i) + timedelta(hours=1))
+            for i in range(300))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('rebuild_rollups', stdout=StringIO())
+        inserts = [query for query in queries if 'INSERT INTO' in query['sql']]
+        fields = [field for field in DailyRollup._meta.concrete_fields if not field.primary_key]
+        batch = connection.ops.bulk_batch_size(fields, [None] * 300)
+        self.assertEqual(len(inserts), (300 + batch - 1) // batch)
+        self.assertEqual(DailyRollup.objects.count(), 300)
+
+    def test_dailyReport(self):
+        EntryFactory(project=self.project, start=self.morning,
+                     stop=self.morning + timedelta(hours=2))
+        ProjectFactory(client=self.project.client)
+        day = self.day.isoformat()
+        # The page's count and its rows
+        with self.assertNumQueries(2):
+            response = self.client.get('/reports/daily/', {'from': day, 'to': day})
+        self.assertEqual(len(response.context['row_list']), 1)
+        self.assertContains(response, 'Rollup client')
+        self.assertContains(response, '2.00')
+
+    def test_dailyReportDefaultsToRecentDays(self):
+        EntryFactory(project=self.project, start=self.morning,
+                     stop=self.morning + timedelta(hours=2))
+        long_ago = self.morning - timedelta(days=60)
+        EntryFactory(project=self.project, start=long_ago, stop=long_ago + timedelta(hours=1))
+        response = self.client.get('/reports/daily/')
+        self.assertEqual([row['day'] for row in response.context['row_list']], [self.day])
+        self.assertEqual(len(self.client.get('/reports/daily/', {'to': self.day.isoformat()})
+                             .context['row_list']), 2)
+
+    def test_dailyReportIsPaginated(self):
+        for i in range(3):
+            start = self.morning - timedelta(days=i)
+            EntryFactory(project=self.project, start=start, stop=start + timedelta(hours=1))
+        client = self.project.client.pk
+        with mock.patch.object(DailyReportView, 'paginate_by', 2):
+            response = self.client.get('/reports/daily/', {'client': client})
+            self.assertEqual(len(response.context['row_list']), 2)
+            self.assertContains(response, 'client={}'.format(client))
+            self.assertContains(response, 'page=2')
+            response = self.client.get('/reports/daily/', {'client': client, 'page': 2})
+            self.assertEqual(len(response.context['row_list']), 1)
+
+
+class TestEntryImport(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.project = ProjectFactory(name='Importing', client__name='Acme')
+        self.yesterday = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def csv(self, *rows):
+        lines = ['client,project,start,stop,description']
+        lines.extend(','.join(row) for row in rows)
+        return '\n'.join(lines) + '\n'
+
+    def row(self, start='09:00', stop='10:00', project='Importing', client='Acme', description='imported'):
+        return (client, project, '{} {}'.format(self.yesterday, start),
+                stop and '{} {}'.format(self.yesterday, stop), description)
+
+    def test_importInBatchesWithRowErrors(self):
+        data = self.csv(
+            self.row(description='first'),
+            self.row(start='10:00', stop='09:00'),
+            self.row(description='second'),
+            self.row(project='Unknown'),
+            ('Acme', 'Importing', 'not a date', '', 'bad'),
+            self.row(stop='', description='still running'),
+            ('too', 'few'),
+        )
+        result = EntryImporter(batch_size=2).run(StringIO(data))
+        self.assertEqual(result.created, 3)
+        self.assertEqual([line for line, message in result.errors], [3, 5, 6, 8])
+        self.assertIn('End time must come after start time', result.errors[0][1])
+        self.assertIn('Unknown project', result.errors[1][1])
+        self.assertEqual(
+            set(Entry.objects.values_list('description', flat=True)),
+            {'first', 'second', 'still running'})
+        rollup = DailyRollup.objects.get(project=self.project)
+        self.assertEqual((rollup.hours, rollup.entry_count), (2.0, 2))
+
+    def test_futureStartIsRejected(self):
+        tomorrow = (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M')
+        result = EntryImporter().run(StringIO(self.csv(('Acme', 'Importing', tomorrow, '', 'x'))))
+        self.assertEqual(result.created, 0)
+        self.assertIn('Start time must be in the past', result.errors[0][1])
+
+    def test_createMissing(self):
+        data = self.csv(self.row(client='New client', project='New project'),
+                        self.row(client='New client', project='New project'))
+        result = EntryImporter(create_missing=True).run(StringIO(data))
+        self.assertEqual(result.created, 2)
+        self.assertEqual(Project.objects.filter(name='New project', client__name='New client').count(), 1)
+
+    def test_queriesDontGrowWithRows(self):
+        # Make sure both runs update the existing rollup row
+        EntryImporter().run(StringIO(self.csv(self.row())))
+        counts = []
+        for rows in (5, 50):
+            data = self.csv(*[self.row() for i in range(rows)])
+            with CaptureQueriesContext(connection) as queries:
+                result = EntryImporter(batch_size=100).run(StringIO(data))
+            self.assertEqual(result.created, rows)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_badHeader(self):
+        result = EntryImporter().run(StringIO('what,is,this\n'))
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.errors[0][0], 1)
+
+    def test_importCommand(self):
+        path = os.path.join(tempfile.mkdtemp(), 'entries.csv')
+        with open(path, 'w') as f:
+            f.write(self.csv(self.row(), self.row(project='Unknown')))
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_entries', path, stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 1 entries, skipped 1 rows', stdout.getvalue())
+        self.assertIn('Line 3', stderr.getvalue())
+
+    def test_uploadView(self):
+        upload = SimpleUploadedFile('entries.csv', self.csv(self.row()).encode('utf-8'))
+        response = self.client.post('/entries/import/', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertContains(response, 'Imported 1 entry')
+
+    def test_uploadStopsAtUndecodableLine(self):
+        data = self.csv(self.row(), self.row(), self.row(description='caf\xe9')).encode('latin-1')
+        upload = SimpleUploadedFile('entries.csv', data)
+        with mock.patch.object(EntryImportView, 'batch_size', 1):
+            response = self.client.post('/entries/import/', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertEqual(Entry.objects.count(), 2)
+        self.assertContains(response, 'The import stopped at line 4')
+
+
+class TestEntryExport(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory(name='Exported', client__name='Acme')
+        self.other = ProjectFactory(name='Other', client__name='Other client')
+        start = timezone.now() - timedelta(days=2)
+        for i in range(5):
+            EntryFactory(project=self.project, start=start + timedelta(hours=i),
+                         stop=start + timedelta(hours=i, minutes=30),
+                         description='entry, "{}"'.format(i))
+        EntryFactory(project=self.other, start=start, stop=None, description='other')
+
+    def export(self, format, **params):
+        response = self.client.get('/entries/export.{}'.format(format), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csvExportRoundTripsThroughImporter(self):
+        data = self.export('csv', client=self.project.client.pk)
+        rows = list(csv.reader(StringIO(data)))
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][:2], ['Acme', 'Exported'])
+        self.assertEqual(rows[1][4], 'entry, "0"')
+
+        result = EntryImporter().run(StringIO(data))
+        self.assertEqual((result.created, result.error_count), (5, 0))
+
+    def test_jsonExport(self):
+        lines = self.export('json').splitlines()
+        self.assertEqual(len(lines), 6)
+        running = json.loads(lines[-1])
+        self.assertEqual(running['description'], 'other')
+        self.assertIsNone(running['stop'])
+
+    def test_exportFilters(self):
+        self.assertEqual(len(self.export('json', project=self.other.pk).splitlines()), 1)
+        today = timezone.localtime(timezone.now()).date().isoformat()
+        self.assertEqual(self.export('json', **{'from': today}), '')
+
+    def test_invalidFilterIsBadRequest(self):
+        response = self.client.get('/entries/export.csv', {'client': 999})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rowsAreFetchedInBatches(self):
+        # Three full batches and an empty one to find the end
+        with self.assertNumQueries(4):
+            rows = list(iter_rows(Entry.objects.all(), batch_size=2))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(set(row[0] for row in rows)), 6)
+
+
+class TestListCaching(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_clientListServedFromCache(self):
+        ClientFactory(name='First client')
+        response = self.client.get('/clients/')
+        self.assertContains(response, 'First client')
+        with self.assertNumQueries(0):
+            response = self.client.get('/clients/')
+        self.assertContains(response, 'First client')
+
+    def test_saveAndDeleteInvalidateList(self):
+        client = ClientFactory(name='First client')
+        self.client.get('/clients/')
+        client.name = 'Renamed client'
+        client.save()
+        self.assertContains(self.client.get('/clients/'), 'Renamed client')
+        client.delete()
+        self.assertNotContains(self.client.get('/clients/'), 'Renamed client')
+
+    def test_projectListDependsOnClients(self):
+        project = ProjectFactory(name='Cached project', client__name='Old name')
+        self.assertContains(self.client.get('/projects/'), 'Old name')
+        project.client.name = 'New name'
+        project.client.save()
+        self.assertContains(self.client.get('/projects/'), 'New name')
+
+    def test_entryListCachedPerCursor(self):
+        project = ProjectFactory()
+        start = timezone.now() - timedelta(days=1)
+        for i in range(3):
+            EntryFactory(project=project, start=start + timedelta(hours=i), description='entry {}'.format(i))
+        self.client.get('/entries/')
+        # The project choices are cached too, so nothing hits the database
+        with self.assertNumQueries(0):
+            self.client.get('/entries/')
+        cursor = encode_cursor(Entry.objects.get(description='entry 1'))
+        response = self.client.get('/entries/', {'before': cursor})
+        self.assertContains(response, 'entry 0')
+        self.assertNotContains(response, 'entry 2')
+
+    def test_entryListKeyIgnoresOtherParameters(self):
+        EntryFactory(description='cached entry')
+        self.client.get('/entries/', {'from': '2015-07-01'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/entries/', {'from': '07/01/2015', 'utm_source': 'mail'})
+        self.assertContains(response, 'cached entry')
+
+    def test_importInvalidatesEntryList(self):
+        project = ProjectFactory(name='Imported', client__name='Acme')
+        self.client.get('/entries/')
+        yesterday = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        EntryImporter().run(StringIO(
+            'client,project,start,stop,description\n'
+            'Acme,Imported,{0} 09:00,{0} 10:00,bulk imported\n'.format(yesterday)))
+        self.assertContains(self.client.get('/entries/'), 'bulk imported')
+
+    def test_fileBasedCache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        file_cache = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+        }
+        with self.settings(CACHES=file_cache):
+            from django.core.cache import caches
+            self.addCleanup(caches['default'].clear)
+            before = get_generation(Client)
+            client = ClientFactory(name='Filed client')
+            self.assertNotEqual(get_generation(Client), before)
+            self.assertContains(self.client.get('/clients/'), 'Filed client')
+            with self.assertNumQueries(0):
+                self.assertContains(self.client.get('/clients/'), 'Filed client')
+
+
+class TestEntryAdmin(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        start = timezone.now() - timedelta(days=1)
+        for i, (project_name, client_name) in enumerate(
+                [('Alpha', 'Acme'), ('Beta', 'Globex'), ('Gamma', 'Initech')]):
+            project = ProjectFactory(name=project_name, client__name=client_name)
+            for j in range(4):
+                EntryFactory(project=project, start=start + timedelta(minutes=j),
+                             stop=start + timedelta(minutes=j + 1),
+                             description='entry {} {}'.format(i, j))
+
+    def changelist(self, **params):
+        return self.client.get('/admin/entries/entry/', params)
+
+    def test_queryCountIndependentOfRows(self):
+        response = self.changelist()
+        self.assertEqual(response.context['cl'].result_count, 12)
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        for i in range(10):
+            EntryFactory(project=Project.objects.get(name='Alpha'), description='more')
+        with CaptureQueriesContext(connection) as many:
+            self.changelist()
+        self.assertEqual(len(few), len(many))
+
+    def test_searchProjectAndClientNames(self):
+        response = self.changelist(q='beta')
+        self.assertEqual(response.context['cl'].result_count, 4)
+        response = self.changelist(q='initech')
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+    def test_filterChoicesComeFromRecentRollups(self):
+        ProjectFactory(name='idle project')
+        response = self.changelist()
+        self.assertContains(response, '?project=')
+        self.assertNotContains(response, 'idle project')
+        project = Project.objects.get(name='Gamma')
+        response = self.changelist(project=project.pk)
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+    def test_estimatedCount(self):
+        paginator = EstimatedCountPaginator(Entry.objects.all(), 5)
+        paginator.exact_count_limit = 5
+        self.assertGreaterEqual(paginator.count, 12)
+        self.assertTrue(paginator.is_estimate)
+        # Filtered results are counted exactly so all their pages can be reached
+        paginator = EstimatedCountPaginator(Entry.objects.filter(description__startswith='entry'), 5)
+        paginator.exact_count_limit = 5
+        self.assertEqual(paginator.count, 12)
+        self.assertEqual(len(paginator.page(3).object_list), 2)
+        paginator = EstimatedCountPaginator(Entry.objects.filter(description='entry 0 0'), 5)
+        self.assertEqual(paginator.count, 1)
+
+    def test_pagesBeyondAnEstimate(self):
+        paginator = EstimatedCountPaginator(Entry.objects.order_by('start', 'id'), 5)
+        paginator.exact_count_limit = 5
+        with mock.patch('entries.pagination.estimate_table_size', return_value=8):
+            # The estimate is too low, the rows past it are still served
+            self.assertEqual(paginator.count, 8)
+            self.assertEqual(len(paginator.page(2).object_list), 5)
+            self.assertEqual(len(paginator.page(3).object_list), 2)
+            self.assertEqual(list(paginator.page(4).object_list), [])
+
+    def test_filteredChangelistPastTheCountLimit(self):
+        entry_admin = admin.site._registry[Entry]
+        with mock.patch.object(EstimatedCountPaginator, 'exact_count_limit', 5), \
+                mock.patch.object(entry_admin, 'list_per_page', 5):
+            # The third page, p counts from 0
+            response = self.changelist(q='entry', p=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 12)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+    def test_noDateHierarchyQuery(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.changelist()
+        self.assertFalse(any('DISTINCT' in query['sql'] and 'start' in query['sql'] for query in queries))
+
+
+class TestEntrySearch(TestCase):
+
+    def setUp(self):
+        project = ProjectFactory()
+        start = timezone.now() - timedelta(days=1)
+        self.entries = {}
+        for i, description in enumerate([
+                'fixed line endings in the <importer>',
+                'reviewed importer pull request',
+                'lunch', 'line endings again, line endings everywhere']):
+            self.entries[description] = EntryFactory(
+                project=project, start=start + timedelta(hours=i), description=description)
+
+    def descriptions(self, entries):
+        return [entry.description for entry in entries]
+
+    def test_ftsIsUsedOnSqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is SQLite specific')
+        self.assertTrue(search.is_available())
+
+    def test_searchIsRankedAndHighlighted(self):
+        results = search_entries('line endings')
+        self.assertEqual(set(self.descriptions(results)), {
+            'fixed line endings in the <importer>', 'line endings again, line endings everywhere'})
+        if search.is_available():
+            # More matches in a shorter text ranks higher
+            self.assertEqual(results[0].description, 'line endings again, line endings everywhere')
+        highlighted = [entry.highlighted for entry in results
+                       if entry.description.startswith('fixed')][0]
+        self.assertEqual(highlighted, 'fixed <mark>line</mark> <mark>endings</mark> in the &lt;importer&gt;')
+
+    def test_fallbackWithoutFts(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            results = search_entries('endings importer')
+        self.assertEqual(self.descriptions(results), ['fixed line endings in the <importer>'])
+        self.assertEqual(
+            results[0].highlighted,
+            'fixed line <mark>endings</mark> in the &lt;<mark>importer</mark>&gt;')
+
+    def test_lastWordIsAPrefix(self):
+        self.assertEqual(len(search_entries('import')), 2)
+
+    def test_userInputIsNotFtsSyntax(self):
+        self.assertEqual(search_entries('"lunch OR NEAR('), [])
+        self.assertEqual(self.descriptions(search_entries('lunch)')), ['lunch'])
+        self.assertEqual(search_entries('  ...  '), [])
+
+    def test_indexFollowsSaveAndDelete(self):
+        entry = self.entries['lunch']
+        entry.description = 'dinner'
+        entry.save()
+        self.assertEqual(search_entries('lunch'), [])
+        self.assertEqual(self.descriptions(search_entries('dinner')), ['dinner'])
+        entry.delete()
+        self.assertEqual(search_entries('dinner'), [])
+
+    def test_rebuildCommand(self):
+        if not search.is_available():
+            self.skipTest('No full text index')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(search.FTS_TABLE))
+        self.assertEqual(search_entries('lunch'), [])
+        stdout = StringIO()
+        call_command('rebuild_search_index', batch_size=3, stdout=stdout)
+        self.assertIn('Indexed 4 entries', stdout.getvalue())
+        self.assertEqual(len(search_entries('lunch')), 1)
+
+    def test_importedEntriesAreIndexed(self):
+        Project.objects.update(name='Importing')
+        yesterday = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        EntryImporter().run(StringIO(
+            'client,project,start,stop,description\n'
+            '{client},Importing,{0} 09:00,{0} 10:00,bulk imported\n'.format(
+                yesterday, client=Client.objects.get().name)))
+        self.assertEqual(self.descriptions(search_entries('bulk')), ['bulk imported'])
+
+    def test_searchView(self):
+        response = self.client.get('/entries/search/', {'q': 'importer'})
+        self.assertEqual(len(response.context['entry_list']), 2)
+        self.assertContains(response, '<mark>importer</mark>')
+
+    def test_adminSearch(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/admin/entries/entry/', {'q': 'endings'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/entries/entry/', {'q': 'Disruptive'})
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+
+class TestBatching(TestCase):
+
+    def test_chunkedWalksPrimaryKeys(self):
+        for i in range(7):
+            ClientFactory(name='client {}'.format(i))
+        batches = list(chunked(Client.objects.values_list('pk', 'name'), batch_size=3))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        batches = list(chunked(Client.objects.all(), batch_size=7))
+        self.assertEqual([len(batch) for batch in batches], [7])
+        self.assertEqual(list(chunked(Client.objects.none(), batch_size=3)), [])
+
+
+class TestOverlaps(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory()
+        self.base = timezone.now().replace(second=0, microsecond=0) - timedelta(days=1)
+
+    def entry(self, start_hour, stop_hour=None, description='work'):
+        stop = None if stop_hour is None else self.base + timedelta(hours=stop_hour)
+        return Entry.objects.create(
+            project=self.project, start=self.base + timedelta(hours=start_hour),
+            stop=stop, description=description)
+
+    def at(self, hour):
+        return self.base + timedelta(hours=hour)
+
+    def test_firstOverlap(self):
+        morning = self.entry(1, 3)
+        self.entry(5, 6)
+        self.assertEqual(Entry.objects.first_overlap(self.at(2), self.at(4)), morning)
+        self.assertEqual(Entry.objects.first_overlap(self.at(0), self.at(2)), morning)
+        self.assertIsNone(Entry.objects.first_overlap(self.at(3), self.at(5)))
+        self.assertIsNone(Entry.objects.first_overlap(self.at(7), self.at(8)))
+        # A running entry overlaps everything after its start
+        running = self.entry(10)
+        self.assertEqual(Entry.objects.first_overlap(self.at(11), self.at(12)), running)
+        self.assertEqual(Entry.objects.first_overlap(self.at(7)), running)
+        self.assertIsNone(Entry.objects.first_overlap(self.at(7), self.at(8)))
+
+    def test_firstOverlapUsesOneQuery(self):
+        self.entry(1, 3)
+        with self.assertNumQueries(1):
+            Entry.objects.first_overlap(self.at(4), self.at(5))
+
+    def test_firstOverlapWithOverlappingEntries(self):
+        # Stored entries can overlap, e.g. imported ones: a long entry
+        # containing a short one must still be found
+        long_entry = self.entry(8, 12, description='long')
+        self.entry(9, 9.5, description='short')
+        self.assertEqual(Entry.objects.first_overlap(self.at(10), self.at(11)), long_entry)
+        form = self.entry_form(self.at(10), self.at(11))
+        self.assertFalse(form.is_valid())
+        self.assertIn('Overlaps "long"', form.errors['__all__'][0])
+
+    def entry_form(self, start, stop, instance=None):
+        return EntryForm({
+            'start': timezone.localtime(start).strftime("%Y-%m-%d %H:%M"),
+            'stop': timezone.localtime(stop).strftime("%Y-%m-%d %H:%M") if stop else '',
+            'project': str(self.project.id),
+            'description': 'new',
+        }, instance=instance)
+
+    def test_entryFormRejectsOverlap(self):
+        self.entry(1, 3, description='standup')
+        form = self.entry_form(self.at(2), self.at(4))
+        self.assertFalse(form.is_valid())
+        self.assertIn('Overlaps "standup"', form.errors['__all__'][0])
+        self.assertTrue(self.entry_form(self.at(3), self.at(4)).is_valid())
+
+    def test_entryFormRejectsOverlapWithRunningEntry(self):
+        self.entry(1)
+        form = self.entry_form(self.at(2), self.at(3))
+        self.assertFalse(form.is_valid())
+        self.assertIn('running since', form.errors['__all__'][0])
+
+    def test_entryFormAllowsOverlapOnOtherProject(self):
+        Entry.objects.create(project=ProjectFactory(), start=self.at(1), description='elsewhere')
+        self.assertTrue(self.entry_form(self.at(2), self.at(3)).is_valid())
+
+    def test_entryFormIgnoresItsOwnEntry(self):
+        entry = self.entry(1, 3)
+        self.assertTrue(self.entry_form(self.at(1), self.at(4), instance=entry).is_valid())
+
+    def test_findOverlaps(self):
+        first = self.entry(1, 4)
+        second = self.entry(2, 3)
+        third = self.entry(3, 5)
+        self.entry(5, 6)
+        running = self.entry(7)
+        last = self.entry(8, 9)
+        pairs = sorted(
+            (earlier[0], later[0])
+            for earlier, later in find_overlaps(Entry.objects.all(), batch_size=2))
+        self.assertEqual(pairs, sorted([
+            (first.pk, second.pk), (first.pk, third.pk), (running.pk, last.pk)]))
+
+    def test_findOverlapsWithinProjects(self):
+        # Concurrent entries of different projects are allowed, see
+        # test_entryFormAllowsOverlapOnOtherProject
+        other_project = ProjectFactory()
+        first = self.entry(1, 4)
+        second = self.entry(3, 5)
+        meeting = Entry.objects.create(project=other_project, start=self.at(2), stop=self.at(3))
+        running = Entry.objects.create(project=other_project, start=self.at(0))
+        pairs = sorted(
+            (earlier[0], later[0])
+            for earlier, later in find_overlaps(Entry.objects.all(), batch_size=2))
+        self.assertEqual(pairs, sorted([(first.pk, second.pk), (running.pk, meeting.pk)]))
+        out = StringIO()
+        call_command('find_overlaps', stdout=out)
+        self.assertIn('Found 2 overlapping pairs', out.getvalue())
+
+    def test_findOverlapsCommand(self):
+        self.entry(1, 3)
+        self.entry(2, 4)
+        out = StringIO()
+        call_command('find_overlaps', stdout=out)
+        self.assertIn('Found 1 overlapping pairs', out.getvalue())
+
+
+class TestTimesheet(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.acme = ClientFactory(name='Acme')
+        self.globex = ClientFactory(name='Globex')
+        self.website = ProjectFactory(name='Website', client=self.acme)
+        self.backend = ProjectFactory(name='Backend', client=self.globex)
+        # Monday of a week well in the past
+        self.monday = start_of_day(datetime(2015, 7, 20).date())
+
+    def entry(self, project, day, hour, hours):
+        start = self.monday + timedelta(days=day, hours=hour)
+        return Entry.objects.create(
+            project=project, start=start, stop=start + timedelta(hours=hours), description='work')
+
+    def test_durationFollowsSaves(self):
+        entry = self.entry(self.website, 0, 9, 2)
+        self.assertEqual(Entry.objects.get(pk=entry.pk).duration, 7200)
+        entry.stop = None
+        entry.save(update_fields=['stop'])
+        self.assertIsNone(Entry.objects.get(pk=entry.pk).duration)
+        entry.stop = entry.start + timedelta(minutes=30)
+        entry.save()
+        self.assertEqual(Entry.objects.get(pk=entry.pk).duration, 1800)
+
+    def test_projectTotalsUseDuration(self):
+        self.entry(self.website, 0, 9, 2)
+        self.entry(self.website, 1, 9, 1.5)
+        project = Project.objects.with_totals().get(pk=self.website.pk)
+        self.assertAlmostEqual(project.total_hours, 3.5)
+
+    def test_timesheetGrid(self):
+        self.entry(self.website, 0, 9, 2)
+        self.entry(self.website, 0, 14, 1)
+        self.entry(self.website, 2, 9, 3)
+        self.entry(self.backend, 4, 9, 4)
+        # Outside the week and still running, neither counts
+        self.entry(self.backend, 7, 9, 1)
+        Entry.objects.create(project=self.backend, start=self.monday + timedelta(days=3))
+
+        response = self.client.get('/reports/timesheet/', {'week': '2015-07-22'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.context['row_list']
+        self.assertEqual([row['project__name'] for row in rows], ['Website', 'Backend'])
+        self.assertEqual(rows[0]['hours'], [3, 0, 3, 0, 0, 0, 0])
+        self.assertEqual(rows[1]['hours'], [0, 0, 0, 0, 4, 0, 0])
+        self.assertEqual(response.context['day_totals'], [3, 0, 3, 0, 4, 0, 0])
+        self.assertEqual(response.context['total_hours'], 10)
+        self.assertIn('week=2015-07-13', response.context['previous_querystring'])
+
+    def test_timesheetForOneClient(self):
+        self.entry(self.website, 0, 9, 2)
+        self.entry(self.backend, 0, 9, 4)
+        response = self.client.get(
+            '/reports/timesheet/', {'week': '2015-07-20', 'client': self.globex.pk})
+        self.assertEqual([row['project__name'] for row in response.context['row_list']], ['Backend'])
+        self.assertEqual(response.context['total_hours'], 4)
+
+    def test_timesheetQueries(self):
+        for day in range(7):
+            self.entry(self.website, day, 9, 1)
+            self.entry(self.backend, day, 11, 1)
+        self.client.get('/reports/timesheet/', {'week': '2015-07-20'})
+        # Once the client choices are cached the grid is a single query
+        with self.assertNumQueries(1):
+            self.client.get('/reports/timesheet/', {'week': '2015-07-20'})
+
+
+class TestDataset(TestCase):
+
+    def test_generateDataset(self):
+        out = StringIO()
+        call_command(
+            'generate_dataset', clients=3, projects=10, entries=500, running=2, days=30,
+            seed=1, batch_size=200, stdout=out)
+        self.assertIn('Created 3 clients, 10 projects and 502 entries', out.getvalue())
+        self.assertEqual(Entry.objects.running().count(), 2)
+        self.assertFalse(Entry.objects.filter(stop__isnull=False, duration__isnull=True).exists())
+        first = Entry.objects.order_by('start').first()
+        self.assertGreater(first.start, timezone.now() - timedelta(days=31))
+        self.assertEqual(
+            DailyRollup.objects.aggregate(count=Sum('entry_count'))['count'], 500)
+
+    def test_datasetIsRepeatable(self):
+        entries = [
+            [(entry.start, entry.stop) for entry in DatasetGenerator(seed=seed).entries([1, 2, 3], 50, 10)]
+            for seed in (7, 7, 8)
+        ]
+        self.assertEqual(entries[0], entries[1])
+        self.assertNotEqual(entries[0], entries[2])
+
+
+class TestRequestMetrics(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_histogramPercentiles(self):
+        histogram = Histogram(0.001)
+        for value in range(1, 101):
+            histogram.add(value / 1000.0)
+        self.assertAlmostEqual(histogram.percentile(50), 0.05, delta=0.005)
+        self.assertAlmostEqual(histogram.percentile(99), 0.099, delta=0.01)
+        self.assertEqual(histogram.percentile(100), 0.1)
+        counts = Histogram(1)
+        for value in (0, 0, 0, 5):
+            counts.add(value)
+        self.assertEqual(counts.percentile(50), 0)
+        self.assertEqual(counts.percentile(99), 5)
+        self.assertIsNone(Histogram(1).percentile(50))
+
+    def test_recordsPerUrlName(self):
+        ClientFactory()
+        # The request_started signal clears the query log
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/clients/')
+        query_count = len(queries)
+        self.client.get('/clients/')
+        self.client.get('/no/such/page/')
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['client-list']['count'], 2)
+        self.assertEqual(snapshot['client-list']['queries']['max'], query_count)
+        self.assertGreater(snapshot['client-list']['wall']['p50'], 0)
+        self.assertGreater(snapshot['client-list']['template']['max'], 0)
+        self.assertEqual(snapshot['(unresolved)']['count'], 1)
+        # The connection is back to plain cursors after the request
+        self.assertNotIn('make_cursor', connection.__dict__)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling(self):
+        self.client.get('/clients/')
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_statsAreStaffOnly(self):
+        self.client.get('/clients/')
+        self.assertEqual(self.client.get('/stats/').status_code, 302)
+        self.assertEqual(self.client.get('/stats.json').status_code, 302)
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/stats/')
+        self.assertContains(response, 'client-list')
+        data = json.loads(self.client.get('/stats.json').content.decode('utf-8'))
+        self.assertEqual(data['views']['client-list']['count'], 1)
+        self.assertEqual(
+            sorted(data['views']['client-list']['wall']), ['max', 'mean', 'p50', 'p95', 'p99'])
+
+
+class TestSqlitePragmas(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA {}'.format(name))
+            return cursor.fetchone()[0]
+
+    def test_pragmasAppliedToNewConnections(self):
+        cache_size = self.pragma('cache_size')
+        try:
+            with override_settings(SQLITE_PRAGMAS=[('cache_size', -1234)]):
+                configure_sqlite(sender=connection.__class__, connection=connection)
+            self.assertEqual(self.pragma('cache_size'), -1234)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = {}'.format(cache_size))
+
+    def test_productionProfile(self):
+        from timetracker import settings_production
+        self.assertFalse(settings_production.DEBUG)
+        self.assertEqual(settings_production.DATABASES['default']['CONN_MAX_AGE'], 600)
+        self.assertIn(('journal_mode', 'WAL'), settings_production.SQLITE_PRAGMAS)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaRouting(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        unpin()
+
+    def tearDown(self):
+        unpin()
+
+    def test_readsGoToReplicaUntilAWrite(self):
+        self.assertEqual(self.router.db_for_read(Entry), 'replica')
+        # Asking where a write would go doesn't pin
+        self.assertEqual(self.router.db_for_write(Entry), 'default')
+        self.assertEqual(self.router.db_for_read(Entry), 'replica')
+        record_write()
+        self.assertEqual(self.router.db_for_read(Entry), 'default')
+
+    def test_readsInTransactionGoToPrimary(self):
+        self.assertEqual(self.router.db_for_read(Entry), 'replica')
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Entry), 'default')
+
+    def test_replicasAreNotMigrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'entries'))
+        self.assertIsNone(self.router.allow_migrate('default', 'entries'))
+
+    def test_middlewarePinsAfterWrites(self):
+        middleware = ReplicaPinningMiddleware()
+        request = self.factory.get('/entries/')
+        middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Entry), 'replica')
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.post('/entries/')
+        middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Entry), 'default')
+        record_write()
+        response = middleware.process_response(request, HttpResponse())
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Entry), 'replica')
+
+        # The redirect after the POST comes back with the cookie
+        request = self.factory.get('/entries/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(Entry), 'default')
+
+
+class TestWriteRecording(TestCase):
+
+    def setUp(self):
+        unpin()
+
+    def tearDown(self):
+        unpin()
+
+    def test_onlyWritesAreRecorded(self):
+        project = ProjectFactory()
+        unpin()
+        Client.objects.get_or_create(name=project.client.name)
+        list(project.entry_set.all())
+        self.assertFalse(wrote())
+        EntryFactory(project=project)
+        self.assertTrue(wrote())
+
+    def test_readOnlyRequestIsNotPinned(self):
+        ProjectFactory()
+        response = self.client.get('/clients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writeIsRecordedWhileQueriesAreTimed(self):
+        timer = QueryTimer()
+        time_queries(connection, timer)
+        self.addCleanup(stop_timing_queries, connection)
+        ClientFactory()
+        self.assertTrue(wrote())
+        self.assertEqual(timer.count, 1)
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.project = ProjectFactory(name='Archived project', client__name='Acme')
+        self.old_start = start_of_day(datetime(2015, 7, 20).date()) + timedelta(hours=9)
+        self.old = [
+            EntryFactory(project=self.project, start=self.old_start + timedelta(hours=i),
+                         stop=self.old_start + timedelta(hours=i, minutes=30),
+                         description='ancient work {}'.format(i))
+            for i in range(3)
+        ]
+        recent = timezone.now() - timedelta(days=1)
+        self.recent = EntryFactory(project=self.project, start=recent, stop=recent + timedelta(hours=1),
+                                   description='recent work')
+        self.running = EntryFactory(project=self.project, start=self.old_start - timedelta(days=1),
+                                    stop=None, description='forgotten timer')
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_entries', older_than=30, batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_batchesKeepWithinTheParameterLimit(self):
+        Entry.objects.bulk_create(
+            Entry(project=self.project, start=self.old_start, stop=self.old_start + timedelta(hours=1))
+            for i in range(600))
+        limit = connection.ops.bulk_batch_size(['id'], range(1000))
+        with CaptureQueriesContext(connection) as queries:
+            count = archive_entries(self.old_start + timedelta(days=1), batch_size=1000)
+        self.assertEqual(count, 603)
+        deletes = [query for query in queries if 'DELETE FROM "entries_entry"' in query['sql']]
+        self.assertEqual(len(deletes), (603 + limit - 1) // limit)
+
+    def test_archiveMovesOldFinishedEntries(self):
+        rollups = list(DailyRollup.objects.order_by('day').values_list('day', 'seconds', 'entry_count'))
+        self.assertIn('Archived 3 entries', self.archive())
+        self.assertEqual(
+            sorted(Entry.objects.values_list('pk', flat=True)), [self.recent.pk, self.running.pk])
+        archived = ArchivedEntry.objects.get(pk=self.old[0].pk)
+        self.assertEqual(
+            (archived.start, archived.stop, archived.description, archived.duration),
+            (self.old[0].start, self.old[0].stop, 'ancient work 0', 1800))
+        # The rollups count archived entries, also after a rebuild
+        self.assertEqual(
+            list(DailyRollup.objects.order_by('day').values_list('day', 'seconds', 'entry_count')), rollups)
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(
+            list(DailyRollup.objects.order_by('day').values_list('day', 'seconds', 'entry_count')), rollups)
+        self.assertIn('Archived 0 entries', self.archive())
+
+    def test_viewsReadHotTable(self):
+        self.archive()
+        response = self.client.get('/entries/')
+        self.assertContains(response, 'recent work')
+        self.assertNotContains(response, 'ancient work')
+        self.assertEqual(search_entries('ancient'), [])
+
+    def test_exportIncludesArchiveWhenAsked(self):
+        self.archive()
+        response = self.client.get('/entries/export.json')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        response = self.client.get('/entries/export.json', {'archived': 'on'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['description'], 'ancient work 0')
+
+    def test_timesheetIncludesArchiveWhenAsked(self):
+        EntryFactory(project=self.project, start=self.old_start + timedelta(days=1),
+                     stop=self.old_start + timedelta(days=1, hours=2))
+        # Leaves the entry of the next day in the hot table
+        archive_entries(self.old_start + timedelta(hours=12))
+        response = self.client.get('/reports/timesheet/', {'week': '2015-07-20'})
+        self.assertEqual(response.context['row_list'][0]['hours'][:2], [0, 2])
+        response = self.client.get('/reports/timesheet/', {'week': '2015-07-20', 'archived': 'on'})
+        row_list = response.context['row_list']
+        self.assertEqual(len(row_list), 1)
+        self.assertEqual(row_list[0]['hours'][:2], [1.5, 2])
+        self.assertEqual(row_list[0]['total_hours'], 3.5)
+        self.assertIn('archived=on', response.context['next_querystring'])
+
+
+class TestJobs(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.files_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.files_dir)
+        settings = override_settings(JOB_FILES_DIR=self.files_dir, JOB_RETRY_DELAY=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.project = ProjectFactory(name='Background', client__name='Acme')
+        self.calls = []
+
+        self.addCleanup(jobs.unregister, 'test_flaky')
+
+        @jobs.task('test_flaky')
+        def flaky(job, failures):
+            self.calls.append(job.attempts)
+            if len(self.calls) <= failures:
+                raise ValueError('attempt {}'.format(job.attempts))
+            job.report(1, 1, force=True)
+            return {'calls': len(self.calls)}
+
+    def run_worker(self):
+        out = StringIO()
+        call_command('run_worker', processes=0, once=True, stdout=out)
+        return out.getvalue()
+
+    def test_largeUploadIsImportedByWorker(self):
+        yesterday = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        data = 'client,project,start,stop,description\nAcme,Background,{0} 09:00,{0} 10:00,queued\n'.format(
+            yesterday)
+        upload = SimpleUploadedFile('entries.csv', data.encode('utf-8'))
+        with mock.patch.object(EntryImportView, 'background_size', 0):
+            response = self.client.post('/entries/import/', {'file': upload})
+        job = Job.objects.get()
+        self.assertRedirects(response, '/jobs/{}/'.format(job.pk))
+        self.assertEqual((job.kind, job.status, job.max_attempts), ('import_entries', Job.QUEUED, 1))
+        self.assertFalse(Entry.objects.exists())
+
+        self.assertIn('Job {} succeeded'.format(job.pk), self.run_worker())
+        self.assertEqual(Entry.objects.get().description, 'queued')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done, job.total), (Job.SUCCEEDED, 1, 1))
+        self.assertEqual(os.listdir(self.files_dir), [])
+        response = self.client.get('/jobs/{}/'.format(job.pk))
+        self.assertContains(response, 'Imported 1 entry')
+
+    def test_failedImportDeletesUpload(self):
+        with open(os.path.join(self.files_dir, 'upload.csv'), 'wb') as f:
+            f.write(b'client,project,start,stop,description\n')
+        job = jobs.enqueue('import_entries', max_attempts=2, path='upload.csv')
+        with mock.patch.object(EntryImporter, 'run', side_effect=ValueError('broken')):
+            self.run_worker()
+            # Kept for the retry
+            self.assertEqual(os.listdir(self.files_dir), ['upload.csv'])
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(os.listdir(self.files_dir), [])
+
+    def test_lostImportDeletesUpload(self):
+        open(os.path.join(self.files_dir, 'upload.csv'), 'w').close()
+        job = jobs.enqueue('import_entries', max_attempts=1, path='upload.csv')
+        jobs.claim_next()
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(hours=2))
+        self.assertEqual(jobs.requeue_stale(3600), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.FAILED)
+        self.assertEqual(os.listdir(self.files_dir), [])
+
+    def test_backgroundExport(self):
+        start = timezone.now() - timedelta(days=1)
+        EntryFactory(project=self.project, start=start, stop=start + timedelta(hours=1), description='exported')
+        EntryFactory(project=ProjectFactory(), start=start, stop=start + timedelta(hours=1))
+        self.assertEqual(self.client.get('/entries/export.csv/job').status_code, 405)
+        response = self.client.post('/entries/export.csv/job?client={}'.format(self.project.client.pk))
+        job = Job.objects.get()
+        self.assertRedirects(response, '/jobs/{}/'.format(job.pk))
+        self.run_worker()
+
+        status = json.loads(self.client.get('/jobs/{}.json'.format(job.pk)).content.decode('utf-8'))
+        self.assertEqual((status['status'], status['percent']), ('succeeded', 100))
+        self.assertEqual(status['output'], '/jobs/{}/output'.format(job.pk))
+        response = self.client.get(status['output'])
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][4], 'exported')
+
+    def test_failedAttemptIsRetriedLater(self):
+        job = jobs.enqueue('test_flaky', failures=1)
+        self.assertIn('failed', self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: attempt 1', job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+        # Not due yet
+        self.assertEqual(self.run_worker(), '')
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertIn('succeeded', self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, json.loads(job.result)), (Job.SUCCEEDED, 2, {'calls': 2}))
+
+    def test_jobFailsAfterMaxAttempts(self):
+        job = jobs.enqueue('test_flaky', max_attempts=2, failures=5)
+        with override_settings(JOB_RETRY_DELAY=0):
+            self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, self.calls), (Job.FAILED, 2, [1, 2]))
+        self.assertIsNotNone(job.finished)
+
+    def test_claimIsExclusive(self):
+        first = jobs.enqueue('test_flaky', failures=0)
+        second = jobs.enqueue('test_flaky', failures=0)
+        self.assertEqual([jobs.claim_next(), jobs.claim_next(), jobs.claim_next()], [first.pk, second.pk, None])
+
+    def test_staleJobsAreRequeued(self):
+        job = jobs.enqueue('test_flaky', failures=0)
+        jobs.claim_next()
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(hours=2))
+        self.assertIn('Requeued 1 stale jobs', self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.SUCCEEDED, 2))
+
+    def test_poolGivesUpOnLostJobs(self):
+        job = jobs.enqueue('test_flaky', failures=0)
+        pool = mock.Mock()
+        # A process that died: the result never becomes ready
+        pool.apply_async.return_value.ready.return_value = False
+        out = StringIO()
+        with mock.patch('multiprocessing.get_context') as get_context:
+            get_context.return_value.Pool.return_value = pool
+            call_command('run_worker', processes=1, once=True, stale_after=0, poll_interval=0, stdout=out)
+        self.assertIn('Job {} lost'.format(job.pk), out.getvalue())
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+        # The next look for stale jobs gives it to another worker
+        self.assertEqual(jobs.requeue_stale(0), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+
+    def test_staleJobsAreRequeuedWhileRunning(self):
+        job = jobs.enqueue('test_flaky', failures=0)
+        out = StringIO()
+        command = run_worker.Command(stdout=out)
+        command.requeued_at = None
+        options = {'stale_after': 3600}
+        command.requeue_stale(options)
+        jobs.claim_next()
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(hours=2))
+        command.requeue_stale(options)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+        with mock.patch.object(run_worker, 'REQUEUE_INTERVAL', 0):
+            command.requeue_stale(options)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+        self.assertIn('Requeued 1 stale jobs', out.getvalue())
+
+    def test_progressReadsThePrimary(self):
+        job = jobs.enqueue('test_flaky', failures=0)
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', return_value='replica'):
+            # No such database: reading through the router would fail
+            response = self.client.get('/jobs/{}.json'.format(job.pk))
+            self.assertEqual(json.loads(response.content.decode('utf-8'))['status'], Job.QUEUED)
+            self.assertEqual(self.client.get('/jobs/{}/'.format(job.pk)).status_code, 200)
+            self.assertContains(self.client.get('/jobs/'), 'test_flaky')
+
+    def test_rebuildCommandsQueueJobs(self):
+        call_command('rebuild_rollups', background=True, stdout=StringIO())
+        call_command('rebuild_search_index', background=True, stdout=StringIO())
+        self.assertEqual(
+            list(Job.objects.order_by('pk').values_list('kind', flat=True)),
+            ['rebuild_rollups', 'rebuild_search_index'])
+        self.run_worker()
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 2)
+        self.assertContains(self.client.get('/jobs/'), 'rebuild_rollups')
+
+    def test_unknownKind(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_task')
+
+
+class TestTimerBatch(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.project = ProjectFactory(name='Kiosk', client__name='Acme')
+        self.other = ProjectFactory(name='Other')
+        self.started = timezone.now() - timedelta(hours=1)
+        self.running = EntryFactory(project=self.project, start=self.started, stop=None, description='running')
+
+    def post(self, operations):
+        response = self.client.post('/timers/batch', json.dumps({'operations': operations}),
+                                    content_type='application/json')
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_startAndStopInOneRequest(self):
+        status, body = self.post([
+            {'action': 'start', 'project': self.project.pk, 'description': 'first'},
+            {'action': 'start', 'project': self.project.pk, 'description': 'second'},
+            {'action': 'start', 'project': self.other.pk},
+            {'action': 'stop', 'entry': self.running.pk},
+            {'action': 'stop', 'project': self.project.pk},
+        ])
+        self.assertEqual(status, 200)
+        results = body['results']
+        self.assertTrue(all(result['ok'] for result in results))
+        self.assertEqual(results[0]['entries'][0]['description'], 'first')
+        self.assertIsNotNone(results[3]['entries'][0]['stop'])
+        # The stop by project includes the timers started earlier in the batch
+        self.assertEqual(
+            [entry['description'] for entry in results[4]['entries']], ['first', 'second'])
+        self.assertEqual(list(Entry.objects.running().values_list('project', flat=True)), [self.other.pk])
+        self.assertEqual(Entry.objects.filter(project=self.project, stop__isnull=False).count(), 3)
+
+    def test_invalidOperationsDontAffectOthers(self):
+        status, body = self.post([
+            {'action': 'start', 'project': 999},
+            {'action': 'stop', 'entry': self.running.pk, 'stop': (self.started - timedelta(minutes=5)).isoformat()},
+            {'action': 'start', 'project': self.project.pk, 'start': 'yesterday'},
+            {'action': 'jump'},
+            'stop',
+            {'action': 'stop', 'entry': self.running.pk, 'stop': '2100-01-01T00:00:00'},
+            {'action': 'stop', 'entry': self.running.pk},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([result['ok'] for result in body['results']], [False] * 6 + [True])
+        self.assertIn('Unknown project', body['results'][0]['error'])
+        self.assertIn('End time must come after start time', body['results'][1]['error'])
+        self.assertIn('Invalid date and time', body['results'][2]['error'])
+        self.assertIn('in the future', body['results'][5]['error'])
+        self.assertEqual(Entry.objects.count(), 1)
+        status, body = self.post([{'action': 'stop', 'entry': self.running.pk}])
+        self.assertIn('not running', body['results'][0]['error'])
+
+    def test_oneReadOfTheTimersToStop(self):
+        operations = [
+            {'action': 'stop', 'project': self.project.pk},
+            {'action': 'stop', 'entry': self.running.pk},
+            {'action': 'stop', 'project': self.other.pk},
+        ]
+        # The request_started signal clears the query log
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            status, body = self.post(operations)
+        reads = [query['sql'] for query in queries.captured_queries if '"stop" IS NULL' in query['sql']]
+        self.assertEqual(status, 200)
+        self.assertEqual([result['ok'] for result in body['results']], [True, False, True])
+        self.assertEqual(len(reads), 1)
+
+    def test_selectForUpdateWhereSupported(self):
+        with mock.patch.object(connection.features, 'has_select_for_update', True), \
+                mock.patch('django.db.models.query.QuerySet.select_for_update',
+                           autospec=True, side_effect=lambda queryset: queryset) as select_for_update:
+            self.post([{'action': 'stop', 'entry': self.running.pk}])
+        self.assertEqual(select_for_update.call_count, 1)
+
+    def test_badRequests(self):
+        response = self.client.post('/timers/batch', 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post({'action': 'start'})[0], 400)
+        self.assertEqual(self.post([{'action': 'stop', 'entry': 1}] * 201)[0], 400)
+        self.assertEqual(self.client.get('/timers/batch').status_code, 405)
+
+    @override_settings(API_KEYS=['kiosk-key'])
+    def test_authentication(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        body = json.dumps({'operations': [{'action': 'stop', 'entry': self.running.pk}]})
+
+        # Neither a key nor a CSRF token
+        response = client.post('/timers/batch', body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('Authorization: Token', response.content.decode('utf-8'))
+
+        response = client.post('/timers/batch', body, content_type='application/json',
+                               HTTP_AUTHORIZATION='Token wrong-key')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertIsNone(Entry.objects.get(pk=self.running.pk).stop)
+
+        response = client.post('/timers/batch', body, content_type='application/json',
+                               HTTP_AUTHORIZATION='Token kiosk-key')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(Entry.objects.get(pk=self.running.pk).stop)
+
+    def test_csrfTokenFromThePage(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        token = 'a' * 32
+        client.cookies['csrftoken'] = token
+        body = json.dumps({'operations': [{'action': 'stop', 'entry': self.running.pk}]})
+        response = client.post('/timers/batch', body, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class TestSync(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clients = [ClientFactory(name='Client {}'.format(i)) for i in range(2)]
+        self.projects = [ProjectFactory(client=self.clients[i % 2], name='Project {}'.format(i)) for i in range(3)]
+        start = timezone.now() - timedelta(days=1)
+        self.entries = [
+            EntryFactory(project=self.projects[i % 3], start=start + timedelta(hours=i),
+                         stop=start + timedelta(hours=i, minutes=30))
+            for i in range(4)
+        ]
+
+    def sync(self, cursor=None, limit=4):
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get('/sync', params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def sync_all(self, cursor=None):
+        pages = []
+        while True:
+            page = self.sync(cursor)
+            pages.append(page)
+            cursor = page['cursor']
+            if not page['more']:
+                return pages, cursor
+
+    def ids(self, pages, key):
+        return [row['id'] for page in pages for row in page[key]]
+
+    def test_fullSyncInPages(self):
+        pages, cursor = self.sync_all()
+        self.assertTrue(all(sum(len(page[key]) for key in ('clients', 'projects', 'entries', 'deleted')) <= 4
+                            for page in pages))
+        self.assertEqual(self.ids(pages, 'clients'), [client.pk for client in self.clients])
+        self.assertEqual(self.ids(pages, 'projects'), [project.pk for project in self.projects])
+        self.assertEqual(self.ids(pages, 'entries'), [entry.pk for entry in self.entries])
+        project = [row for page in pages for row in page['projects']][-1]
+        self.assertEqual((project['id'], project['name'], project['client']),
+                         (self.projects[2].pk, 'Project 2', self.clients[0].pk))
+        # Nothing changed since
+        self.assertEqual(self.sync_all(cursor)[0][0]['entries'], [])
+
+    def test_onlyChangesAfterTheCursor(self):
+        pages, cursor = self.sync_all()
+        entry = self.entries[1]
+        entry.description = 'edited'
+        entry.save(update_fields=['description'])
+        # Deleting a project deletes its entries too
+        project_id = self.projects[0].pk
+        self.projects[0].delete()
+        with self.assertNumQueries(4):
+            page = self.sync(cursor, limit=100)
+        self.assertEqual([(row['id'], row['description']) for row in page['entries']], [(entry.pk, 'edited')])
+        self.assertEqual(page['projects'], [])
+        self.assertEqual(
+            sorted((row['model'], row['id']) for row in page['deleted']),
+            sorted([('entry', self.entries[0].pk), ('entry', self.entries[3].pk), ('project', project_id)]))
+
+        entry = self.entries[2]
+        entry.description = 'edited'
+        entry.save(update_fields=['description'])
+        page = self.sync(page['cursor'], limit=100)
+        self.assertEqual([row['description'] for row in page['entries']], ['edited'])
+        self.assertEqual(page['deleted'], [])
+
+    def test_recentChangesWaitToSettle(self):
+        pages, cursor = self.sync_all()
+        ClientFactory(name='Brand new')
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            page = self.sync(cursor)
+        self.assertEqual(page['clients'], [])
+        self.assertEqual(page['cursor'], cursor)
+        self.assertEqual([row['name'] for row in self.sync(cursor)['clients']], ['Brand new'])
+
+    def test_badParameters(self):
+        self.assertEqual(self.client.get('/sync', {'cursor': 'not a cursor'}).status_code, 400)
+        self.assertEqual(self.client.get('/sync', {'limit': '0'}).status_code, 400)
+        self.assertEqual(self.client.get('/sync', {'limit': 'ten'}).status_code, 400)
+
+
+@override_settings(API_KEYS=['integration-key'])
+class TestApi(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Like an integration: no CSRF token, an API key on every request
+        self.client = self.client_class(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Token integration-key')
+        self.acme = ClientFactory(name='Acme')
+        self.projects = [ProjectFactory(client=self.acme, name='Project {}'.format(i)) for i in range(3)]
+        self.start = timezone.now() - timedelta(days=1)
+        self.entry = EntryFactory(project=self.projects[0], start=self.start,
+                                  stop=self.start + timedelta(hours=1), description='api')
+
+    def get(self, path, params=None, **headers):
+        response = self.client.get(path, params or {}, **headers)
+        body = json.loads(response.content.decode('utf-8')) if response.content else None
+        return response, body
+
+    def send(self, method, path, data, **headers):
+        response = getattr(self.client, method)(path, json.dumps(data), content_type='application/json', **headers)
+        return response, json.loads(response.content.decode('utf-8')) if response.content else None
+
+    def test_listWithSparseFieldsAndKeysetPaging(self):
+        response, body = self.get('/api/projects/', {'fields': 'name', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['results'], [
+            {'id': self.projects[0].pk, 'name': 'Project 0'}, {'id': self.projects[1].pk, 'name': 'Project 1'}])
+        response, body = self.get(body['next'])
+        self.assertEqual([row['name'] for row in body['results']], ['Project 2'])
+        self.assertIsNone(body['next'])
+
+        response, body = self.get('/api/entries/', {'project': self.projects[1].pk})
+        self.assertEqual(body['results'], [])
+        self.assertEqual(self.get('/api/projects/', {'fields': 'secret'})[0].status_code, 400)
+        self.assertEqual(self.get('/api/projects/', {'after': '!!'})[0].status_code, 400)
+
+    def test_conditionalGetOfADetail(self):
+        response, body = self.get('/api/entries/{}/'.format(self.entry.pk))
+        self.assertEqual(body['description'], 'api')
+        self.assertEqual(body['duration'], 3600)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # A 304 only reads updated_at
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/entries/{}/'.format(self.entry.pk), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Another representation has another ETag
+        response = self.client.get('/api/entries/{}/'.format(self.entry.pk), {'fields': 'start'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.entry.description = 'changed'
+        self.entry.save()
+        response = self.client.get('/api/entries/{}/'.format(self.entry.pk), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/entries/999/').status_code, 404)
+
+    def test_conditionalGetOfAList(self):
+        response = self.client.get('/api/projects/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.projects[2].delete()
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_createUpdateAndDelete(self):
+        response, body = self.send('post', '/api/entries/', {
+            'project': self.projects[1].pk, 'description': 'created',
+            'start': (self.start + timedelta(hours=2)).isoformat(),
+            'stop': (self.start + timedelta(hours=3)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 201)
+        path = '/api/entries/{}/'.format(body['id'])
+        self.assertTrue(response['Location'].endswith(path))
+        self.assertEqual(body['duration'], 3600)
+
+        response, body = self.send('patch', path, {'description': 'patched'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((body['description'], body['project']), ('patched', self.projects[1].pk))
+
+        # The same validation as the HTML form
+        response, body = self.send('patch', path, {'stop': (self.start + timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('End time must come after start time', body['errors']['__all__'][0])
+        response, body = self.send('put', path, {'description': 'no project'})
+        self.assertIn('project', body['errors'])
+
+        self.assertEqual(self.client.delete(path).status_code, 204)
+        self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_ifMatchPreventsLostUpdates(self):
+        path = '/api/clients/{}/'.format(self.acme.pk)
+        etag = self.client.get(path)['ETag']
+        response, body = self.send('put', path, {'name': 'Acme Inc'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.client.get(path)['ETag'])
+        response, body = self.send('put', path, {'name': 'Stale write'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Client.objects.get(pk=self.acme.pk).name, 'Acme Inc')
+
+    def test_authentication(self):
+        anonymous = self.client_class(enforce_csrf_checks=True)
+        self.assertEqual(anonymous.get('/api/clients/').status_code, 200)
+        for method, path in [('post', '/api/clients/'), ('put', '/api/clients/{}/'.format(self.acme.pk)),
+                             ('patch', '/api/clients/{}/'.format(self.acme.pk)),
+                             ('delete', '/api/clients/{}/'.format(self.acme.pk))]:
+            response = getattr(anonymous, method)(path, json.dumps({'name': 'Forged'}),
+                                                  content_type='application/json')
+            self.assertEqual(response.status_code, 403, method)
+            response = getattr(anonymous, method)(path, json.dumps({'name': 'Forged'}),
+                                                  content_type='application/json',
+                                                  HTTP_AUTHORIZATION='Token wrong-key')
+            self.assertEqual(response.status_code, 401, method)
+        self.assertEqual(anonymous.get('/api/clients/', HTTP_AUTHORIZATION='Token wrong-key').status_code, 401)
+        self.assertEqual(list(Client.objects.values_list('name', flat=True)), ['Acme'])
+
+        # The site's own pages send the CSRF token instead
+        anonymous.cookies['csrftoken'] = 'b' * 32
+        response = anonymous.post('/api/clients/', json.dumps({'name': 'From the page'}),
+                                  content_type='application/json', HTTP_X_CSRFTOKEN='b' * 32)
+        self.assertEqual(response.status_code, 201)
+
+
+class TestLiveTimers(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(live, 'running_timers', live.RunningTimers())
+        self.timers = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.project = ProjectFactory(name='Live', client__name='Acme')
+        self.running = EntryFactory(project=self.project, start=timezone.now() - timedelta(hours=1),
+                                    stop=None, description='running now')
+        live.notify_pending()
+
+    def test_oneQueryPerChange(self):
+        with self.assertNumQueries(1):
+            version, timers = self.timers.snapshot()
+            self.assertEqual(self.timers.snapshot(), (version, timers))
+        self.assertEqual([timer['description'] for timer in timers], ['running now'])
+        self.timers.changed()
+        with self.assertNumQueries(1):
+            self.assertNotEqual(self.timers.snapshot()[0], version)
+            self.timers.snapshot()
+
+    def test_onlyRunningTimersNotify(self):
+        version = self.timers.version
+        start = timezone.now() - timedelta(days=2)
+        EntryFactory(project=self.project, start=start, stop=start + timedelta(hours=1))
+        live.notify_pending()
+        self.assertEqual(self.timers.version, version)
+        self.running.stop = timezone.now()
+        self.running.save()
+        # Saved inside the test's transaction, so held back until the request ends
+        self.assertEqual(self.timers.version, version)
+        live.notify_pending()
+        self.assertNotEqual(self.timers.version, version)
+
+    def test_changesFromOtherProcessesShowUpOnRefresh(self):
+        version, timers = self.timers.snapshot()
+        Entry.objects.filter(pk=self.running.pk).update(stop=timezone.now())
+        self.assertEqual(self.timers.snapshot(), (version, timers))
+        with mock.patch.object(live, 'REFRESH_SECONDS', -1):
+            version, timers = self.timers.snapshot()
+        self.assertEqual(timers, [])
+        self.assertEqual(version, self.timers.version)
+
+    def test_eventStream(self):
+        response = self.client.get('/running/events')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        event = next(response.streaming_content).decode('utf-8')
+        self.assertTrue(event.startswith('id: {}\nevent: timers\n'.format(self.timers.version)))
+        self.assertEqual(json.loads(event.split('data: ')[1])[0]['description'], 'running now')
+
+        with mock.patch.object(live, 'KEEPALIVE_SECONDS', 0.01):
+            response = self.client.get('/running/events', HTTP_LAST_EVENT_ID=self.timers.version)
+            self.assertEqual(next(response.streaming_content), b': keepalive\n\n')
+
+    def test_longPoll(self):
+        body = json.loads(self.client.get('/running/poll').content.decode('utf-8'))
+        self.assertEqual(body['version'], self.timers.version)
+        self.assertEqual(len(body['timers']), 1)
+        with mock.patch.object(live, 'POLL_SECONDS', 0.01):
+            again = json.loads(self.client.get('/running/poll', {'version': body['version']}).content.decode('utf-8'))
+        self.assertEqual(again['version'], body['version'])
+
+        timer = threading.Timer(0.05, self.timers.changed)
+        timer.start()
+        started = time_module.time()
+        changed = json.loads(self.client.get('/running/poll', {'version': body['version']}).content.decode('utf-8'))
+        self.assertLess(time_module.time() - started, live.POLL_SECONDS)
+        self.assertNotEqual(changed['version'], body['version'])
+
+    def test_dashboardPage(self):
+        self.assertContains(self.client.get('/running/live/'), '/running/events')
+
+
+class TestStartup(TestCase):
+
+    def test_warmUp(self):
+        steps = warm_up()
+        self.assertEqual([name for name, seconds in steps], ['urls', 'templates', 'database'])
+        self.assertTrue(all(seconds >= 0 for name, seconds in steps))
+
+    def test_productionTemplates(self):
+        from timetracker import settings as base_settings, settings_production
+        template = settings_production.TEMPLATES[0]
+        self.assertFalse(template['APP_DIRS'])
+        self.assertEqual(template['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+        self.assertTrue(settings_production.WARM_UP_ON_START)
+        # The development settings are left alone
+        self.assertNotIn('loaders', base_settings.TEMPLATES[0]['OPTIONS'])
+
+    def test_importTimer(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'startup_outer.py'), 'w') as f:
+            f.write('import startup_inner\n')
+        with open(os.path.join(directory, 'startup_inner.py'), 'w') as f:
+            f.write('x = 1\n')
+        sys.path.insert(0, directory)
+        timer = startup.ImportTimer()
+        timer.install()
+        try:
+            import startup_outer  # NOQA
+        finally:
+            timer.uninstall()
+            sys.path.remove(directory)
+            sys.modules.pop('startup_outer', None)
+            sys.modules.pop('startup_inner', None)
+        outer, outer_self = timer.times['startup_outer']
+        inner, inner_self = timer.times['startup_inner']
+        self.assertAlmostEqual(outer_self, outer - inner)
+        self.assertEqual(inner_self, inner)
+
+    def test_pageUrls(self):
+        paths = dict(startup.page_urls())
+        self.assertEqual(paths['client-list'], '/clients/')
+        self.assertNotIn('client-detail', paths)
+
+    def test_startupProfileCommand(self):
+        report = {
+            'setup': 0.5,
+            'imports': [['django.db.models', 0.3, 0.001]],
+            'warm_up': [['urls', 0.05]],
+            'requests': [['client-list', '/clients/', 'entries.views', 200, 0.02, 0.005]],
+        }
+        stdout = StringIO()
+        with mock.patch('subprocess.check_output', return_value=json.dumps(report).encode('utf-8')) as run:
+            call_command('startup_profile', warm_up=True, stdout=stdout)
+        self.assertEqual(run.call_args[0][0][1:], ['-m', 'entries.startup', '--warm-up'])
+        output = stdout.getvalue()
+        self.assertIn('300.0', output)
+        self.assertIn('django.db.models', output)
+        self.assertIn('warm-up urls', output)
+        self.assertIn('/clients/', output)
+
+
+class TestStaticFiles(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.factory = RequestFactory()
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+            return json.load(f)['paths']
+
+    def test_noCdnOrInlineScript(self):
+        response = self.client.get('/clients/')
+        self.assertContains(response, '<script src="/static/entries/js/nav.js"></script>', html=True)
+        self.assertContains(response, '/static/entries/vendor/jquery/2.1.4/jquery.min.js')
+        self.assertNotContains(response, 'bootstrapcdn.com')
+        self.assertNotContains(response, 'googleapis.com')
+        self.assertNotContains(response, 'window.location.pathname')
+
+    def test_vendoredFiles(self):
+        response = self.client.get('/clients/')
+        names = re.findall(r'(?:src|href)="/static/([^"]+)"', response.content.decode('utf-8'))
+        self.assertEqual(len(names), 5)
+        for name in names:
+            self.assertIsNotNone(finders.find(name), name)
+        # Referenced by bootstrap.min.css
+        for extension in ('eot', 'svg', 'ttf', 'woff', 'woff2'):
+            self.assertIsNotNone(finders.find(
+                'entries/vendor/bootstrap/3.3.5/fonts/glyphicons-halflings-regular.' + extension))
+
+    def test_collectGzipped(self):
+        with override_settings(STATIC_ROOT=self.static_root,
+                               STATICFILES_STORAGE='entries.storage.GzipManifestStaticFilesStorage'):
+            paths = self.collect()
+        hashed = paths['entries/js/nav.js']
+        self.assertRegex(hashed, r'^entries/js/nav\.[0-9a-f]{12}\.js$')
+        with open(os.path.join(self.static_root, hashed), 'rb') as f:
+            original = f.read()
+        with gzip.open(os.path.join(self.static_root, hashed + '.gz')) as f:
+            self.assertEqual(f.read(), original)
+        # Images don't get smaller
+        self.assertFalse(any(name.endswith('.gif.gz') for name in os.listdir(
+            os.path.join(self.static_root, 'admin', 'img'))))
+
+    def test_serveHashed(self):
+        with override_settings(STATIC_ROOT=self.static_root,
+                               STATICFILES_STORAGE='entries.storage.GzipManifestStaticFilesStorage'):
+            hashed = self.collect()['entries/js/nav.js']
+            middleware = StaticFilesMiddleware()
+
+            response = middleware.process_request(self.factory.get('/static/' + hashed))
+            self.assertIn('javascript', response['Content-Type'])
+            self.assertNotIn('Content-Encoding', response)
+            self.assertIn('max-age={}'.format(HASHED_MAX_AGE), response['Cache-Control'])
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            response.close()
+
+            response = middleware.process_request(
+                self.factory.get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip, deflate'))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(int(response['Content-Length']),
+                             os.path.getsize(os.path.join(self.static_root, hashed + '.gz')))
+            response.close()
+
+            response = middleware.process_request(self.factory.get('/static/entries/js/nav.js'))
+            self.assertIn('max-age=60', response['Cache-Control'])
+            response.close()
+
+            self.assertIsNone(middleware.process_request(self.factory.get('/clients/')))
+            with self.assertRaises(Http404):
+                middleware.process_request(self.factory.get('/static/../manage.py'))
+            with self.assertRaises(Http404):
+                middleware.process_request(self.factory.get('/static/entries/js/missing.js'))
+
+
+class TestClientBackfillMigration(TransactionTestCase):
+
+    before = [('entries', '0002_auto_20150723_0819')]
+    after = [('entries', '0003_create_fk_to_client')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_clientsCreatedFromProjectNames(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        Project = executor.loader.project_state(self.before).apps.get_model('entries', 'Project')
+        for name, client in [('a', 'Acme'), ('b', 'Acme'), ('c', 'Globex'), ('d', '')]:
+            Project.objects.create(name=name, client=client)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        Client = apps.get_model('entries', 'Client')
+        Project = apps.get_model('entries', 'Project')
+        self.assertEqual(sorted(Client.objects.values_list('name', flat=True)), ['Acme', 'Globex'])
+        self.assertEqual(
+            dict(Project.objects.values_list('name', 'client__name')),
+            {'a': 'Acme', 'b': 'Acme', 'c': 'Globex', 'd': None})
+
+
+class TestDailyRollupMigration(TransactionTestCase):
+
+    before = [('entries', '0005_entry_indexes')]
+    after = [('entries', '0006_dailyrollup')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_rollupsPopulatedFromEntries(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        Project = apps.get_model('entries', 'Project')
+        Entry = apps.get_model('entries', 'Entry')
+        project = Project.objects.create(name='Migrated')
+        day = datetime(2015, 7, 20).date()
+        start = timezone.make_aware(datetime.combine(day, time(22)))
+        Entry.objects.create(project=project, start=start, stop=start + timedelta(hours=3))
+        Entry.objects.create(project=project, start=start, stop=None)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        DailyRollup = executor.loader.project_state(self.after).apps.get_model('entries', 'DailyRollup')
+        self.assertEqual(
+            list(DailyRollup.objects.order_by('day').values_list('day', 'seconds', 'entry_count')),
+            [(day, 2 * 3600.0, 1), (day + timedelta(days=1), 3600.0, 1)])
+
+
+class TestEntryDurationMigration(TransactionTestCase):
+
+    before = [('entries', '0007_entry_fts')]
+    after = [('entries', '0008_entry_duration')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_durationsBackfilled(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        project = apps.get_model('entries', 'Project').objects.create(name='Migrated')
+        Entry = apps.get_model('entries', 'Entry')
+        start = timezone.make_aware(datetime(2015, 7, 20, 9))
+        Entry.objects.create(project=project, start=start, stop=start + timedelta(minutes=90))
+        Entry.objects.create(project=project, start=start, stop=None)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Entry = executor.loader.project_state(self.after).apps.get_model('entries', 'Entry')
+        self.assertAlmostEqual(Entry.objects.get(stop__isnull=False).duration, 5400, places=2)
+        self.assertIsNone(Entry.objects.get(stop__isnull=True).duration)
@@ -0,0 +1,165 @@
+"""
+Start and stop many timers in one request, for kiosks tracking time for a
+whole team. See the timer_batch view
+"""
+from django import forms
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .forms import validate_start, validate_stop
+from .models import Entry, Project
+
+
+# Operations accepted in one batch
+MAX_OPERATIONS = 200
+
+DESCRIPTION_LENGTH = Entry._meta.get_field('description').max_length
+
+
+def parse_time(value, default):
+    """
+    An ISO 8601 date and time from the request, in the current time zone
+    unless it has an offset, or `default` when missing
+    """
+    if value is None:
+        return default
+    try:
+        parsed = parse_datetime(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None:
+        raise forms.ValidationError('Invalid date and time: {}'.format(value))
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_id(operation, name):
+    value = operation.get(name)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise forms.ValidationError('"{}" must be an id'.format(name))
+    return value
+
+
+def entry_dict(entry):
+    return {
+        'id': entry.pk,
+        'project': entry.project_id,
+        'description': entry.description,
+        'start': entry.start.isoformat(),
+        'stop': entry.stop and entry.stop.isoformat(),
+        'duration': entry.duration,
+    }
+
+
+class TimerBatch(object):
+    """
+    Apply a list of operations, in order and in one transaction:
+
+        {"action": "start", "project": 3, "description": "...", "start": "..."}
+        {"action": "stop", "entry": 12, "stop": "..."}
+        {"action": "stop", "project": 3, "stop": "..."}
+
+    "start" and "stop" times are optional and default to now. Stopping a
+    project stops all of its running timers, including ones started earlier
+    in the batch. Unlike EntryForm, starts don't check for overlaps: a team
+    has many timers running at once.
+
+    The entries that may be stopped are read, and locked on backends with
+    SELECT ... FOR UPDATE, in a single query up front, so a concurrent batch
+    can't stop the same timer in between. An invalid operation gets an
+    error result without affecting the others
+    """
+
+    def __init__(self, operations):
+        self.operations = operations
+        self.now = timezone.now()
+        self.entries = {}
+        self.projects = set()
+
+    def load(self):
+        entry_ids = set()
+        project_ids = set()
+        for operation in self.operations:
+            if not isinstance(operation, dict):
+                continue
+            if isinstance(operation.get('entry'), int):
+                entry_ids.add(operation['entry'])
+            if isinstance(operation.get('project'), int):
+                project_ids.add(operation['project'])
+        self.projects = set(Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True))
+        entries = Entry.objects.filter(Q(pk__in=entry_ids) | Q(project__in=project_ids, stop__isnull=True))
+        if connection.features.has_select_for_update:
+            entries = entries.select_for_update()
+        self.entries = dict((entry.pk, entry) for entry in entries)
+
+    def run(self):
+        """
+        Returns a result per operation, {"ok": true, "entries": [...]} with
+        the entries started or stopped, or {"ok": false, "error": "..."}
+        """
+        results = []
+        with transaction.atomic():
+            self.load()
+            for operation in self.operations:
+                try:
+                    entries = self.apply(operation)
+                except forms.ValidationError as e:
+                    results.append({'ok': False, 'error': ' '.join(e.messages)})
+                else:
+                    results.append({'ok': True, 'entries': [entry_dict(entry) for entry in entries]})
+        return results
+
+    def apply(self, operation):
+        if not isinstance(operation, dict):
+            raise forms.ValidationError('An operation must be an object')
+        action = operation.get('action')
+        if action == 'start':
+            return [self.start(operation)]
+        if action == 'stop':
+            return self.stop(operation)
+        raise forms.ValidationError('Unknown action: {}'.format(action))
+
+    def start(self, operation):
+        project_id = parse_id(operation, 'project')
+        if project_id not in self.projects:
+            raise forms.ValidationError('Unknown project {}'.format(project_id))
+        description = operation.get('description', '')
+        if not isinstance(description, str) or len(description) > DESCRIPTION_LENGTH:
+            raise forms.ValidationError(
+                'The description must be a string of at most {} characters'.format(DESCRIPTION_LENGTH))
+        start = parse_time(operation.get('start'), self.now)
+        if start is not self.now:
+            validate_start(start)
+        entry = Entry(project_id=project_id, start=start, description=description)
+        entry.save()
+        self.entries[entry.pk] = entry
+        return entry
+
+    def stop(self, operation):
+        if 'entry' in operation:
+            entry = self.entries.get(parse_id(operation, 'entry'))
+            if entry is None:
+                raise forms.ValidationError('Unknown entry {}'.format(operation['entry']))
+            if entry.stop is not None:
+                raise forms.ValidationError('Entry {} is not running'.format(entry.pk))
+            entries = [entry]
+        else:
+            project_id = parse_id(operation, 'project')
+            if project_id not in self.projects:
+                raise forms.ValidationError('Unknown project {}'.format(project_id))
+            entries = sorted(
+                (entry for entry in self.entries.values()
+                 if entry.project_id == project_id and entry.stop is None),
+                key=lambda entry: entry.pk)
+        stop = parse_time(operation.get('stop'), self.now)
+        if stop > self.now:
+            raise forms.ValidationError('End time must not be in the future')
+        for entry in entries:
+            validate_stop(entry.start, stop)
+        for entry in entries:
+            entry.stop = stop
+            entry.save()
+        return entries
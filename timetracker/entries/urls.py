@@ -1,6 +1,6 @@
 from django.conf.urls import url
 
-from . import views
+from . import api, views
 
 
 urlpatterns = [
@@ -8,6 +8,33 @@ urlpatterns = [
     url(r'^clients/$', views.ClientCreateView.as_view(), name='client-list'),
     url(r'^clients/(?P<pk>\d+)/$', views.ClientUpdateView.as_view(), name='client-detail'),
     url(r'^entries/$', views.EntryCreateView.as_view(), name='entry-list'),
+    url(r'^entries/export\.(?P<format>csv|json)$', views.export_entries, name='entry-export'),
+    url(r'^entries/export\.(?P<format>csv|json)/job$', views.export_entries_job, name='entry-export-job'),
+    url(r'^entries/search/$', views.EntrySearchView.as_view(), name='entry-search'),
+    url(r'^entries/import/$', views.EntryImportView.as_view(), name='entry-import'),
+    url(r'^running/$', views.RunningEntryListView.as_view(), name='entry-running'),
+    url(r'^running/live/$', views.RunningDashboardView.as_view(), name='running-live'),
+    url(r'^running/events$', views.running_events, name='running-events'),
+    url(r'^running/poll$', views.running_poll, name='running-poll'),
+    url(r'^sync$', views.sync, name='sync'),
+    url(r'^timers/batch$', views.timer_batch, name='timer-batch'),
+    url(r'^reports/daily/$', views.DailyReportView.as_view(), name='report-daily'),
+    url(r'^reports/timesheet/$', views.TimesheetView.as_view(), name='report-timesheet'),
+    url(r'^stats/$', views.stats, name='stats'),
+    url(r'^stats\.json$', views.stats_json, name='stats-json'),
+    url(r'^jobs/$', views.JobListView.as_view(), name='job-list'),
+    url(r'^jobs/(?P<pk>\d+)/$', views.JobDetailView.as_view(), name='job-detail'),
+    url(r'^jobs/(?P<pk>\d+)\.json$', views.job_status, name='job-status'),
+    url(r'^jobs/(?P<pk>\d+)/output$', views.job_output, name='job-output'),
+    url(r'^api/clients/$', api.ResourceListView.as_view(resource=api.CLIENTS), name='api-client-list'),
+    url(r'^api/clients/(?P<pk>\d+)/$', api.ResourceDetailView.as_view(resource=api.CLIENTS),
+        name='api-client-detail'),
+    url(r'^api/projects/$', api.ResourceListView.as_view(resource=api.PROJECTS), name='api-project-list'),
+    url(r'^api/projects/(?P<pk>\d+)/$', api.ResourceDetailView.as_view(resource=api.PROJECTS),
+        name='api-project-detail'),
+    url(r'^api/entries/$', api.ResourceListView.as_view(resource=api.ENTRIES), name='api-entry-list'),
+    url(r'^api/entries/(?P<pk>\d+)/$', api.ResourceDetailView.as_view(resource=api.ENTRIES),
+        name='api-entry-detail'),
     url(r'^projects/$', views.ProjectCreateView.as_view(), name='project-list'),
     url(r'^projects/(?P<pk>\d+)/$', views.ProjectUpdateView.as_view(), name='project-detail'),
 ]
@@ -1,13 +1,64 @@
+import codecs
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.urlresolvers import reverse, reverse_lazy
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Prefetch
+from django.db.models.query import prefetch_related_objects
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
 from django.views.generic import (
-    RedirectView, ListView, DetailView, CreateView, UpdateView)
+    RedirectView, ListView, DetailView, CreateView, UpdateView, FormView, TemplateView)
+
+from . import jobs, live
+from .auth import api_view
+from .caching import CachedListMixin, LIST_CACHE_TIMEOUT, get_version
+from .exporter import csv_lines, json_lines
+from .forms import (
+    EntryForm, EntryExportForm, EntryImportForm, EntryWindowForm, ProjectForm, ClientForm,
+    TimesheetForm, start_of_day)
+from .importer import EntryImporter
+from .metrics import METRIC_NAMES, PERCENTILES, registry
+from .models import Client, DailyRollup, Entry, Job, Project
+from .pagination import paginate_entries
+from .search import search_entries
+from .sync import MAX_PAGE_SIZE, PAGE_SIZE, changes
+from .timers import MAX_OPERATIONS, TimerBatch
+
+
+ENTRIES_PER_PAGE = 50
 
-from .forms import EntryForm, ProjectForm, ClientForm
-from .models import Client, Entry, Project
+
+def entry_list_context(request, per_page=ENTRIES_PER_PAGE):
+    """
+    Context for the keyset paginated, optionally date windowed entry list
+    shared by the entries view function and EntryCreateView
+    """
+    window_form = EntryWindowForm(request.GET)
+    entry_page = paginate_entries(
+        window_form.filter(Entry.objects.all()), request.GET, per_page,
+        params=window_form.params)
+    return {
+        'entry_list': entry_page,
+        'entry_page': entry_page,
+        'window_form': window_form,
+        # The entries page caches its list per cursor and window, see caching.py
+        'list_cache_version': get_version([Entry]),
+        'list_cache_timeout': LIST_CACHE_TIMEOUT,
+        'list_cache_params': entry_page.cache_key,
+    }
 
 
-class ClientCreateView(CreateView):
+class ClientCreateView(CachedListMixin, CreateView):
     """
     CBV version of above "clients" view function
 
@@ -25,6 +76,7 @@ class ClientCreateView(CreateView):
     # reverse('client-list'), reverse_lazy allows us to provide a url reversal
     # before the project's URLConf is loaded
     success_url = reverse_lazy('client-list')
+    list_cache_models = [Client]
 
     def get_context_data(self, **kwargs):
         context = super(ClientCreateView, self).get_context_data(**kwargs)
@@ -40,6 +92,21 @@ class ClientUpdateView(UpdateView):
     form_class = ClientForm
     template_name = 'client_detail.html'
     success_url = reverse_lazy('client-list')
+    # How many of each project's latest entries are listed on the page
+    recent_entry_limit = 5
+
+    def get_context_data(self, **kwargs):
+        context = super(ClientUpdateView, self).get_context_data(**kwargs)
+        # One query for the projects and their totals, one for the entries,
+        # which needs the project ids up front
+        projects = list(self.object.project_set.with_totals().order_by('name'))
+        prefetch_related_objects(projects, [
+            Prefetch('entry_set',
+                     queryset=Entry.objects.latest_per_project(
+                         [project.pk for project in projects], self.recent_entry_limit),
+                     to_attr='recent_entries')])
+        context['project_list'] = projects
+        return context
 
 
 def entries(request):
@@ -61,11 +128,9 @@ def entries(request):
     else:
         entry_form = EntryForm()
 
-    entry_list = Entry.objects.all()
-    return render(request, 'entries.html', {
-        'entry_list': entry_list,
-        'entry_form': entry_form,
-    })
+    context = entry_list_context(request)
+    context['entry_form'] = entry_form
+    return render(request, 'entries.html', context)
 
 
 class EntryCreateView(CreateView):
@@ -76,14 +141,360 @@ class EntryCreateView(CreateView):
     form_class = EntryForm
     success_url = reverse_lazy('entry-list')
     template_name = 'entries.html'
+    # Page size of the entry list under the form. Not paginate_by, which
+    # only a ListView uses
+    entries_per_page = ENTRIES_PER_PAGE
 
     def get_context_data(self, **kwargs):
         context = super(EntryCreateView, self).get_context_data(**kwargs)
-        context['entry_list'] = Entry.objects.all()
+        context.update(entry_list_context(self.request, self.entries_per_page))
+        return context
+
+
+class EntryImportView(FormView):
+    """
+    Upload a CSV file of entries and show how the import went. Files larger
+    than `background_size` bytes are imported by a background job instead,
+    and the upload redirects to its progress page
+    """
+    form_class = EntryImportForm
+    template_name = 'entry_import.html'
+    batch_size = 1000
+    background_size = 1024 * 1024
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        if upload.size > self.background_size:
+            name = 'import-{}.csv'.format(uuid.uuid4().hex)
+            with open(jobs.file_path(name), 'wb') as f:
+                for chunk in upload.chunks():
+                    f.write(chunk)
+            # A failed import may have saved some batches, retrying would
+            # import them twice
+            job = jobs.enqueue(
+                'import_entries', max_attempts=1, path=name, batch_size=self.batch_size,
+                create_missing=form.cleaned_data['create_missing'])
+            return redirect('job-detail', pk=job.pk)
+        importer = EntryImporter(
+            batch_size=self.batch_size, create_missing=form.cleaned_data['create_missing'])
+        result = importer.run(codecs.iterdecode(form.cleaned_data['file'], 'utf-8'))
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'json': (json_lines, 'application/x-ndjson'),
+}
+
+
+def export_entries(request, format):
+    """
+    Stream all entries matching the ?from=&to=&client=&project= filters as a
+    CSV or newline delimited JSON download without loading them into memory.
+    ?archived=on adds the archived entries
+    """
+    form = EntryExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain')
+    lines, content_type = EXPORT_FORMATS[format]
+    response = StreamingHttpResponse(lines(*form.entry_querysets()), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="entries.{}"'.format(format)
+    return response
+
+
+@require_POST
+def export_entries_job(request, format):
+    """
+    Queue a job writing the same export as export_entries to a file, for
+    exports too large to wait for. Redirects to the job's page
+    """
+    form = EntryExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain')
+    job = jobs.enqueue('export_entries', format=format, filters=request.GET.dict())
+    return redirect('job-detail', pk=job.pk)
+
+
+@api_view
+@require_POST
+def timer_batch(request):
+    """
+    Start and stop timers in bulk: takes {"operations": [...]} as JSON and
+    answers {"results": [...]}, one result per operation. See TimerBatch.
+    Clients authenticate with an API key, see auth.py
+    """
+    try:
+        operations = json.loads(request.body.decode('utf-8'))['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with a list of "operations"'}, status=400)
+    if not isinstance(operations, list):
+        return JsonResponse({'error': '"operations" must be a list'}, status=400)
+    if len(operations) > MAX_OPERATIONS:
+        return JsonResponse(
+            {'error': 'At most {} operations per request'.format(MAX_OPERATIONS)}, status=400)
+    return JsonResponse({'results': TimerBatch(operations).run()})
+
+
+def sync(request):
+    """
+    The clients, projects and entries changed or deleted since ?cursor=, at
+    most ?limit= rows, as JSON. See sync.changes()
+    """
+    try:
+        limit = min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('The limit must be positive')
+        page = changes(request.GET.get('cursor'), limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
+
+
+class EntrySearchView(TemplateView):
+    """
+    Full text search over entry descriptions, best matches first
+    """
+    template_name = 'entry_search.html'
+    result_limit = 50
+
+    def get_context_data(self, **kwargs):
+        context = super(EntrySearchView, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+        context['entry_list'] = search_entries(query, limit=self.result_limit) if query else []
+        return context
+
+
+class RunningEntryListView(ListView):
+    """
+    Entries whose timer is still running, oldest first
+    """
+    template_name = 'running.html'
+    context_object_name = 'entry_list'
+
+    def get_queryset(self):
+        return Entry.objects.running().select_related('project__client').order_by('start')
+
+
+class RunningDashboardView(TemplateView):
+    """
+    The running timers, updated live from running_events, or running_poll
+    in browsers without EventSource
+    """
+    template_name = 'running_live.html'
+
+
+def running_events(request):
+    """
+    Stream the running timers as server-sent events, a "timers" event with
+    the whole list whenever it changes. The event id is the version, which
+    the browser sends back as Last-Event-ID when it reconnects
+    """
+    def events(version):
+        deadline = time.time() + live.STREAM_SECONDS
+        while time.time() < deadline:
+            current, timers = live.running_timers.snapshot()
+            if current != version:
+                version = current
+                yield 'id: {}\nevent: timers\ndata: {}\n\n'.format(version, json.dumps(timers))
+            elif live.running_timers.wait(version, live.KEEPALIVE_SECONDS) == version:
+                yield ': keepalive\n\n'
+
+    response = StreamingHttpResponse(
+        events(request.META.get('HTTP_LAST_EVENT_ID')), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def running_poll(request):
+    """
+    Long-poll fallback of running_events: answers as soon as the version
+    differs from ?version=, or after live.POLL_SECONDS with the same one
+    """
+    version = request.GET.get('version')
+    if version == live.running_timers.version:
+        live.running_timers.wait(version, live.POLL_SECONDS)
+    version, timers = live.running_timers.snapshot()
+    return JsonResponse({'version': version, 'timers': timers})
+
+
+class DailyReportView(ListView):
+    """
+    Hours per client per day, read from the pre-aggregated daily rollups.
+    Accepts the same ?from=&to= window as the entry list and an optional
+    ?client=<pk>. Without a window it shows the last `default_days` days
+    """
+    template_name = 'report_daily.html'
+    context_object_name = 'row_list'
+    paginate_by = 100
+    default_days = 30
+
+    def get_queryset(self):
+        data = self.request.GET.copy()
+        if not data.get('from') and not data.get('to'):
+            today = timezone.localtime(timezone.now()).date()
+            data['from'] = (today - timedelta(days=self.default_days - 1)).isoformat()
+        self.window_form = EntryWindowForm(data)
+        self.page_params = dict(self.window_form.params)
+        rollups = self.window_form.filter_days(DailyRollup.objects.all())
+        client = self.request.GET.get('client')
+        if client and client.isdigit():
+            rollups = rollups.filter(project__client=client)
+            self.page_params['client'] = client
+        return rollups.per_client()
+
+    def get_context_data(self, **kwargs):
+        context = super(DailyReportView, self).get_context_data(**kwargs)
+        context['window_form'] = self.window_form
+        # The window and client carried over into the page links
+        context['page_querystring'] = urlencode(self.page_params)
         return context
 
 
-class ProjectCreateView(CreateView):
+class TimesheetView(TemplateView):
+    """
+    Hours per project and day of one week, for all clients or ?client=<pk>.
+    The whole grid comes from one grouped aggregate query over the stored
+    entry durations, see EntryQuerySet.hours_per_period(), plus one for the
+    archive with ?archived=on. Entries count on the day they started
+    """
+    template_name = 'timesheet.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(TimesheetView, self).get_context_data(**kwargs)
+        form = TimesheetForm(self.request.GET)
+        week_start = form.week_start()
+        days = [week_start + timedelta(days=i) for i in range(7)]
+        bounds = [start_of_day(day) for day in days] + [start_of_day(week_start + timedelta(days=7))]
+
+        rows = OrderedDict()
+        day_totals = [0.0] * len(days)
+        for queryset in form.entry_querysets():
+            for values in queryset.hours_per_period(bounds):
+                hours = [values['hours_{}'.format(i)] or 0.0 for i in range(len(days))]
+                day_totals = [total + value for total, value in zip(day_totals, hours)]
+                row = rows.get(values['project'])
+                if row is None:
+                    rows[values['project']] = dict(values, hours=hours)
+                else:
+                    row['hours'] = [total + value for total, value in zip(row['hours'], hours)]
+                    row['total_hours'] += values['total_hours']
+        rows = sorted(rows.values(), key=lambda row: (
+            row['project__client__name'] or '', row['project__name'], row['project']))
+
+        params = {}
+        if form.is_valid() and form.cleaned_data['client']:
+            params['client'] = form.cleaned_data['client'].pk
+        if form.is_valid() and form.cleaned_data['archived']:
+            params['archived'] = 'on'
+        context.update({
+            'form': form,
+            'days': days,
+            'row_list': rows,
+            'day_totals': day_totals,
+            'total_hours': sum(day_totals),
+            'previous_querystring': urlencode(dict(params, week=days[0] - timedelta(days=7))),
+            'next_querystring': urlencode(dict(params, week=days[0] + timedelta(days=7))),
+        })
+        return context
+
+
+@staff_member_required
+def stats(request):
+    """
+    Percentiles of the request metrics of this process per URL name, times
+    in milliseconds
+    """
+    rows = []
+    for name, summary in sorted(registry.snapshot().items()):
+        cells = []
+        for metric in METRIC_NAMES:
+            scale = 1 if metric == 'queries' else 1000
+            cells.extend(
+                summary[metric]['p{}'.format(percent)] * scale for percent in PERCENTILES)
+        rows.append({'name': name, 'count': summary['count'], 'cells': cells})
+    return render(request, 'stats.html', {
+        'row_list': rows,
+        'metric_names': METRIC_NAMES,
+        'percentiles': PERCENTILES,
+        'started': datetime.fromtimestamp(registry.started, timezone.utc),
+    })
+
+
+@staff_member_required
+def stats_json(request):
+    """
+    The request metrics of this process as JSON, times in seconds
+    """
+    return JsonResponse({'started': registry.started, 'views': registry.snapshot()})
+
+
+class JobListView(ListView):
+    """
+    The most recent background jobs
+    """
+    model = Job
+    template_name = 'jobs.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        # The progress pages read the primary, which the workers write to: a
+        # replica would show a job as queued until it catches up
+        return Job.objects.using(DEFAULT_DB_ALIAS).order_by('-created', '-id')
+
+
+class JobDetailView(DetailView):
+    """
+    Progress and outcome of a background job. The page reloads itself until
+    the job is finished
+    """
+    queryset = Job.objects.using(DEFAULT_DB_ALIAS)
+    template_name = 'job_detail.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(JobDetailView, self).get_context_data(**kwargs)
+        context['result'] = json.loads(self.object.result or '{}')
+        return context
+
+
+def job_status(request, pk):
+    """
+    The progress of a background job as JSON, for polling
+    """
+    job = get_object_or_404(Job.objects.using(DEFAULT_DB_ALIAS), pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'done': job.done,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message,
+        'result': json.loads(job.result or 'null'),
+        'output': reverse('job-output', kwargs={'pk': job.pk}) if job.output else None,
+    })
+
+
+def job_output(request, pk):
+    """
+    Download the file a finished job wrote
+    """
+    job = get_object_or_404(Job.objects.using(DEFAULT_DB_ALIAS), pk=pk, status=Job.SUCCEEDED)
+    if not job.output:
+        raise Http404('The job has no output')
+    path = jobs.file_path(job.output)
+    if not os.path.exists(path):
+        raise Http404('The output of the job was deleted')
+    content_type = 'text/csv' if job.output.endswith('.csv') else 'application/x-ndjson'
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(job.output)
+    return response
+
+
+class ProjectCreateView(CachedListMixin, CreateView):
     """
     CBV version of above "projects" view function
     """
@@ -91,10 +502,12 @@ class ProjectCreateView(CreateView):
     form_class = ProjectForm
     success_url = reverse_lazy('project-list')
     template_name = 'projects.html'
+    # The list shows client names too
+    list_cache_models = [Project, Client]
 
     def get_context_data(self, **kwargs):
         context = super(ProjectCreateView, self).get_context_data(**kwargs)
-        context['project_list'] = Project.objects.all()
+        context['project_list'] = Project.objects.select_related('client')
         return context
 
 
@@ -0,0 +1,70 @@
+"""
+Do the one-off work of a fresh worker before it serves its first request,
+see WARM_UP_ON_START in wsgi.py and the startup_profile command
+"""
+import os
+import time
+
+from django.apps import apps
+from django.core.urlresolvers import get_resolver
+from django.db import connections
+from django.template.loader import get_template
+
+
+def warm_urls():
+    """
+    Import every view and compile the URL patterns, which the first
+    resolve() or reverse() would do otherwise
+    """
+    resolver = get_resolver(None)
+    resolver.reverse_dict
+    resolver.resolve('/')
+
+
+def template_names(app_label='entries'):
+    directory = os.path.join(apps.get_app_config(app_label).path, 'templates')
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith('.html'):
+                yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+
+
+def warm_templates():
+    """
+    Load and compile the app's templates, base.html and the snippets
+    included. Only the cached template loader keeps the result, see
+    settings_production.py, otherwise this just loads the template tags
+    """
+    for name in template_names():
+        get_template(name)
+
+
+def warm_database():
+    """
+    Connect and run a first query per model, which sets up the ORM's
+    caches of related fields and the SQL compiler
+    """
+    for model in apps.get_app_config('entries').get_models():
+        model.objects.order_by().values_list('pk', flat=True).first()
+    # A server that forks workers after loading the application must not
+    # hand this connection to all of them
+    connections.close_all()
+
+
+STEPS = (
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('database', warm_database),
+)
+
+
+def warm_up():
+    """
+    Run every step and return [(step, seconds)]
+    """
+    timings = []
+    for name, step in STEPS:
+        started = time.time()
+        step()
+        timings.append((name, time.time() - started))
+    return timings
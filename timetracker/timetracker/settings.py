@@ -42,6 +42,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'entries.middleware.RequestMetricsMiddleware',
+    'entries.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,6 +54,9 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.security.SecurityMiddleware',
 )
 
+# Fraction of requests RequestMetricsMiddleware measures, see /stats/
+METRICS_SAMPLE_RATE = 1.0
+
 ROOT_URLCONF = 'timetracker.urls'
 
 TEMPLATES = [
@@ -72,6 +77,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'timetracker.wsgi.application'
 
+# Run entries.warmup.warm_up() when the WSGI application is loaded, see
+# wsgi.py
+WARM_UP_ON_START = False
+
 
 # Database
 # https://docs.djangoproject.com/en/1.8/ref/settings/#databases
@@ -83,6 +92,55 @@ DATABASES = {
     }
 }
 
+# Read replicas, see entries/routers.py. To try them locally point the
+# REPLICA_DATABASE environment variable at a second SQLite file and copy the
+# primary into it with `manage.py sync_replica`
+if os.environ.get('REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['REPLICA_DATABASE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['entries.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it wrote
+REPLICA_PIN_SECONDS = 15
+
+
+# Background jobs, see entries/jobs.py
+
+# Uploads waiting to be imported and finished exports
+JOB_FILES_DIR = os.path.join(BASE_DIR, 'jobs')
+
+# Seconds before the first retry of a failed job, doubled for every retry
+JOB_RETRY_DELAY = 30
+
+
+# Keys integrations send as "Authorization: Token <key>" to write through the
+# JSON endpoints without a CSRF token, see entries/auth.py
+API_KEYS = []
+
+
+# Incremental sync, see entries/sync.py
+
+# Changes younger than this many seconds wait for the next sync, so a
+# transaction still in flight can't commit behind a client's cursor
+SYNC_SETTLE_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'timetracker',
+    }
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -102,3 +160,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.8/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Where collectstatic puts the files, served by StaticFilesMiddleware in the
+# production profile
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
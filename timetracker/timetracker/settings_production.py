@@ -0,0 +1,64 @@
+"""
+Opt-in production profile on top of settings.py. Enable it with
+
+    DJANGO_SETTINGS_MODULE=timetracker.settings_production
+
+It keeps database connections open between requests, tunes SQLite for
+concurrent requests, see benchmarks/concurrent_writes.py, readies each
+worker at boot, see the startup_profile command, and serves the static files
+under hashed names. Run
+
+    python manage.py collectstatic
+
+before starting it, the pages can't be rendered without the manifest of the
+hashed names
+"""
+from .settings import *  # NOQA
+
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost').split(',')
+
+API_KEYS = [key for key in os.environ.get('API_KEYS', '').split(',') if key]
+
+# Reuse a connection for up to ten minutes instead of opening one per request
+DATABASES = dict(
+    (alias, dict(database, CONN_MAX_AGE=600)) for alias, database in DATABASES.items())
+
+# Keep compiled templates in memory instead of reading and parsing the files
+# on every render. The cached loader can't be combined with APP_DIRS
+TEMPLATES = [
+    dict(template, APP_DIRS=False, OPTIONS=dict(template['OPTIONS'], loaders=[
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]))
+    for template in TEMPLATES
+]
+
+WARM_UP_ON_START = True
+
+# Collect the static files under names with a hash of their content and
+# gzipped copies, see entries/storage.py
+STATICFILES_STORAGE = 'entries.storage.GzipManifestStaticFilesStorage'
+
+MIDDLEWARE_CLASSES = ('entries.middleware.StaticFilesMiddleware',) + MIDDLEWARE_CLASSES
+
+# Run by entries.signals.configure_sqlite on every new connection
+SQLITE_PRAGMAS = [
+    # Readers don't block the writer and the writer doesn't block readers.
+    # Stored in the database file, so this sticks after the first connection
+    ('journal_mode', 'WAL'),
+    # In WAL mode NORMAL only syncs at checkpoints: a power cut can lose the
+    # last commits but never corrupts the database
+    ('synchronous', 'NORMAL'),
+    # Wait up to 20 seconds for another writer instead of failing straight
+    # away with "database is locked"
+    ('busy_timeout', 20000),
+    # Negative means KiB: a 64 MB page cache per connection
+    ('cache_size', -64000),
+    # Read the first 256 MB of the file through memory mapping
+    ('mmap_size', 256 * 1024 * 1024),
+]
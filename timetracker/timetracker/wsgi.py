@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "timetracker.settings")
 
 application = get_wsgi_application()
+
+# Opt-in: pay for URL, template and ORM setup at boot instead of on the
+# first requests
+if settings.WARM_UP_ON_START:
+    from entries.warmup import warm_up
+    warm_up()